@@ -1,14 +1,154 @@
-from typing import Literal, Dict, Any
+from pathlib import Path
+from typing import Literal, Dict, Any, List, Optional, Sequence
 import json
 import re
+import threading
 
 import openai
 
 from config.settings import settings
 from app.logs.logger import logger
+from app.tokens import estimate_tokens
+from app.llm import Messages, chat_completion, chat_completion_async, create_chat_completion
+from .feedback_agent import TICKET_PLACEHOLDER
+from .local_classifier import LocalClassifier, TICKET_RE
 
 Category = Literal["positive_feedback", "negative_feedback", "query"]
 
+_CATEGORIES = ("positive_feedback", "negative_feedback", "query")
+_SENTIMENTS = ("positive", "neutral", "negative")
+
+_CLASSIFICATION_RULES = (
+    "Rules:\n"
+    "- If the user is mainly THANKING, praising or appreciating service, "
+    'category = \"positive_feedback\".\n'
+    "- If the user is mainly COMPLAINING, unhappy, or describing a problem, "
+    'category = \"negative_feedback\".\n'
+    "- If the user is ASKING about the status of a ticket, requesting help, "
+    'or asking a question, category = \"query\".\n'
+    "- If there is a ticket number like 'ticket 650932' or '#650932', "
+    'extract it as a 6-digit string in \"ticket_number\".\n'
+)
+
+# Completion tokens budgeted per message in a classify_many batch.
+_TOKENS_PER_RESULT = 40
+
+# How messages were classified, for monitoring the LLM bypass rate.
+_classification_counts: Dict[str, int] = {"local": 0, "llm": 0, "fallback": 0}
+_counts_lock = threading.Lock()
+
+
+def _count(source: str) -> None:
+    with _counts_lock:
+        _classification_counts[source] += 1
+
+
+def get_classifier_stats() -> Dict[str, float]:
+    """Counts per classification path and the share that skipped the LLM."""
+    with _counts_lock:
+        stats: Dict[str, float] = dict(_classification_counts)
+    total = sum(stats.values())
+    stats["bypass_rate"] = stats["local"] / total if total else 0.0
+    return stats
+
+
+def _sanitize(parsed: Any) -> Optional[Dict[str, Any]]:
+    """Validate one LLM classification; None if it is not usable."""
+    if not isinstance(parsed, dict):
+        return None
+    category = parsed.get("category", "query")
+    sentiment = parsed.get("sentiment", "neutral")
+    if category not in _CATEGORIES or sentiment not in _SENTIMENTS:
+        return None
+
+    ticket_number = parsed.get("ticket_number", None)
+    if ticket_number is not None:
+        m = re.fullmatch(r"\d{6}", str(ticket_number))
+        ticket_number = m.group(0) if m else None
+
+    return {"category": category, "sentiment": sentiment, "ticket_number": ticket_number}
+
+
+def _keyword_fallback(message: str) -> Dict[str, Any]:
+    """Keyword classification used when the LLM is unavailable or unparsable."""
+    result: Dict[str, Any] = {"category": "query", "sentiment": "neutral", "ticket_number": None}
+    lower_msg = message.lower()
+    if any(k in lower_msg for k in ["thank", "great", "good job", "appreciate"]):
+        result["category"] = "positive_feedback"
+        result["sentiment"] = "positive"
+    elif any(
+        k in lower_msg
+        for k in ["not happy", "bad", "terrible", "issue", "problem", "complain"]
+    ):
+        result["category"] = "negative_feedback"
+        result["sentiment"] = "negative"
+
+    m = TICKET_RE.search(message)
+    if m:
+        result["ticket_number"] = m.group(1)
+    return result
+
+
+def _classify_messages(message: str) -> Messages:
+    system_prompt = (
+        "You are a classifier for banking customer support messages.\n"
+        "You MUST respond with a strict JSON object with keys:\n"
+        '  - \"category\": one of [\"positive_feedback\", \"negative_feedback\", \"query\"]\n'
+        '  - \"sentiment\": one of [\"positive\", \"neutral\", \"negative\"]\n'
+        '  - \"ticket_number\": a 6-digit string if present in the message, '
+        "otherwise null.\n\n"
+        f"{_CLASSIFICATION_RULES}"
+        "- Do NOT include any other fields.\n"
+    )
+
+    user_prompt = (
+        "Classify the following customer message.\n\n"
+        f"Message:\n{message}\n\n"
+        "Return ONLY the JSON object."
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _classify_and_respond_messages(message: str, customer_name: Optional[str]) -> Messages:
+    system_prompt = (
+        "You are a classifier and support agent for banking customer support messages.\n"
+        "You MUST respond with a strict JSON object with keys:\n"
+        '  - \"category\": one of [\"positive_feedback\", \"negative_feedback\", \"query\"]\n'
+        '  - \"sentiment\": one of [\"positive\", \"neutral\", \"negative\"]\n'
+        '  - \"ticket_number\": a 6-digit string if present in the message, '
+        "otherwise null.\n"
+        '  - \"reply\": the reply to send the customer, or null (see below).\n\n'
+        f"{_CLASSIFICATION_RULES}"
+        "Reply:\n"
+        "- positive_feedback: thank the customer in ONE or TWO friendly, "
+        "professional sentences.\n"
+        "- negative_feedback: in about 2-3 sentences, professional but warm, "
+        "apologize with empathy and reassure them the issue is being investigated. "
+        f"A new ticket has been opened; write its number exactly as '#{TICKET_PLACEHOLDER}'.\n"
+        "- query: reply must be null.\n"
+        "- If a customer name is provided, address them by name.\n"
+        "- Do NOT include any other fields.\n"
+    )
+
+    name_part = f"Customer name: {customer_name}" if customer_name else "Customer name: (not provided)"
+    user_prompt = (
+        f"{name_part}\n\n"
+        "Classify and, for feedback, reply to the following customer message.\n\n"
+        f"Message:\n{message}\n\n"
+        "Return ONLY the JSON object."
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _is_context_length_error(err: Exception) -> bool:
+    return isinstance(err, openai.error.InvalidRequestError) and "context" in str(err).lower()
+
 
 class ClassifierAgent:
     """
@@ -18,102 +158,294 @@ class ClassifierAgent:
     - query
     and optionally extracting a ticket_number.
 
-    Uses OpenAI's chat completion with JSON-style output for robust classification.
+    A local rule/n-gram classifier runs first (see app.agents.local_classifier);
+    only messages it is not confident about go to OpenAI's chat completion with
+    JSON-style output.
     """
 
     def __init__(self) -> None:
-        openai.api_key = settings.openai_api_key
         self.model = settings.openai_model
+        self.local = (
+            LocalClassifier.load(Path(settings.classifier_model_path))
+            if settings.classifier_local_enabled
+            else None
+        )
+
+    def pre_classify(self, message: str) -> Dict[str, Any]:
+        """
+        Local result with source="local" when it is confident enough to use;
+        otherwise the default result for the LLM path to fill in. Callers that
+        need to know the path up front pass it on as `pre` to the classify methods.
+        """
+        local = self.local.classify(message) if self.local is not None else None
+        if local is not None and local["confidence"] >= settings.classifier_local_threshold:
+            logger.info(
+                f"Local classifier ({local['source']}) confident at "
+                f"{local['confidence']:.2f}; skipping LLM"
+            )
+            _count("local")
+            return {**local, "source": "local"}
+        return {
+            "category": "query",
+            "sentiment": "neutral",
+            "ticket_number": None,
+            "confidence": local["confidence"] if local is not None else None,
+            "source": "llm",
+        }
 
-    def classify(self, message: str) -> Dict[str, Any]:
+    def _apply_llm_output(
+        self, result: Dict[str, Any], content: str, with_reply: bool = False
+    ) -> None:
+        logger.debug(f"Raw classifier LLM content: {content}")
+        raw = json.loads(content)
+        parsed = _sanitize(raw)
+        if parsed is None:
+            raise ValueError(f"Invalid classifier output: {content}")
+        result.update(parsed)
+        if with_reply:
+            reply = raw.get("reply")
+            if parsed["category"] != "query" and isinstance(reply, str) and reply.strip():
+                result["draft_reply"] = reply.strip()
+        _count("llm")
+
+    def _apply_fallback(self, result: Dict[str, Any], message: str) -> None:
+        logger.exception("Error calling OpenAI in ClassifierAgent; using fallback.")
+        _count("fallback")
+        result.update(_keyword_fallback(message))
+        result["source"] = "fallback"
+
+    def classify(self, message: str, pre: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Return a dict like:
         {
           "category": "positive_feedback" | "negative_feedback" | "query",
           "sentiment": "positive" | "neutral" | "negative",
-          "ticket_number": "650932" | None
+          "ticket_number": "650932" | None,
+          "confidence": float | None,  # local classifier confidence
+          "source": "local" | "llm" | "fallback"
         }
         """
         logger.info("ClassifierAgent.classify called")
 
-        result: Dict[str, Any] = {
-            "category": "query",
-            "sentiment": "neutral",
-            "ticket_number": None,
-        }
+        result = dict(pre) if pre is not None else self.pre_classify(message)
+        if result["source"] == "local":
+            return result
+
+        try:
+            content = chat_completion(
+                "classifier", self.model, _classify_messages(message), temperature=0.0
+            )
+            self._apply_llm_output(result, content)
+        except Exception:
+            self._apply_fallback(result, message)
+
+        logger.debug(f"ClassifierAgent result: {result}")
+        return result
+
+    async def classify_async(
+        self, message: str, pre: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Async `classify`; the LLM call does not block the event loop."""
+        logger.info("ClassifierAgent.classify_async called")
 
+        result = dict(pre) if pre is not None else self.pre_classify(message)
+        if result["source"] == "local":
+            return result
+
+        try:
+            content = await chat_completion_async(
+                "classifier", self.model, _classify_messages(message), temperature=0.0
+            )
+            self._apply_llm_output(result, content)
+        except Exception:
+            self._apply_fallback(result, message)
+
+        logger.debug(f"ClassifierAgent result: {result}")
+        return result
+
+    def classify_and_respond(
+        self,
+        message: str,
+        customer_name: Optional[str] = None,
+        pre: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Like `classify`, plus a "draft_reply" for feedback messages, in one call.
+
+        The draft for negative feedback contains TICKET_PLACEHOLDER, which
+        FeedbackAgent replaces once the ticket exists. "draft_reply" is None for
+        queries (they need DB or RAG data first), for locally classified
+        messages and when the LLM call fails; callers then use the normal flows.
+        """
+        logger.info("ClassifierAgent.classify_and_respond called")
+
+        result = {**(pre or self.pre_classify(message)), "draft_reply": None}
+        if result["source"] == "local":
+            return result
+
+        try:
+            content = chat_completion(
+                "classifier",
+                self.model,
+                _classify_and_respond_messages(message, customer_name),
+                temperature=0.2,
+            )
+            self._apply_llm_output(result, content, with_reply=True)
+        except Exception:
+            self._apply_fallback(result, message)
+
+        logger.debug(f"ClassifierAgent classify-and-respond result: {result}")
+        return result
+
+    async def classify_and_respond_async(
+        self,
+        message: str,
+        customer_name: Optional[str] = None,
+        pre: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Async `classify_and_respond`."""
+        logger.info("ClassifierAgent.classify_and_respond_async called")
+
+        result = {**(pre or self.pre_classify(message)), "draft_reply": None}
+        if result["source"] == "local":
+            return result
+
+        try:
+            content = await chat_completion_async(
+                "classifier",
+                self.model,
+                _classify_and_respond_messages(message, customer_name),
+                temperature=0.2,
+            )
+            self._apply_llm_output(result, content, with_reply=True)
+        except Exception:
+            self._apply_fallback(result, message)
+
+        logger.debug(f"ClassifierAgent classify-and-respond result: {result}")
+        return result
+
+    def classify_many(self, messages: Sequence[str]) -> List[Dict[str, Any]]:
+        """
+        Classify many messages with as few LLM calls as possible.
+
+        Returns one dict per message, in order, shaped like `classify`. Messages
+        the local classifier is confident about skip the LLM; the rest are packed
+        into prompts of up to `classifier_batch_size` messages and
+        `classifier_batch_tokens` estimated tokens, each answered with a JSON
+        array. Items missing from or invalid in the reply use the keyword
+        fallback; a batch that overflows the context is split in half and retried.
+        """
+        logger.info(f"ClassifierAgent.classify_many called with {len(messages)} messages")
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        confidences: List[Optional[float]] = [None] * len(messages)
+        pending: List[int] = []
+
+        for i, message in enumerate(messages):
+            start = self.pre_classify(message)
+            if start["source"] == "local":
+                results[i] = start
+                continue
+            confidences[i] = start["confidence"]
+            pending.append(i)
+
+        for batch in self._pack_batches(messages, pending):
+            for i, parsed in self._classify_batch(messages, batch).items():
+                results[i] = {**parsed, "confidence": confidences[i]}
+
+        return [r for r in results if r is not None]
+
+    def _pack_batches(self, messages: Sequence[str], indexes: List[int]) -> List[List[int]]:
+        batches: List[List[int]] = []
+        batch: List[int] = []
+        tokens = 0
+        for i in indexes:
+            cost = estimate_tokens(messages[i]) + _TOKENS_PER_RESULT
+            if batch and (
+                len(batch) >= settings.classifier_batch_size
+                or tokens + cost > settings.classifier_batch_tokens
+            ):
+                batches.append(batch)
+                batch, tokens = [], 0
+            batch.append(i)
+            tokens += cost
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _classify_batch(
+        self, messages: Sequence[str], batch: List[int]
+    ) -> Dict[int, Dict[str, Any]]:
+        """Classify `batch` (indexes into messages) in one call; {index: result}."""
         system_prompt = (
             "You are a classifier for banking customer support messages.\n"
-            "You MUST respond with a strict JSON object with keys:\n"
+            "You will receive a JSON array of messages, each with an \"id\" and "
+            "\"text\".\n"
+            "You MUST respond with a strict JSON array containing one object per "
+            "message, with keys:\n"
+            '  - \"id\": the id of the message\n'
             '  - \"category\": one of [\"positive_feedback\", \"negative_feedback\", \"query\"]\n'
             '  - \"sentiment\": one of [\"positive\", \"neutral\", \"negative\"]\n'
             '  - \"ticket_number\": a 6-digit string if present in the message, '
             "otherwise null.\n\n"
-            "Rules:\n"
-            "- If the user is mainly THANKING, praising or appreciating service, "
-            'category = \"positive_feedback\".\n'
-            "- If the user is mainly COMPLAINING, unhappy, or describing a problem, "
-            'category = \"negative_feedback\".\n'
-            "- If the user is ASKING about the status of a ticket, requesting help, "
-            'or asking a question, category = \"query\".\n'
-            "- If there is a ticket number like 'ticket 650932' or '#650932', "
-            'extract it as a 6-digit string in \"ticket_number\".\n'
-            "- Do NOT include any other fields.\n"
+            f"{_CLASSIFICATION_RULES}"
+            "- Classify each message independently.\n"
         )
-
+        payload = [{"id": n, "text": messages[i]} for n, i in enumerate(batch)]
         user_prompt = (
-            "Classify the following customer message.\n\n"
-            f"Message:\n{message}\n\n"
-            "Return ONLY the JSON object."
+            "Classify the following customer messages.\n\n"
+            f"{json.dumps(payload, ensure_ascii=False)}\n\n"
+            "Return ONLY the JSON array."
         )
 
+        parsed_by_id: Dict[int, Dict[str, Any]] = {}
         try:
-            completion = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
+            completion = create_chat_completion(
+                "classifier",
+                self.model,
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt},
                 ],
                 temperature=0.0,
+                max_tokens=_TOKENS_PER_RESULT * len(batch) + 50,
             )
+            choice = completion.choices[0]
+            if choice.get("finish_reason") == "length" and len(batch) > 1:
+                logger.warning(f"Classifier batch of {len(batch)} truncated; splitting")
+                return self._split_batch(messages, batch)
 
-            content = completion.choices[0].message["content"]
-            logger.debug(f"Raw classifier LLM content: {content}")
-
-            parsed = json.loads(content)
-
-            category = parsed.get("category", "query")
-            sentiment = parsed.get("sentiment", "neutral")
-            ticket_number = parsed.get("ticket_number", None)
-
-            if ticket_number is not None:
-                m = re.fullmatch(r"\d{6}", str(ticket_number))
-                ticket_number = m.group(0) if m else None
+            items = json.loads(choice.message["content"])
+            if not isinstance(items, list):
+                raise ValueError("Classifier batch output is not a JSON array")
+            for item in items:
+                parsed = _sanitize(item)
+                item_id = item.get("id") if isinstance(item, dict) else None
+                if parsed is not None and isinstance(item_id, int) and 0 <= item_id < len(batch):
+                    parsed_by_id[item_id] = parsed
 
-            result["category"] = category
-            result["sentiment"] = sentiment
-            result["ticket_number"] = ticket_number
+        except Exception as err:
+            if _is_context_length_error(err) and len(batch) > 1:
+                logger.warning(f"Classifier batch of {len(batch)} too long; splitting")
+                return self._split_batch(messages, batch)
+            logger.exception("Error classifying batch in ClassifierAgent; using fallback.")
 
-        except Exception:
-            logger.exception("Error calling OpenAI in ClassifierAgent; using fallback.")
-
-            lower_msg = message.lower()
-            if any(k in lower_msg for k in ["thank", "great", "good job", "appreciate"]):
-                result["category"] = "positive_feedback"
-                result["sentiment"] = "positive"
-            elif any(
-                k in lower_msg
-                for k in ["not happy", "bad", "terrible", "issue", "problem", "complain"]
-            ):
-                result["category"] = "negative_feedback"
-                result["sentiment"] = "negative"
+        results: Dict[int, Dict[str, Any]] = {}
+        for n, i in enumerate(batch):
+            if n in parsed_by_id:
+                _count("llm")
+                results[i] = {**parsed_by_id[n], "source": "llm"}
             else:
-                result["category"] = "query"
-                result["sentiment"] = "neutral"
-
-            m = re.search(r"(?:ticket\s*#?\s*|#)(\d{6})", message)
-            if m:
-                result["ticket_number"] = m.group(1)
+                _count("fallback")
+                results[i] = {**_keyword_fallback(messages[i]), "source": "fallback"}
+        missing = len(batch) - len(parsed_by_id)
+        if missing:
+            logger.warning(f"{missing} of {len(batch)} batch items used the keyword fallback")
+        return results
 
-        logger.debug(f"ClassifierAgent result: {result}")
-        return result
+    def _split_batch(
+        self, messages: Sequence[str], batch: List[int]
+    ) -> Dict[int, Dict[str, Any]]:
+        mid = len(batch) // 2
+        results = self._classify_batch(messages, batch[:mid])
+        results.update(self._classify_batch(messages, batch[mid:]))
+        return results
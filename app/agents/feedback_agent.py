@@ -1,11 +1,90 @@
-from typing import Optional, Tuple
+from typing import Generator, Iterator, List, Optional, Tuple
+import asyncio
 import random
 
-import openai
-
 from config.settings import settings
 from app.db.dao import create_ticket
 from app.logs.logger import logger
+from app.llm import Messages, chat_completion, chat_completion_async, stream_reply
+from .templates import templated_reply
+
+# Stands in for the ticket number in replies drafted before the ticket exists.
+TICKET_PLACEHOLDER = "[TICKET_NUMBER]"
+
+
+def _positive_messages(message: str, customer_name: Optional[str]) -> Messages:
+    system_prompt = (
+        "You are a polite and concise banking customer support agent.\n"
+        "Your goal is to acknowledge and thank the customer for their positive feedback.\n"
+        "Respond in ONE or TWO sentences, friendly and professional.\n"
+        "If a customer name is provided, address them by name.\n"
+    )
+
+    name_part = f"Customer name: {customer_name}" if customer_name else "Customer name: (not provided)"
+    user_prompt = (
+        f"{name_part}\n\n"
+        "The customer left this positive feedback:\n"
+        f"\"{message}\"\n\n"
+        "Write a brief response."
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _positive_fallback(customer_name: Optional[str]) -> str:
+    if customer_name:
+        return (
+            f"Thank you for your kind words, {customer_name}! "
+            "We’re delighted to assist you."
+        )
+    return "Thank you for your kind words! We’re delighted to assist you."
+
+
+def _negative_messages(
+    message: str, customer_name: Optional[str], ticket_number: str
+) -> Messages:
+    system_prompt = (
+        "You are a banking customer support agent.\n"
+        "The customer is unhappy or reporting an issue.\n"
+        "You must respond with empathy, apologize for the inconvenience, "
+        "and reassure them that their issue is being investigated.\n"
+        "Include the ticket number in the reply as '#<ticket_number>'.\n"
+        "Respond in about 2–3 sentences, professional but warm.\n"
+    )
+
+    name_part = f"Customer name: {customer_name}" if customer_name else "Customer name: (not provided)"
+    user_prompt = (
+        f"{name_part}\n"
+        f"New ticket number: {ticket_number}\n\n"
+        "Customer message:\n"
+        f"\"{message}\"\n\n"
+        "Write a brief, empathetic response that mentions the ticket number."
+    )
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _mention_ticket(content: str, ticket_number: str) -> str:
+    if str(ticket_number) not in content:
+        content += f" Your ticket #{ticket_number} has been created."
+    return content
+
+
+def _negative_fallback(customer_name: Optional[str], ticket_number: str) -> str:
+    if customer_name:
+        return (
+            f"We apologize for the inconvenience, {customer_name}. "
+            f"A new ticket #{ticket_number} has been generated, and our team will "
+            f"follow up shortly."
+        )
+    return (
+        f"We apologize for the inconvenience. A new ticket #{ticket_number} "
+        f"has been generated, and our team will follow up shortly."
+    )
 
 
 class FeedbackAgent:
@@ -13,42 +92,36 @@ class FeedbackAgent:
     Handles positive and negative feedback flows:
     - Positive: generate thank-you message via LLM.
     - Negative: create ticket and generate empathetic apology message via LLM.
+
+    Both flows accept a `draft` reply written by the combined
+    classify-and-respond call, in which case no further LLM call is made.
+    Positive feedback otherwise uses a response template when enabled
+    (see app.agents.templates).
     """
 
     def __init__(self) -> None:
-        openai.api_key = settings.openai_api_key
         self.model = settings.openai_model
 
     # --------- Positive Flow --------- #
 
-    def handle_positive(self, message: str, customer_name: Optional[str] = None) -> str:
+    def handle_positive(
+        self,
+        message: str,
+        customer_name: Optional[str] = None,
+        draft: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> str:
         logger.info("FeedbackAgent.handle_positive called")
-
-        system_prompt = (
-            "You are a polite and concise banking customer support agent.\n"
-            "Your goal is to acknowledge and thank the customer for their positive feedback.\n"
-            "Respond in ONE or TWO sentences, friendly and professional.\n"
-            "If a customer name is provided, address them by name.\n"
-        )
-
-        name_part = f"Customer name: {customer_name}" if customer_name else "Customer name: (not provided)"
-        user_prompt = (
-            f"{name_part}\n\n"
-            "The customer left this positive feedback:\n"
-            f"\"{message}\"\n\n"
-            "Write a brief response."
+        reply = draft or templated_reply(
+            "feedback.positive", message, locale, name=customer_name
         )
+        if reply:
+            return reply
 
         try:
-            completion = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.3,
+            content = chat_completion(
+                "feedback", self.model, _positive_messages(message, customer_name), temperature=0.3
             )
-            content = completion.choices[0].message["content"].strip()
             logger.debug(f"Positive feedback LLM response: {content}")
             if content:
                 return content
@@ -56,17 +129,65 @@ class FeedbackAgent:
         except Exception:
             logger.exception("Error calling OpenAI in FeedbackAgent.handle_positive")
 
-        if customer_name:
-            return (
-                f"Thank you for your kind words, {customer_name}! "
-                "We’re delighted to assist you."
+        return _positive_fallback(customer_name)
+
+    async def handle_positive_async(
+        self,
+        message: str,
+        customer_name: Optional[str] = None,
+        draft: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> str:
+        """Async `handle_positive`."""
+        logger.info("FeedbackAgent.handle_positive_async called")
+        reply = draft or templated_reply(
+            "feedback.positive", message, locale, name=customer_name
+        )
+        if reply:
+            return reply
+
+        try:
+            content = await chat_completion_async(
+                "feedback", self.model, _positive_messages(message, customer_name), temperature=0.3
             )
-        return "Thank you for your kind words! We’re delighted to assist you."
+            logger.debug(f"Positive feedback LLM response: {content}")
+            if content:
+                return content
+
+        except Exception:
+            logger.exception("Error calling OpenAI in FeedbackAgent.handle_positive_async")
+
+        return _positive_fallback(customer_name)
+
+    def handle_positive_stream(
+        self,
+        message: str,
+        customer_name: Optional[str] = None,
+        draft: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Streaming `handle_positive`: yields the reply as text deltas."""
+        logger.info("FeedbackAgent.handle_positive_stream called")
+        reply = draft or templated_reply(
+            "feedback.positive", message, locale, name=customer_name
+        )
+        if reply:
+            yield reply
+            return
+
+        yield from stream_reply(
+            "feedback",
+            self.model,
+            _positive_messages(message, customer_name),
+            temperature=0.3,
+            fallback=_positive_fallback(customer_name),
+            context="FeedbackAgent.handle_positive_stream",
+        )
 
     # --------- Negative Flow --------- #
 
     def handle_negative(
-        self, message: str, customer_name: Optional[str] = None
+        self, message: str, customer_name: Optional[str] = None, draft: Optional[str] = None
     ) -> Tuple[str, str]:
         """
         Returns (response_text, ticket_number).
@@ -74,7 +195,8 @@ class FeedbackAgent:
         This method:
         - Generates a ticket_number.
         - Stores a new SupportTicket row.
-        - Uses LLM to craft an empathetic apology message with that ticket number.
+        - Uses LLM to craft an empathetic apology message with that ticket number,
+          or fills the ticket number into `draft` when one is given.
         """
         logger.info("FeedbackAgent.handle_negative called")
 
@@ -86,56 +208,98 @@ class FeedbackAgent:
             status="Open",
         )
 
-        system_prompt = (
-            "You are a banking customer support agent.\n"
-            "The customer is unhappy or reporting an issue.\n"
-            "You must respond with empathy, apologize for the inconvenience, "
-            "and reassure them that their issue is being investigated.\n"
-            "Include the ticket number in the reply as '#<ticket_number>'.\n"
-            "Respond in about 2–3 sentences, professional but warm.\n"
-        )
-
-        name_part = f"Customer name: {customer_name}" if customer_name else "Customer name: (not provided)"
-        user_prompt = (
-            f"{name_part}\n"
-            f"New ticket number: {ticket_number}\n\n"
-            "Customer message:\n"
-            f"\"{message}\"\n\n"
-            "Write a brief, empathetic response that mentions the ticket number."
-        )
+        if draft:
+            content = draft.replace(TICKET_PLACEHOLDER, ticket_number)
+            return _mention_ticket(content, ticket_number), ticket_number
 
         try:
-            completion = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
+            content = chat_completion(
+                "feedback",
+                self.model,
+                _negative_messages(message, customer_name, ticket_number),
                 temperature=0.4,
             )
-            content = completion.choices[0].message["content"].strip()
             logger.debug(f"Negative feedback LLM response: {content}")
             if content:
-                if str(ticket_number) not in content:
-                    content += f" Your ticket #{ticket_number} has been created."
-                return content, ticket_number
+                return _mention_ticket(content, ticket_number), ticket_number
 
         except Exception:
             logger.exception("Error calling OpenAI in FeedbackAgent.handle_negative")
 
-        if customer_name:
-            response = (
-                f"We apologize for the inconvenience, {customer_name}. "
-                f"A new ticket #{ticket_number} has been generated, and our team will "
-                f"follow up shortly."
-            )
-        else:
-            response = (
-                f"We apologize for the inconvenience. A new ticket #{ticket_number} "
-                f"has been generated, and our team will follow up shortly."
+        return _negative_fallback(customer_name, ticket_number), ticket_number
+
+    async def handle_negative_async(
+        self, message: str, customer_name: Optional[str] = None, draft: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Async `handle_negative`; the ticket insert runs in a worker thread."""
+        logger.info("FeedbackAgent.handle_negative_async called")
+
+        ticket_number = self._generate_ticket_number()
+        await asyncio.to_thread(
+            create_ticket,
+            ticket_number=ticket_number,
+            customer_name=customer_name,
+            message=message,
+            status="Open",
+        )
+
+        if draft:
+            content = draft.replace(TICKET_PLACEHOLDER, ticket_number)
+            return _mention_ticket(content, ticket_number), ticket_number
+
+        try:
+            content = await chat_completion_async(
+                "feedback",
+                self.model,
+                _negative_messages(message, customer_name, ticket_number),
+                temperature=0.4,
             )
+            logger.debug(f"Negative feedback LLM response: {content}")
+            if content:
+                return _mention_ticket(content, ticket_number), ticket_number
 
-        return response, ticket_number
+        except Exception:
+            logger.exception("Error calling OpenAI in FeedbackAgent.handle_negative_async")
+
+        return _negative_fallback(customer_name, ticket_number), ticket_number
+
+    def handle_negative_stream(
+        self, message: str, customer_name: Optional[str] = None, draft: Optional[str] = None
+    ) -> Generator[str, None, str]:
+        """
+        Streaming `handle_negative`: creates the ticket, yields the reply as text
+        deltas (plus a ticket sentence if the model left it out) and returns the
+        ticket number.
+        """
+        logger.info("FeedbackAgent.handle_negative_stream called")
+
+        ticket_number = self._generate_ticket_number()
+        create_ticket(
+            ticket_number=ticket_number,
+            customer_name=customer_name,
+            message=message,
+            status="Open",
+        )
+
+        if draft:
+            yield _mention_ticket(draft.replace(TICKET_PLACEHOLDER, ticket_number), ticket_number)
+            return ticket_number
+
+        parts: List[str] = []
+        yield from stream_reply(
+            "feedback",
+            self.model,
+            _negative_messages(message, customer_name, ticket_number),
+            temperature=0.4,
+            fallback=_negative_fallback(customer_name, ticket_number),
+            context="FeedbackAgent.handle_negative_stream",
+            parts=parts,
+        )
+        content = "".join(parts)
+        suffix = _mention_ticket(content, ticket_number)[len(content):]
+        if suffix:
+            yield suffix
+        return ticket_number
 
     # --------- Helpers --------- #
 
@@ -1,10 +1,53 @@
-from typing import List
-
-import openai
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+import asyncio
+import time
 
 from config.settings import settings
 from app.logs.logger import logger
-from app.rag.retriever import retrieve_relevant_chunks
+from app.rag.answer_cache import get_answer_cache
+from app.rag.context_packer import pack_context
+from app.rag.embeddings import get_embedding
+from app.rag.index import SupportDocIndex
+from app.rag.retriever import (
+    RetrievedChunk,
+    get_support_doc_index,
+    lexical_candidates,
+    retrieve_chunk_hits,
+    skips_embedding,
+)
+from app.llm import (
+    Messages,
+    chat_completion,
+    chat_completion_async,
+    llm_available,
+    stream_reply,
+)
+
+_NOT_FOUND = (
+    "I’m not able to find information about that in our current support "
+    "documents. Please contact customer support for further assistance."
+)
+_UNAVAILABLE = (
+    "I’m not able to retrieve information from our support documents at the moment. "
+    "Please try again later or contact customer support."
+)
+
+
+@dataclass
+class _CacheLookup:
+    answer: Optional[str] = None
+    query_emb: Optional[List[float]] = None
+    generation: Optional[int] = None
+
+
+@dataclass
+class PreparedQuery:
+    """Everything before the answer LLM call: cache lookup and packed prompt."""
+
+    start: float  # perf_counter() when preparation began
+    lookup: _CacheLookup
+    messages: Optional[Messages]  # None when nothing relevant was retrieved
 
 
 class KnowledgeAgent:
@@ -12,30 +55,185 @@ class KnowledgeAgent:
     Knowledge/RAG agent.
 
     - Uses the support document index to retrieve relevant chunks.
+    - Packs them into a token-budgeted context (dedup + neighbour merge).
     - Calls the LLM with those chunks as context.
     - Answers user questions based ONLY on the support documents; if
       the answer is not present, clearly indicates that.
+    - Reuses answers to near-identical earlier questions via the semantic
+      answer cache (see app.rag.answer_cache).
     """
 
     def __init__(self) -> None:
-        openai.api_key = settings.openai_api_key
         self.model = settings.openai_model
 
-    def handle_knowledge_query(self, message: str) -> str:
+    def prepare(self, message: str) -> PreparedQuery:
+        """
+        Embed, check the answer cache and retrieve/pack context for `message`.
+
+        A decisive BM25 match in lexical_first mode skips both the embedding
+        and the answer cache; otherwise the query is embedded once and that
+        vector serves the cache lookup and retrieval.
+
+        Has no side effects beyond caching, so the orchestrator can run it
+        speculatively while the message is still being classified.
+        """
+        start = time.perf_counter()
+        index = get_support_doc_index()
+        if len(index) == 0:
+            return PreparedQuery(start=start, lookup=_CacheLookup(), messages=None)
+
+        top_k = settings.knowledge_top_k
+        lexical = lexical_candidates(index, message, top_k)
+        if skips_embedding(lexical):
+            lookup = _CacheLookup()
+        else:
+            lookup = self._lookup_cached_answer(message, start, index, get_embedding(message))
+        messages = None
+        if lookup.answer is None:
+            hits = retrieve_chunk_hits(message, top_k, index, lookup.query_emb, lexical)
+            messages = self._build_messages(message, hits)
+        return PreparedQuery(start=start, lookup=lookup, messages=messages)
+
+    def handle_knowledge_query(
+        self, message: str, prepared: Optional[PreparedQuery] = None
+    ) -> str:
         logger.info("KnowledgeAgent.handle_knowledge_query called")
 
-        chunks = retrieve_relevant_chunks(message, top_k=4)
-        if not chunks:
-            return (
-                "I’m not able to find information about that in our current support "
-                "documents. Please contact customer support for further assistance."
+        if prepared is None and not self._embeddings_available():
+            return _UNAVAILABLE
+        prepared = prepared or self.prepare(message)
+        if prepared.lookup.answer is not None:
+            return prepared.lookup.answer
+        if prepared.messages is None:
+            return _NOT_FOUND
+
+        try:
+            content = chat_completion("knowledge", self.model, prepared.messages, temperature=0.2)
+            logger.debug(f"KnowledgeAgent LLM response: {content}")
+            self._remember_answer(message, content, prepared)
+            return content or _NOT_FOUND
+        except Exception:
+            logger.exception("Error calling OpenAI in KnowledgeAgent.handle_knowledge_query")
+            return _UNAVAILABLE
+
+    async def handle_knowledge_query_async(
+        self, message: str, prepared: Optional[PreparedQuery] = None
+    ) -> str:
+        """
+        Async `handle_knowledge_query`. Embedding, retrieval and cache work are
+        offloaded to worker threads; the answer LLM call is awaited.
+        """
+        logger.info("KnowledgeAgent.handle_knowledge_query_async called")
+
+        if prepared is None and not self._embeddings_available():
+            return _UNAVAILABLE
+        prepared = prepared or await asyncio.to_thread(self.prepare, message)
+        if prepared.lookup.answer is not None:
+            return prepared.lookup.answer
+        if prepared.messages is None:
+            return _NOT_FOUND
+
+        try:
+            content = await chat_completion_async(
+                "knowledge", self.model, prepared.messages, temperature=0.2
+            )
+            logger.debug(f"KnowledgeAgent LLM response: {content}")
+            await asyncio.to_thread(self._remember_answer, message, content, prepared)
+            return content or _NOT_FOUND
+        except Exception:
+            logger.exception(
+                "Error calling OpenAI in KnowledgeAgent.handle_knowledge_query_async"
             )
+            return _UNAVAILABLE
+
+    def handle_knowledge_query_stream(
+        self, message: str, prepared: Optional[PreparedQuery] = None
+    ) -> Iterator[str]:
+        """Streaming `handle_knowledge_query`: yields the answer as text deltas."""
+        logger.info("KnowledgeAgent.handle_knowledge_query_stream called")
+
+        if prepared is None and not self._embeddings_available():
+            yield _UNAVAILABLE
+            return
+        prepared = prepared or self.prepare(message)
+        if prepared.lookup.answer is not None:
+            yield prepared.lookup.answer
+            return
+        if prepared.messages is None:
+            yield _NOT_FOUND
+            return
+
+        parts: List[str] = []
+        completed = yield from stream_reply(
+            "knowledge",
+            self.model,
+            prepared.messages,
+            temperature=0.2,
+            fallback=_UNAVAILABLE,
+            context="KnowledgeAgent.handle_knowledge_query_stream",
+            parts=parts,
+        )
+        if completed:
+            self._remember_answer(message, "".join(parts), prepared)
+
+    # --------- Helpers --------- #
+
+    def _embeddings_available(self) -> bool:
+        # With the chat model's breaker open a cached answer can still be
+        # served; without embeddings there is nothing to look up or retrieve.
+        if llm_available(settings.embedding_model):
+            return True
+        logger.warning("Embedding circuit open; KnowledgeAgent answering with fallback")
+        return False
+
+    def _lookup_cached_answer(
+        self, message: str, start: float, index: SupportDocIndex, query_emb: List[float]
+    ) -> _CacheLookup:
+        cache = get_answer_cache()
+        if cache is None:
+            return _CacheLookup(query_emb=query_emb)
+
+        cached = cache.lookup(message, query_emb, index.generation)
+        if cached is None:
+            return _CacheLookup(query_emb=query_emb, generation=index.generation)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        stats = cache.stats()
+        logger.info(
+            f"Answer cache hit (similarity={cached.similarity:.3f}): "
+            f"~{cached.latency_ms - elapsed_ms:.0f} ms saved, "
+            f"hit rate {stats['hit_rate']:.1%}"
+        )
+        return _CacheLookup(answer=cached.answer)
 
-        context_blocks: List[str] = []
-        for score, title, content in chunks:
-            context_blocks.append(f"[{title}] (score={score:.3f})\n{content}")
+    def _remember_answer(self, message: str, content: str, prepared: PreparedQuery) -> None:
+        cache = get_answer_cache()
+        lookup = prepared.lookup
+        if not content or cache is None or lookup.query_emb is None:
+            return
+        cache.store(
+            message,
+            lookup.query_emb,
+            content,
+            lookup.generation,
+            latency_ms=(time.perf_counter() - prepared.start) * 1000,
+        )
+
+    def _build_messages(self, message: str, hits: List[RetrievedChunk]) -> Optional[Messages]:
+        """Pack retrieved context into the prompt; None when nothing relevant was found."""
+        if not hits:
+            return None
 
-        context_str = "\n\n".join(context_blocks)
+        packed = pack_context(
+            hits,
+            token_budget=settings.knowledge_context_token_budget,
+            dedup_threshold=settings.knowledge_dedup_threshold,
+        )
+        logger.info(
+            f"Packed {packed.chunks_in} chunks into {len(packed.blocks)} context blocks: "
+            f"~{packed.tokens_used} tokens, ~{packed.tokens_saved} tokens saved"
+        )
+        context_str = packed.text
 
         system_prompt = (
             "You are a banking customer support assistant powered by a knowledge base.\n"
@@ -56,24 +254,7 @@ class KnowledgeAgent:
             "If the answer is not present, say you do not know."
         )
 
-        try:
-            completion = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.2,
-            )
-            content = completion.choices[0].message["content"].strip()
-            logger.debug(f"KnowledgeAgent LLM response: {content}")
-            return content or (
-                "I’m not able to find information about that in our current support "
-                "documents. Please contact customer support for further assistance."
-            )
-        except Exception:
-            logger.exception("Error calling OpenAI in KnowledgeAgent.handle_knowledge_query")
-            return (
-                "I’m not able to retrieve information from our support documents at the moment. "
-                "Please try again later or contact customer support."
-            )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
@@ -0,0 +1,257 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import re
+import zlib
+
+import numpy as np
+
+from config.settings import settings
+from app.logs.logger import logger
+
+CATEGORIES = ("positive_feedback", "negative_feedback", "query")
+SENTIMENT_FOR = {
+    "positive_feedback": "positive",
+    "negative_feedback": "negative",
+    "query": "neutral",
+}
+
+TICKET_RE = re.compile(r"(?:ticket\s*#?\s*|#)(\d{6})", re.IGNORECASE)
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Rule set: each rule only fires when nothing in the message contradicts it.
+_THANKS_RE = re.compile(
+    r"^\W*(?:thanks?|thank you|thx|ty|cheers|much appreciated|great job|good job|"
+    r"awesome|perfect|appreciate it)\b[^?]*$",
+    re.IGNORECASE,
+)
+_NEGATIVE_CUE_RE = re.compile(
+    r"\b(?:not|no|never|still|but|however|bad|terrible|awful|worst|problem|unhappy|"
+    r"angry|frustrat\w*|disappoint\w*|complain\w*|ridiculous|useless|"
+    r"hasn'?t|haven'?t|didn'?t|doesn'?t|isn'?t|won'?t|can'?t|cannot)\b",
+    re.IGNORECASE,
+)
+_COMPLAINT_RE = re.compile(
+    r"\b(?:terrible|awful|worst|unacceptable|ridiculous|disgusting|furious|angry|"
+    r"fed up|not happy|unhappy|complain\w*|rip[- ]?off|scam)\b",
+    re.IGNORECASE,
+)
+_STATUS_RE = re.compile(
+    r"\b(?:status|check|update|progress|any news|where is|follow(?:ing)? up)\b",
+    re.IGNORECASE,
+)
+
+_RULE_CONFIDENCE = {"ticket_status": 0.97, "thanks": 0.95, "complaint": 0.92}
+
+
+def extract_ticket_number(message: str) -> Optional[str]:
+    m = TICKET_RE.search(message)
+    return m.group(1) if m else None
+
+
+def _apply_rules(message: str, ticket_number: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Return (category, rule name) when a rule clearly applies."""
+    negative_cue = _NEGATIVE_CUE_RE.search(message) is not None
+    if ticket_number and not negative_cue:
+        if _STATUS_RE.search(message) or len(_WORD_RE.findall(message.lower())) <= 4:
+            return "query", "ticket_status"
+    if _THANKS_RE.search(message.strip()) and not negative_cue:
+        return "positive_feedback", "thanks"
+    if _COMPLAINT_RE.search(message) and "?" not in message and not ticket_number:
+        return "negative_feedback", "complaint"
+    return None
+
+
+def _features(message: str, n_features: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Hashed word unigrams and bigrams, L2-normalised (indices, values)."""
+    words = _WORD_RE.findall(message.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not grams:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    # crc32 rather than hash(): stable across processes, so saved weights stay valid.
+    hashed = np.array([zlib.crc32(g.encode("utf-8")) % n_features for g in grams])
+    indices, counts = np.unique(hashed, return_counts=True)
+    values = counts.astype(np.float32)
+    return indices, values / np.linalg.norm(values)
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    exp = np.exp(logits - logits.max())
+    return exp / exp.sum()
+
+
+class LocalClassifier:
+    """
+    First-stage classifier that runs in-process, without an LLM call.
+
+    A compiled rule set handles the obvious cases ("check ticket 123456",
+    "thank you so much"). Other messages are scored by a multinomial logistic
+    regression over hashed word n-grams, trained from `agent_logs` history.
+    `classify` always returns a confidence; the caller decides whether it is
+    high enough to skip the LLM.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[np.ndarray] = None,
+        bias: Optional[np.ndarray] = None,
+        n_features: int = 1 << 16,
+    ) -> None:
+        self.n_features = n_features if weights is None else weights.shape[0]
+        self.weights = weights
+        self.bias = bias if bias is not None else np.zeros(len(CATEGORIES), dtype=np.float32)
+
+    @property
+    def trained(self) -> bool:
+        return self.weights is not None
+
+    def predict_proba(self, message: str) -> np.ndarray:
+        """Category probabilities in CATEGORIES order (uniform when untrained)."""
+        if self.weights is None:
+            return np.full(len(CATEGORIES), 1.0 / len(CATEGORIES), dtype=np.float32)
+        indices, values = _features(message, self.n_features)
+        return _softmax(values @ self.weights[indices] + self.bias)
+
+    def classify(self, message: str) -> Dict[str, Any]:
+        """
+        Return {"category", "sentiment", "ticket_number", "confidence", "source"}
+        where source is "rules" or "model".
+        """
+        ticket_number = extract_ticket_number(message)
+        rule = _apply_rules(message, ticket_number)
+        if rule is not None:
+            category, name = rule
+            confidence = _RULE_CONFIDENCE[name]
+            source = "rules"
+        else:
+            probs = self.predict_proba(message)
+            best = int(np.argmax(probs))
+            category, confidence, source = CATEGORIES[best], float(probs[best]), "model"
+
+        return {
+            "category": category,
+            "sentiment": SENTIMENT_FOR[category],
+            "ticket_number": ticket_number,
+            "confidence": confidence,
+            "source": source,
+        }
+
+    @classmethod
+    def train(
+        cls,
+        examples: Sequence[Tuple[str, str]],
+        n_features: int = 1 << 16,
+        epochs: int = 10,
+        learning_rate: float = 0.5,
+        l2: float = 1e-4,
+        seed: int = 0,
+    ) -> "LocalClassifier":
+        """Fit on (message, category) pairs with plain SGD on the softmax loss."""
+        rows = [
+            (_features(message, n_features), CATEGORIES.index(label))
+            for message, label in examples
+            if label in CATEGORIES
+        ]
+        weights = np.zeros((n_features, len(CATEGORIES)), dtype=np.float32)
+        bias = np.zeros(len(CATEGORIES), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+
+        for epoch in range(epochs):
+            lr = learning_rate / (1 + epoch)
+            for i in rng.permutation(len(rows)):
+                (indices, values), label = rows[i]
+                probs = _softmax(values @ weights[indices] + bias)
+                probs[label] -= 1.0
+                weights[indices] -= lr * (np.outer(values, probs) + l2 * weights[indices])
+                bias -= lr * probs
+
+        return cls(weights, bias)
+
+    def save(self, path: Path) -> None:
+        if self.weights is None:
+            raise ValueError("Cannot save an untrained LocalClassifier")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path: Path) -> "LocalClassifier":
+        """Load saved weights; rules-only classifier when the file is missing."""
+        if not path.exists():
+            return cls()
+        try:
+            with np.load(path) as data:
+                return cls(data["weights"], data["bias"])
+        except Exception:
+            logger.exception(f"Could not load local classifier from {path}; using rules only")
+            return cls()
+
+
+def bypass_report(
+    classifier: LocalClassifier, examples: Sequence[Tuple[str, str]], threshold: float
+) -> Dict[str, float]:
+    """Share of messages that would skip the LLM, and agreement with logged labels."""
+    bypassed = 0
+    agree = 0
+    for message, label in examples:
+        result = classifier.classify(message)
+        if result["confidence"] >= threshold:
+            bypassed += 1
+            agree += result["category"] == label
+    total = len(examples)
+    return {
+        "messages": total,
+        "bypass_rate": bypassed / total if total else 0.0,
+        "bypass_accuracy": agree / bypassed if bypassed else 0.0,
+    }
+
+
+def _history(limit: int) -> List[Tuple[str, str]]:
+    from app.db.dao import get_classifier_training_rows, init_db
+
+    init_db()
+    return get_classifier_training_rows(limit)
+
+
+def train_from_logs(limit: int = 50000, min_examples: int = 50) -> Optional[LocalClassifier]:
+    """Train on classified `agent_logs` rows and save to `classifier_model_path`."""
+    examples = _history(limit)
+    labels = {label for _, label in examples}
+    if len(examples) < min_examples or len(labels) < 2:
+        print(
+            f"Not enough history to train ({len(examples)} messages, "
+            f"{len(labels)} categories); rules only."
+        )
+        return None
+
+    held_out = examples[::5]
+    classifier = LocalClassifier.train([ex for i, ex in enumerate(examples) if i % 5])
+    report = bypass_report(classifier, held_out, settings.classifier_local_threshold)
+    print(
+        f"Held-out: {report['bypass_rate']:.1%} would bypass the LLM at "
+        f"threshold {settings.classifier_local_threshold}, "
+        f"{report['bypass_accuracy']:.1%} of those agree with the logged category"
+    )
+
+    classifier = LocalClassifier.train(examples)
+    path = Path(settings.classifier_model_path)
+    classifier.save(path)
+    print(f"Trained on {len(examples)} messages; saved to {path}")
+    return classifier
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fast-path classifier")
+    parser.add_argument("command", choices=["train", "report"])
+    parser.add_argument("--limit", type=int, default=50000, help="max agent_logs rows")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        train_from_logs(limit=args.limit)
+    else:
+        clf = LocalClassifier.load(Path(settings.classifier_model_path))
+        rep = bypass_report(clf, _history(args.limit), settings.classifier_local_threshold)
+        print(
+            f"{rep['messages']} logged messages: {rep['bypass_rate']:.1%} bypass the LLM, "
+            f"{rep['bypass_accuracy']:.1%} of those agree with the logged category "
+            f"(model trained: {clf.trained})"
+        )
@@ -1,10 +1,35 @@
-from typing import Optional
-
-import openai
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+import asyncio
 
 from config.settings import settings
 from app.db.dao import get_ticket_by_number
+from app.db.models import SupportTicket
 from app.logs.logger import logger
+from app.llm import Messages, chat_completion, chat_completion_async, stream_reply
+from .templates import templated_reply
+
+
+@dataclass
+class _ReplyPlan:
+    """Prompt plus fallback for one ticket-query situation."""
+
+    situation: str  # for log messages
+    messages: Messages
+    fallback: str
+    template: str  # response template key
+    fields: Dict[str, Optional[str]] = field(default_factory=dict)
+    ticket_number: Optional[str] = None  # reply must mention it when set
+
+    def finish(self, content: str) -> str:
+        if self.ticket_number and str(self.ticket_number) not in content:
+            content += f" (This refers to ticket #{self.ticket_number}.)"
+        return content
+
+    def templated(self, message: str, locale: Optional[str] = None) -> Optional[str]:
+        """Locally rendered reply, or None when the LLM should write it."""
+        reply = templated_reply(self.template, message, locale, **self.fields)
+        return self.finish(reply) if reply is not None else None
 
 
 class QueryAgent:
@@ -18,94 +43,159 @@ class QueryAgent:
     """
 
     def __init__(self) -> None:
-        openai.api_key = settings.openai_api_key
         self.model = settings.openai_model
 
     def handle_query(
-        self, message: str, ticket_number: Optional[str] = None
+        self,
+        message: str,
+        ticket_number: Optional[str] = None,
+        locale: Optional[str] = None,
     ) -> str:
         logger.info("QueryAgent.handle_query called")
 
         if not ticket_number:
             ticket_number = self._extract_ticket_number(message)
+        ticket = get_ticket_by_number(ticket_number) if ticket_number else None
+        plan = self._plan_reply(message, ticket_number, ticket)
+        templated = plan.templated(message, locale)
+        if templated is not None:
+            return templated
+
+        try:
+            content = chat_completion("query", self.model, plan.messages, temperature=0.4)
+            logger.debug(f"Ticket query LLM response: {content}")
+            if content:
+                return plan.finish(content)
+        except Exception:
+            logger.exception(
+                f"Error calling OpenAI in QueryAgent.handle_query ({plan.situation})."
+            )
+
+        return plan.fallback
+
+    async def handle_query_async(
+        self,
+        message: str,
+        ticket_number: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> str:
+        """Async `handle_query`; the ticket lookup runs in a worker thread."""
+        logger.info("QueryAgent.handle_query_async called")
 
         if not ticket_number:
-            try:
-                system_prompt = (
-                    "You are a banking customer support assistant.\n"
-                    "The user is asking a question but has not provided a ticket number.\n"
-                    "Politely ask them to provide their 6-digit ticket number.\n"
-                    "Respond in one short, friendly sentence."
-                )
-                user_prompt = (
-                    "The customer is asking about their ticket, but no ticket number "
-                    "could be detected from the message:\n\n"
-                    f"\"{message}\"\n\n"
-                    "Write a brief reply."
-                )
-
-                completion = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    temperature=0.4,
-                )
-                content = completion.choices[0].message["content"].strip()
-                if content:
-                    return content
-            except Exception:
-                logger.exception(
-                    "Error calling OpenAI in QueryAgent.handle_query (no ticket)."
-                )
-
-            return (
-                "Could you please provide your 6-digit ticket number so I can "
-                "check its status?"
+            ticket_number = self._extract_ticket_number(message)
+        ticket = (
+            await asyncio.to_thread(get_ticket_by_number, ticket_number)
+            if ticket_number
+            else None
+        )
+        plan = self._plan_reply(message, ticket_number, ticket)
+        templated = plan.templated(message, locale)
+        if templated is not None:
+            return templated
+
+        try:
+            content = await chat_completion_async(
+                "query", self.model, plan.messages, temperature=0.4
             )
+            logger.debug(f"Ticket query LLM response: {content}")
+            if content:
+                return plan.finish(content)
+        except Exception:
+            logger.exception(
+                f"Error calling OpenAI in QueryAgent.handle_query_async ({plan.situation})."
+            )
+
+        return plan.fallback
+
+    def handle_query_stream(
+        self,
+        message: str,
+        ticket_number: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Streaming `handle_query`: yields the reply as text deltas."""
+        logger.info("QueryAgent.handle_query_stream called")
 
-        ticket = get_ticket_by_number(ticket_number)
+        if not ticket_number:
+            ticket_number = self._extract_ticket_number(message)
+        ticket = get_ticket_by_number(ticket_number) if ticket_number else None
+        plan = self._plan_reply(message, ticket_number, ticket)
+        templated = plan.templated(message, locale)
+        if templated is not None:
+            yield templated
+            return
+
+        parts: List[str] = []
+        yield from stream_reply(
+            "query",
+            self.model,
+            plan.messages,
+            temperature=0.4,
+            fallback=plan.fallback,
+            context=f"QueryAgent.handle_query_stream ({plan.situation})",
+            parts=parts,
+        )
+        content = "".join(parts)
+        suffix = plan.finish(content)[len(content):]
+        if suffix:
+            yield suffix
+
+    def _plan_reply(
+        self,
+        message: str,
+        ticket_number: Optional[str],
+        ticket: Optional[SupportTicket],
+    ) -> _ReplyPlan:
+        if not ticket_number:
+            system_prompt = (
+                "You are a banking customer support assistant.\n"
+                "The user is asking a question but has not provided a ticket number.\n"
+                "Politely ask them to provide their 6-digit ticket number.\n"
+                "Respond in one short, friendly sentence."
+            )
+            user_prompt = (
+                "The customer is asking about their ticket, but no ticket number "
+                "could be detected from the message:\n\n"
+                f"\"{message}\"\n\n"
+                "Write a brief reply."
+            )
+            return _ReplyPlan(
+                situation="no ticket",
+                messages=_messages(system_prompt, user_prompt),
+                template="query.no_ticket",
+                fallback=(
+                    "Could you please provide your 6-digit ticket number so I can "
+                    "check its status?"
+                ),
+            )
 
         if ticket is None:
-            try:
-                system_prompt = (
-                    "You are a helpful banking customer support assistant.\n"
-                    "You could not find the ticket in the system.\n"
-                    "Explain this to the customer politely, ask them to "
-                    "double-check the number, and offer alternative help.\n"
-                    "Respond in 1–2 sentences, friendly and professional.\n"
-                    "Include the ticket number as '#<ticket_number>'."
-                )
-                user_prompt = (
-                    f"The user asked about ticket number {ticket_number}, "
-                    "but it does not exist in our records.\n\n"
-                    "Write a brief response for the customer."
-                )
-
-                completion = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt},
-                    ],
-                    temperature=0.4,
-                )
-                content = completion.choices[0].message["content"].strip()
-                if content:
-                    return content
-            except Exception:
-                logger.exception(
-                    "Error calling OpenAI in QueryAgent.handle_query (ticket not found)."
-                )
-
-            return (
-                f"I’m unable to find ticket #{ticket_number} in our records. "
-                "Please double-check the number or contact support."
+            system_prompt = (
+                "You are a helpful banking customer support assistant.\n"
+                "You could not find the ticket in the system.\n"
+                "Explain this to the customer politely, ask them to "
+                "double-check the number, and offer alternative help.\n"
+                "Respond in 1–2 sentences, friendly and professional.\n"
+                "Include the ticket number as '#<ticket_number>'."
+            )
+            user_prompt = (
+                f"The user asked about ticket number {ticket_number}, "
+                "but it does not exist in our records.\n\n"
+                "Write a brief response for the customer."
+            )
+            return _ReplyPlan(
+                situation="ticket not found",
+                messages=_messages(system_prompt, user_prompt),
+                template="query.not_found",
+                fields={"ticket_number": ticket_number},
+                fallback=(
+                    f"I’m unable to find ticket #{ticket_number} in our records. "
+                    "Please double-check the number or contact support."
+                ),
             )
 
         status_text = ticket.status or "Open"
-        created = ticket.created_at
         customer_name = ticket.customer_name
         message_snippet = (
             ticket.message[:200] + "..."
@@ -119,61 +209,45 @@ class QueryAgent:
         elif status_text.lower() in {"in progress", "pending"}:
             status_category = "in_progress"
 
-        try:
-            system_prompt = (
-                "You are a professional but friendly banking customer support agent.\n"
-                "You are given:\n"
-                "- a ticket number\n"
-                "- current ticket status\n"
-                "- optionally the customer's name\n"
-                "- optionally a short summary of the issue\n\n"
-                "Your job is to describe the ticket status clearly and reassure the customer.\n"
-                "Guidance:\n"
-                "- If status is 'Open' or an equivalent, let them know it's been logged "
-                "and will be reviewed.\n"
-                "- If status is 'In Progress' / 'Pending', explain that the team is actively "
-                "working on it.\n"
-                "- If status is 'Resolved' / 'Closed', inform them it is marked resolved "
-                "and invite them to reach out again if needed.\n"
-                "Respond in 1–3 short sentences.\n"
-                "Always mention the ticket as '#<ticket_number>'."
-            )
-
-            user_prompt_parts = [
-                f"Ticket number: {ticket_number}",
-                f"Ticket status: {status_text}",
-                f"Status category (for your reasoning): {status_category}",
-            ]
-            if customer_name:
-                user_prompt_parts.append(f"Customer name: {customer_name}")
-            if message_snippet:
-                user_prompt_parts.append(
-                    f"Original issue summary/snippet: \"{message_snippet}\""
-                )
-
-            user_prompt = "\n".join(user_prompt_parts)
-
-            completion = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.4,
-            )
-            content = completion.choices[0].message["content"].strip()
-            logger.debug(f"Ticket status LLM response: {content}")
-            if content:
-                if str(ticket_number) not in content:
-                    content += f" (This refers to ticket #{ticket_number}.)"
-                return content
+        system_prompt = (
+            "You are a professional but friendly banking customer support agent.\n"
+            "You are given:\n"
+            "- a ticket number\n"
+            "- current ticket status\n"
+            "- optionally the customer's name\n"
+            "- optionally a short summary of the issue\n\n"
+            "Your job is to describe the ticket status clearly and reassure the customer.\n"
+            "Guidance:\n"
+            "- If status is 'Open' or an equivalent, let them know it's been logged "
+            "and will be reviewed.\n"
+            "- If status is 'In Progress' / 'Pending', explain that the team is actively "
+            "working on it.\n"
+            "- If status is 'Resolved' / 'Closed', inform them it is marked resolved "
+            "and invite them to reach out again if needed.\n"
+            "Respond in 1–3 short sentences.\n"
+            "Always mention the ticket as '#<ticket_number>'."
+        )
 
-        except Exception:
-            logger.exception(
-                "Error calling OpenAI in QueryAgent.handle_query (ticket found)."
+        user_prompt_parts = [
+            f"Ticket number: {ticket_number}",
+            f"Ticket status: {status_text}",
+            f"Status category (for your reasoning): {status_category}",
+        ]
+        if customer_name:
+            user_prompt_parts.append(f"Customer name: {customer_name}")
+        if message_snippet:
+            user_prompt_parts.append(
+                f"Original issue summary/snippet: \"{message_snippet}\""
             )
 
-        return f"Your ticket #{ticket.ticket_number} is currently marked as: {ticket.status}."
+        return _ReplyPlan(
+            situation="ticket found",
+            messages=_messages(system_prompt, "\n".join(user_prompt_parts)),
+            template=f"query.status.{status_category}",
+            fields={"ticket_number": ticket_number, "status": status_text, "name": customer_name},
+            fallback=f"Your ticket #{ticket.ticket_number} is currently marked as: {ticket.status}.",
+            ticket_number=ticket_number,
+        )
 
     # --------- Helpers --------- #
 
@@ -184,3 +258,10 @@ class QueryAgent:
         if m:
             return m.group(1)
         return None
+
+
+def _messages(system_prompt: str, user_prompt: str) -> Messages:
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
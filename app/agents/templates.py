@@ -0,0 +1,126 @@
+from pathlib import Path
+from string import Formatter
+from typing import Any, Dict, Optional
+import json
+import random
+import threading
+import zlib
+
+from config.settings import settings
+from app.logs.logger import logger
+
+# locale -> key -> variants, plus "labels": field -> raw value -> localized value
+Templates = Dict[str, Dict[str, Any]]
+
+# Replies rendered from templates vs sent to the LLM by sampling, for monitoring.
+_template_counts: Dict[str, int] = {"rendered": 0, "sampled_llm": 0}
+_counts_lock = threading.Lock()
+
+
+def _count(outcome: str) -> None:
+    with _counts_lock:
+        _template_counts[outcome] += 1
+
+
+def get_template_stats() -> Dict[str, int]:
+    with _counts_lock:
+        return dict(_template_counts)
+
+
+def _fields(template: str) -> set:
+    return {name for _, name, _, _ in Formatter().parse(template) if name}
+
+
+class ResponseTemplates:
+    """
+    Fixed-fact replies rendered locally instead of by the LLM.
+
+    Keys are "<route>.<situation>" (e.g. "query.status.resolved"), each with a
+    list of variants per locale. Only variants whose placeholders can all be
+    filled are used, preferring ones that address the customer by `{name}`
+    when a name is known. The variant is picked by hashing `seed` (normally
+    the message), so the same message always gets the same reply.
+
+    A locale may translate field values through its "labels" map (e.g. the
+    DB status "In Progress" -> "en curso"); a value missing from a field's
+    map leaves that field unfilled rather than rendering it untranslated.
+    """
+
+    def __init__(self, templates: Templates, default_locale: str = "en") -> None:
+        self.templates = templates
+        self.default_locale = default_locale
+
+    @classmethod
+    def load(cls, path: Path, default_locale: str = "en") -> "ResponseTemplates":
+        """Load a JSON template file; empty (LLM for everything) if it is missing or invalid."""
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                return cls(json.load(f), default_locale)
+        except Exception:
+            logger.exception(f"Could not load response templates from {path}")
+            return cls({}, default_locale)
+
+    def render(
+        self, key: str, seed: str, locale: Optional[str] = None, **fields: Optional[str]
+    ) -> Optional[str]:
+        """The rendered reply, or None when no variant fits."""
+        locale = locale or self.default_locale
+        variants = self.templates.get(locale, {}).get(key)
+        if variants is None:
+            locale = self.default_locale
+            variants = self.templates.get(locale, {}).get(key, [])
+        fields = self._localize(locale, fields)
+        available = {name for name, value in fields.items() if value}
+        usable = [v for v in variants if _fields(v) <= available]
+        if fields.get("name"):
+            usable = [v for v in usable if "name" in _fields(v)] or usable
+        else:
+            usable = [v for v in usable if "name" not in _fields(v)]
+        if not usable:
+            return None
+        variant = usable[zlib.crc32(seed.encode("utf-8")) % len(usable)]
+        return variant.format(**{name: fields[name] for name in _fields(variant)})
+
+    def _localize(
+        self, locale: str, fields: Dict[str, Optional[str]]
+    ) -> Dict[str, Optional[str]]:
+        labels = self.templates.get(locale, {}).get("labels", {})
+        return {
+            name: labels[name].get(value.lower()) if value and name in labels else value
+            for name, value in fields.items()
+        }
+
+
+_templates: Optional[ResponseTemplates] = None
+_templates_lock = threading.Lock()
+
+
+def get_response_templates() -> ResponseTemplates:
+    global _templates
+    if _templates is None:
+        with _templates_lock:
+            if _templates is None:
+                _templates = ResponseTemplates.load(
+                    Path(settings.response_templates_path), settings.response_locale
+                )
+    return _templates
+
+
+def templated_reply(
+    key: str, seed: str, locale: Optional[str] = None, **fields: Optional[str]
+) -> Optional[str]:
+    """
+    Template reply for `key` in `locale` (default `response_locale`), or None
+    when the LLM should write it: templates disabled, no variant fits, or the
+    request was sampled for the LLM (`response_template_llm_sample_rate`).
+    """
+    if not settings.response_templates_enabled:
+        return None
+    reply = get_response_templates().render(key, seed, locale, **fields)
+    if reply is None:
+        return None
+    if random.random() < settings.response_template_llm_sample_rate:
+        _count("sampled_llm")
+        return None
+    _count("rendered")
+    return reply
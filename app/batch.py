@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from app.db.dao import init_db
+from app.llm import close_async_session, llm_priority
+from app.logs.logger import logger
+from app.orchestrator import Orchestrator
+
+
+def _completed_lines(output_path: Path) -> int:
+    """
+    Count complete records already in `output_path`, dropping a partially
+    written last line. Output is written in input order, one record per input
+    line, so this is the input line offset to resume from.
+    """
+    if not output_path.exists():
+        return 0
+    data = output_path.read_bytes()
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        with output_path.open("r+b") as f:
+            f.truncate(end)
+    return data.count(b"\n", 0, end)
+
+
+def _parse_line(line: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Return (record, error); records need a "message" and may carry
+    id/session_id/customer_name/locale.
+    """
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError as exc:
+        return {}, f"invalid JSON: {exc}"
+    if not isinstance(record, dict) or not str(record.get("message") or "").strip():
+        return {}, "missing \"message\""
+    return record, None
+
+
+async def run_batch(
+    input_path: Path,
+    output_path: Path,
+    workers: int = 16,
+    max_in_flight: int = 64,
+    resume: bool = False,
+    orchestrator: Optional[Orchestrator] = None,
+) -> Dict[str, Any]:
+    """
+    Run every message in a JSONL file through `Orchestrator.handle_message_async`.
+
+    `workers` messages are processed concurrently and at most `max_in_flight`
+    lines are read but not yet written, however slow any one message is.
+    Results are written in input order, tagged with the input `id` and line
+    number; with `resume`, lines already in the output are skipped. LLM calls
+    run at "batch" priority, behind interactive traffic.
+
+    Returns per-route counts, latency and throughput.
+    """
+    orchestrator = orchestrator or Orchestrator()
+    max_in_flight = max(max_in_flight, workers)
+    start_line = _completed_lines(output_path) if resume else 0
+    if start_line:
+        logger.info(f"Resuming {input_path} at line {start_line}")
+
+    queue: "asyncio.Queue[Optional[Tuple[int, str]]]" = asyncio.Queue(maxsize=workers)
+    slots = asyncio.Semaphore(max_in_flight)
+    finished: Dict[int, Dict[str, Any]] = {}  # completed, waiting for earlier lines
+    next_line = start_line
+    latencies: Dict[str, List[float]] = {}
+    errors = 0
+
+    out = output_path.open("a" if resume else "w", encoding="utf-8")
+
+    def flush() -> None:
+        nonlocal next_line
+        while next_line in finished:
+            out.write(json.dumps(finished.pop(next_line), ensure_ascii=False) + "\n")
+            next_line += 1
+            slots.release()
+        out.flush()
+
+    async def produce() -> None:
+        with input_path.open(encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                if line_no < start_line:
+                    continue
+                await slots.acquire()
+                await queue.put((line_no, line))
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def work() -> None:
+        nonlocal errors
+        while (item := await queue.get()) is not None:
+            line_no, line = item
+            record, error = _parse_line(line)
+            started = time.perf_counter()
+            result: Dict[str, Any] = {}
+            if error is None:
+                session_id = record.get("session_id") or f"batch-{record.get('id', line_no)}"
+                try:
+                    result = await orchestrator.handle_message_async(
+                        message=record["message"],
+                        session_id=str(session_id),
+                        customer_name=record.get("customer_name"),
+                        locale=record.get("locale"),
+                    )
+                except Exception as exc:  # noqa: BLE001
+                    logger.exception(f"Batch line {line_no} failed")
+                    error = str(exc)
+            if error is not None:
+                result = {
+                    "response": None,
+                    "routed_agent": None,
+                    "success": False,
+                    "error_message": error,
+                }
+            latency_ms = (time.perf_counter() - started) * 1000
+
+            route = result.get("routed_agent") or "error"
+            latencies.setdefault(route, []).append(latency_ms)
+            errors += not result.get("success")
+            finished[line_no] = {
+                "id": record.get("id"),
+                "line": line_no,
+                **result,
+                "latency_ms": round(latency_ms, 1),
+            }
+            flush()
+
+    started = time.perf_counter()
+    try:
+        with llm_priority("batch"):  # the worker tasks inherit it
+            await asyncio.gather(produce(), *(work() for _ in range(workers)))
+    finally:
+        flush()
+        out.close()
+        await close_async_session()
+    elapsed = time.perf_counter() - started
+
+    processed = sum(len(v) for v in latencies.values())
+    return {
+        "resumed_at": start_line,
+        "processed": processed,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "messages_per_sec": processed / elapsed if elapsed else 0.0,
+        "routes": {
+            route: {
+                "count": len(values),
+                "messages_per_sec": len(values) / elapsed if elapsed else 0.0,
+                "mean_latency_ms": float(np.mean(values)),
+                "p95_latency_ms": float(np.percentile(values, 95)),
+            }
+            for route, values in sorted(latencies.items())
+        },
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    print(
+        f"{report['processed']} messages in {report['elapsed_s']:.1f}s "
+        f"({report['messages_per_sec']:.1f} msg/s, {report['errors']} errors"
+        + (f", resumed at line {report['resumed_at']}" if report["resumed_at"] else "")
+        + ")"
+    )
+    print(f"{'route':<28}{'count':>8}{'msg/s':>10}{'mean ms':>10}{'p95 ms':>10}")
+    for route, stats in report["routes"].items():
+        print(
+            f"{route:<28}{stats['count']:>8}{stats['messages_per_sec']:>10.1f}"
+            f"{stats['mean_latency_ms']:>10.0f}{stats['p95_latency_ms']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a JSONL file of messages through the bot (one JSON result per line)"
+    )
+    parser.add_argument("input", type=Path, help='JSONL with {"id", "message", ...} per line')
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--workers", type=int, default=settings.batch_workers)
+    parser.add_argument("--max-in-flight", type=int, default=settings.batch_max_in_flight)
+    parser.add_argument(
+        "--resume", action="store_true", help="skip input lines already in the output"
+    )
+    args = parser.parse_args()
+
+    init_db()
+    _print_report(
+        asyncio.run(
+            run_batch(
+                args.input,
+                args.output,
+                workers=args.workers,
+                max_in_flight=args.max_in_flight,
+                resume=args.resume,
+            )
+        )
+    )
@@ -1,18 +1,32 @@
-from typing import Optional, List
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, List, Sequence, Tuple
 
-from sqlalchemy import create_engine, select, delete
+from sqlalchemy import create_engine, select, delete, insert, update, func, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session
 
 from config.settings import settings
-from .models import Base, SupportTicket, AgentLog, SupportDocChunk
+from .models import (
+    Base,
+    SupportTicket,
+    AgentLog,
+    SupportDocChunk,
+    SupportDocChunkStaging,
+    SupportDocFile,
+    EmbeddingCacheEntry,
+    AnswerCacheEntry,
+    SupportDocIndexState,
+)
+from .migrations import run_migrations
 
 _engine = create_engine(settings.db_url, echo=False, future=True)
 SessionLocal = sessionmaker(bind=_engine, autoflush=False, autocommit=False, future=True)
 
 
 def init_db() -> None:
-    """Create tables if they don't exist."""
+    """Create tables if they don't exist and migrate legacy columns."""
     Base.metadata.create_all(bind=_engine)
+    run_migrations(_engine)
 
 
 def get_db_session() -> Session:
@@ -105,6 +119,21 @@ def get_recent_logs(limit: int = 50) -> List[AgentLog]:
         session.close()
 
 
+def get_classifier_training_rows(limit: int = 50000) -> List[Tuple[str, str]]:
+    """(user_message, classifier category) for successful, classified events."""
+    session = get_db_session()
+    try:
+        stmt = (
+            select(AgentLog.user_message, AgentLog.classifier)
+            .where(AgentLog.classifier.is_not(None), AgentLog.success.is_(True))
+            .order_by(AgentLog.timestamp.desc())
+            .limit(limit)
+        )
+        return [(message, category) for message, category in session.execute(stmt)]
+    finally:
+        session.close()
+
+
 # --------- SupportDocChunk operations (RAG) --------- #
 
 def clear_support_docs() -> None:
@@ -112,6 +141,7 @@ def clear_support_docs() -> None:
     session = get_db_session()
     try:
         session.execute(delete(SupportDocChunk))
+        session.execute(delete(SupportDocFile))
         session.commit()
     finally:
         session.close()
@@ -122,7 +152,9 @@ def add_support_doc_chunk(
     chunk_index: int,
     title: Optional[str],
     content: str,
-    embedding_json: str,
+    embedding: bytes,
+    embedding_dim: int,
+    embedding_model: str,
 ) -> SupportDocChunk:
     session = get_db_session()
     try:
@@ -131,7 +163,9 @@ def add_support_doc_chunk(
             chunk_index=chunk_index,
             title=title,
             content=content,
-            embedding=embedding_json,
+            embedding_vector=embedding,
+            embedding_dim=embedding_dim,
+            embedding_model=embedding_model,
         )
         session.add(chunk)
         session.commit()
@@ -148,3 +182,342 @@ def get_all_support_doc_chunks() -> List[SupportDocChunk]:
         return session.execute(stmt).scalars().all()
     finally:
         session.close()
+
+
+def get_support_doc_generation() -> int:
+    """Return the current support doc index generation (0 if never built)."""
+    session = get_db_session()
+    try:
+        state = session.get(SupportDocIndexState, 1)
+        return state.generation if state is not None else 0
+    finally:
+        session.close()
+
+
+def _bump_generation(session: Session) -> int:
+    state = session.get(SupportDocIndexState, 1)
+    if state is None:
+        state = SupportDocIndexState(id=1, generation=0)
+        session.add(state)
+    state.generation = (state.generation or 0) + 1
+    state.updated_at = datetime.utcnow()
+    return state.generation
+
+
+def bump_support_doc_generation() -> int:
+    """Increment the index generation so retrievers reload their in-memory index."""
+    session = get_db_session()
+    try:
+        generation = _bump_generation(session)
+        session.commit()
+        return generation
+    finally:
+        session.close()
+
+
+def get_support_doc_files() -> Dict[str, SupportDocFile]:
+    """Return the last ingested state of each knowledge base file, by doc_id."""
+    session = get_db_session()
+    try:
+        files = session.execute(select(SupportDocFile)).scalars().all()
+        return {f.doc_id: f for f in files}
+    finally:
+        session.close()
+
+
+def get_support_doc_ids() -> List[str]:
+    """Distinct doc_ids that currently have chunks in the index."""
+    session = get_db_session()
+    try:
+        stmt = select(SupportDocChunk.doc_id).distinct()
+        return list(session.execute(stmt).scalars().all())
+    finally:
+        session.close()
+
+
+def get_support_doc_chunks_for_docs(doc_ids: Sequence[str]) -> List[SupportDocChunk]:
+    if not doc_ids:
+        return []
+    session = get_db_session()
+    try:
+        stmt = select(SupportDocChunk).where(SupportDocChunk.doc_id.in_(list(doc_ids)))
+        return session.execute(stmt).scalars().all()
+    finally:
+        session.close()
+
+
+_STAGED_COLUMNS = (
+    "doc_id",
+    "chunk_index",
+    "title",
+    "content",
+    "embedding_vector",
+    "embedding_dim",
+    "embedding_model",
+    "content_hash",
+    "created_at",
+)
+
+
+def reset_support_doc_staging() -> None:
+    """Discard chunks staged by an earlier, unfinished ingest run."""
+    session = get_db_session()
+    try:
+        session.execute(delete(SupportDocChunkStaging))
+        session.commit()
+    finally:
+        session.close()
+
+
+def stage_support_doc_chunks(chunks: Sequence[Dict[str, Any]]) -> None:
+    """Bulk-insert a batch of new chunks (executemany) in one transaction."""
+    if not chunks:
+        return
+    session = get_db_session()
+    try:
+        session.execute(insert(SupportDocChunkStaging), list(chunks))
+        session.commit()
+    finally:
+        session.close()
+
+
+def publish_staged_support_docs(
+    files: Dict[str, Tuple[str, int]],
+    removed_doc_ids: Sequence[str] = (),
+) -> int:
+    """
+    Atomically replace the chunks of `files` ({doc_id: (file_hash, chunk_count)})
+    with the staged ones, drop `removed_doc_ids`, and bump the index generation.
+
+    Everything happens in one transaction, so readers see either the old or
+    the new index, never a partial one. Returns the new generation.
+    """
+    touched = list(files) + list(removed_doc_ids)
+    session = get_db_session()
+    try:
+        if touched:
+            session.execute(delete(SupportDocChunk).where(SupportDocChunk.doc_id.in_(touched)))
+            session.execute(delete(SupportDocFile).where(SupportDocFile.doc_id.in_(touched)))
+
+        staged = [getattr(SupportDocChunkStaging, col) for col in _STAGED_COLUMNS]
+        session.execute(
+            insert(SupportDocChunk).from_select(
+                list(_STAGED_COLUMNS),
+                select(*staged).order_by(SupportDocChunkStaging.id),
+            )
+        )
+        session.execute(delete(SupportDocChunkStaging))
+
+        if files:
+            session.execute(
+                insert(SupportDocFile),
+                [
+                    {"doc_id": doc_id, "content_hash": file_hash, "chunk_count": count}
+                    for doc_id, (file_hash, count) in files.items()
+                ],
+            )
+        generation = _bump_generation(session)
+        session.commit()
+        return generation
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+# --------- Embedding cache operations --------- #
+
+def get_cached_embeddings(
+    embedding_model: str, text_hashes: Sequence[str]
+) -> Dict[str, Tuple[bytes, int]]:
+    """Return {text_hash: (float32 bytes, dim)} for the hashes present in the cache."""
+    if not text_hashes:
+        return {}
+    session = get_db_session()
+    try:
+        stmt = select(
+            EmbeddingCacheEntry.text_hash,
+            EmbeddingCacheEntry.embedding_vector,
+            EmbeddingCacheEntry.embedding_dim,
+            EmbeddingCacheEntry.last_used_at,
+        ).where(
+            EmbeddingCacheEntry.embedding_model == embedding_model,
+            EmbeddingCacheEntry.text_hash.in_(list(text_hashes)),
+        )
+        rows = session.execute(stmt).all()
+
+        # Touch last_used_at at most hourly to keep reads mostly read-only.
+        now = datetime.utcnow()
+        stale = [
+            r.text_hash
+            for r in rows
+            if r.last_used_at is None or now - r.last_used_at > timedelta(hours=1)
+        ]
+        if stale:
+            session.execute(
+                update(EmbeddingCacheEntry)
+                .where(
+                    EmbeddingCacheEntry.embedding_model == embedding_model,
+                    EmbeddingCacheEntry.text_hash.in_(stale),
+                )
+                .values(last_used_at=now)
+            )
+            session.commit()
+        return {r.text_hash: (r.embedding_vector, r.embedding_dim) for r in rows}
+    finally:
+        session.close()
+
+
+def put_cached_embeddings(
+    embedding_model: str, entries: Dict[str, Tuple[bytes, int]]
+) -> None:
+    """Insert or refresh cache entries {text_hash: (float32 bytes, dim)}."""
+    if not entries:
+        return
+    session = get_db_session()
+    try:
+        now = datetime.utcnow()
+        for text_hash, (blob, dim) in entries.items():
+            session.merge(
+                EmbeddingCacheEntry(
+                    embedding_model=embedding_model,
+                    text_hash=text_hash,
+                    embedding_vector=blob,
+                    embedding_dim=dim,
+                    created_at=now,
+                    last_used_at=now,
+                )
+            )
+        session.commit()
+    except IntegrityError:
+        # A concurrent writer inserted the same key between merge's select and
+        # insert; its row holds the same embedding.
+        session.rollback()
+    finally:
+        session.close()
+
+
+def evict_embedding_cache(max_bytes: int) -> int:
+    """Delete least-recently-used cache entries until the vectors fit in max_bytes."""
+    session = get_db_session()
+    try:
+        total = session.execute(
+            select(func.coalesce(func.sum(EmbeddingCacheEntry.embedding_dim), 0))
+        ).scalar_one() * 4
+        if total <= max_bytes:
+            return 0
+
+        to_free = total - max_bytes
+        victims = []
+        stmt = select(
+            EmbeddingCacheEntry.embedding_model,
+            EmbeddingCacheEntry.text_hash,
+            EmbeddingCacheEntry.embedding_dim,
+        ).order_by(EmbeddingCacheEntry.last_used_at.asc())
+        for model, text_hash, dim in session.execute(stmt):
+            victims.append((model, text_hash))
+            to_free -= dim * 4
+            if to_free <= 0:
+                break
+
+        key = tuple_(EmbeddingCacheEntry.embedding_model, EmbeddingCacheEntry.text_hash)
+        for start in range(0, len(victims), 500):
+            session.execute(
+                delete(EmbeddingCacheEntry).where(key.in_(victims[start:start + 500]))
+            )
+        session.commit()
+        return len(victims)
+    finally:
+        session.close()
+
+
+# --------- Answer cache operations --------- #
+
+def get_answer_cache_entries(
+    embedding_model: str, generation: int, created_after: datetime, limit: int
+) -> List[AnswerCacheEntry]:
+    """Unexpired answers for this model and generation, newest `limit`, oldest first."""
+    session = get_db_session()
+    try:
+        stmt = (
+            select(AnswerCacheEntry)
+            .where(
+                AnswerCacheEntry.embedding_model == embedding_model,
+                AnswerCacheEntry.generation == generation,
+                AnswerCacheEntry.created_at >= created_after,
+            )
+            .order_by(AnswerCacheEntry.created_at.desc())
+            .limit(limit)
+        )
+        return list(reversed(session.execute(stmt).scalars().all()))
+    finally:
+        session.close()
+
+
+def put_answer_cache_entry(
+    embedding_model: str,
+    question_hash: str,
+    question: str,
+    embedding: bytes,
+    embedding_dim: int,
+    answer: str,
+    generation: int,
+    latency_ms: float,
+) -> None:
+    session = get_db_session()
+    try:
+        existing = session.get(AnswerCacheEntry, (embedding_model, question_hash))
+        if existing is not None and (existing.generation or 0) > generation:
+            return  # answered from a newer index by an up-to-date process
+        session.merge(
+            AnswerCacheEntry(
+                embedding_model=embedding_model,
+                question_hash=question_hash,
+                question=question,
+                embedding_vector=embedding,
+                embedding_dim=embedding_dim,
+                answer=answer,
+                generation=generation,
+                latency_ms=latency_ms,
+                created_at=datetime.utcnow(),
+            )
+        )
+        session.commit()
+    except IntegrityError:
+        # Same question answered concurrently; keep the first row.
+        session.rollback()
+    finally:
+        session.close()
+
+
+def delete_answer_cache_entries(embedding_model: str, question_hashes: Sequence[str]) -> None:
+    if not question_hashes:
+        return
+    session = get_db_session()
+    try:
+        session.execute(
+            delete(AnswerCacheEntry).where(
+                AnswerCacheEntry.embedding_model == embedding_model,
+                AnswerCacheEntry.question_hash.in_(list(question_hashes)),
+            )
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+def purge_answer_cache(generation: int, created_before: datetime) -> int:
+    """Delete answers from generations before `generation` or older than `created_before`."""
+    session = get_db_session()
+    try:
+        result = session.execute(
+            delete(AnswerCacheEntry).where(
+                (AnswerCacheEntry.generation < generation)
+                | (AnswerCacheEntry.created_at < created_before)
+            )
+        )
+        session.commit()
+        return result.rowcount or 0
+    finally:
+        session.close()
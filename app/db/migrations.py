@@ -0,0 +1,127 @@
+import hashlib
+import json
+
+import numpy as np
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from config.settings import settings
+from app.logs.logger import logger
+from .models import Base, SupportDocChunk
+
+_CHUNK_TABLE = SupportDocChunk.__tablename__
+_CHUNK_COLUMNS = (
+    "id, doc_id, chunk_index, title, content, embedding, created_at"
+)
+
+
+def _rebuild_chunk_table(engine: Engine) -> None:
+    """Recreate support_doc_chunks with the current schema, keeping its rows.
+
+    SQLite cannot relax the old NOT NULL on `embedding` or add several columns
+    in one statement, so the table is renamed, recreated and copied over.
+    """
+    legacy = f"{_CHUNK_TABLE}_legacy"
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {_CHUNK_TABLE} RENAME TO {legacy}"))
+        Base.metadata.create_all(bind=conn, tables=[SupportDocChunk.__table__])
+        conn.execute(
+            text(
+                f"INSERT INTO {_CHUNK_TABLE} ({_CHUNK_COLUMNS}) "
+                f"SELECT {_CHUNK_COLUMNS} FROM {legacy}"
+            )
+        )
+        conn.execute(text(f"DROP TABLE {legacy}"))
+    logger.info(f"Rebuilt {_CHUNK_TABLE} with binary embedding columns")
+
+
+def migrate_support_doc_embeddings(engine: Engine) -> int:
+    """
+    Convert JSON-text chunk embeddings into little-endian float32 bytes.
+
+    Safe to call repeatedly: rows that already have `embedding_vector` are
+    left alone. Returns the number of rows converted.
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(_CHUNK_TABLE):
+        return 0
+
+    columns = {col["name"] for col in inspector.get_columns(_CHUNK_TABLE)}
+    if "embedding_vector" not in columns:
+        _rebuild_chunk_table(engine)
+
+    converted = 0
+    with engine.begin() as conn:
+        rows = conn.execute(
+            text(
+                f"SELECT id, embedding FROM {_CHUNK_TABLE} "
+                "WHERE embedding_vector IS NULL AND embedding IS NOT NULL"
+            )
+        ).all()
+        for row_id, embedding_json in rows:
+            vec = np.asarray(json.loads(embedding_json), dtype="<f4")
+            conn.execute(
+                text(
+                    f"UPDATE {_CHUNK_TABLE} SET embedding_vector = :vec, "
+                    "embedding_dim = :dim, embedding_model = :model, "
+                    "embedding = NULL WHERE id = :id"
+                ),
+                {
+                    "vec": vec.tobytes(),
+                    "dim": int(vec.shape[0]),
+                    "model": settings.embedding_model,
+                    "id": row_id,
+                },
+            )
+            converted += 1
+
+    if converted:
+        logger.info(
+            f"Converted {converted} support doc embeddings to float32 bytes "
+            f"(assumed model {settings.embedding_model})"
+        )
+        if engine.dialect.name == "sqlite":
+            # Reclaim the pages freed by dropping the JSON text.
+            with engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as conn:
+                conn.execute(text("VACUUM"))
+    return converted
+
+
+def migrate_support_doc_hashes(engine: Engine) -> int:
+    """Add and backfill `content_hash` so incremental ingest can reuse embeddings."""
+    inspector = inspect(engine)
+    if not inspector.has_table(_CHUNK_TABLE):
+        return 0
+
+    columns = {col["name"] for col in inspector.get_columns(_CHUNK_TABLE)}
+    with engine.begin() as conn:
+        if "content_hash" not in columns:
+            conn.execute(
+                text(f"ALTER TABLE {_CHUNK_TABLE} ADD COLUMN content_hash VARCHAR(64)")
+            )
+        rows = conn.execute(
+            text(f"SELECT id, content FROM {_CHUNK_TABLE} WHERE content_hash IS NULL")
+        ).all()
+        for row_id, content in rows:
+            conn.execute(
+                text(f"UPDATE {_CHUNK_TABLE} SET content_hash = :hash WHERE id = :id"),
+                {"hash": hashlib.sha256(content.encode("utf-8")).hexdigest(), "id": row_id},
+            )
+
+    if rows:
+        logger.info(f"Backfilled content_hash for {len(rows)} support doc chunks")
+    return len(rows)
+
+
+def run_migrations(engine: Engine) -> None:
+    """Apply all in-place schema/data migrations; each is a no-op once done."""
+    migrate_support_doc_embeddings(engine)
+    migrate_support_doc_hashes(engine)
+
+
+if __name__ == "__main__":
+    from .dao import init_db
+
+    init_db()
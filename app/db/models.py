@@ -6,6 +6,8 @@ from sqlalchemy import (
     DateTime,
     Boolean,
     Text,
+    LargeBinary,
+    Float,
 )
 from sqlalchemy.orm import declarative_base
 
@@ -54,8 +56,97 @@ class SupportDocChunk(Base):
     chunk_index = Column(Integer, nullable=False)
     title = Column(String(255), nullable=True)
     content = Column(Text, nullable=False)
-    embedding = Column(Text, nullable=False)  # JSON-encoded list[float]
+    embedding = Column(Text, nullable=True)  # legacy JSON-encoded list[float]
+    embedding_vector = Column(LargeBinary, nullable=True)  # little-endian float32 bytes
+    embedding_dim = Column(Integer, nullable=True)
+    embedding_model = Column(String(128), nullable=True)
+    content_hash = Column(String(64), nullable=True)  # sha256 of content
     created_at = Column(DateTime, default=datetime.utcnow)
 
     def __repr__(self) -> str:
         return f"<SupportDocChunk(doc_id={self.doc_id}, chunk_index={self.chunk_index})>"
+
+
+class SupportDocChunkStaging(Base):
+    """New chunks written batch by batch during ingest, then published atomically."""
+
+    __tablename__ = "support_doc_chunks_staging"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    doc_id = Column(String(255), nullable=False)
+    chunk_index = Column(Integer, nullable=False)
+    title = Column(String(255), nullable=True)
+    content = Column(Text, nullable=False)
+    embedding_vector = Column(LargeBinary, nullable=False)
+    embedding_dim = Column(Integer, nullable=False)
+    embedding_model = Column(String(128), nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<SupportDocChunkStaging(doc_id={self.doc_id}, chunk_index={self.chunk_index})>"
+
+
+class SupportDocFile(Base):
+    """Last ingested version of a knowledge base file, for incremental refresh."""
+
+    __tablename__ = "support_doc_files"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    doc_id = Column(String(255), unique=True, nullable=False)
+    content_hash = Column(String(64), nullable=False)  # sha256 of model + file bytes
+    chunk_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<SupportDocFile(doc_id={self.doc_id}, chunks={self.chunk_count})>"
+
+
+class EmbeddingCacheEntry(Base):
+    """Persistent embedding cache keyed by (model, sha256 of normalised text)."""
+
+    __tablename__ = "embedding_cache"
+
+    embedding_model = Column(String(128), primary_key=True)
+    text_hash = Column(String(64), primary_key=True)
+    embedding_vector = Column(LargeBinary, nullable=False)  # little-endian float32 bytes
+    embedding_dim = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self) -> str:
+        return f"<EmbeddingCacheEntry(model={self.embedding_model}, hash={self.text_hash[:8]})>"
+
+
+class AnswerCacheEntry(Base):
+    """Persisted KnowledgeAgent answer for the semantic answer cache."""
+
+    __tablename__ = "answer_cache"
+
+    embedding_model = Column(String(128), primary_key=True)
+    question_hash = Column(String(64), primary_key=True)  # sha256 of normalised question
+    question = Column(Text, nullable=False)
+    embedding_vector = Column(LargeBinary, nullable=False)  # little-endian float32 bytes
+    embedding_dim = Column(Integer, nullable=False)
+    answer = Column(Text, nullable=False)
+    generation = Column(Integer, nullable=False)  # support doc generation answered from
+    latency_ms = Column(Float, nullable=False, default=0.0)  # cost of the original answer
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"<AnswerCacheEntry(hash={self.question_hash[:8]}, generation={self.generation})>"
+        )
+
+
+class SupportDocIndexState(Base):
+    """Single-row table holding the support doc index generation counter."""
+
+    __tablename__ = "support_doc_index_state"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self) -> str:
+        return f"<SupportDocIndexState(generation={self.generation})>"
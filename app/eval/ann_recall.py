@@ -0,0 +1,106 @@
+import argparse
+import time
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from config.settings import settings
+from app.db.dao import init_db
+from app.rag.ann import IVFIndex
+from app.rag.index import SupportDocIndex
+
+
+def synthetic_matrix(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, roughly shaped like a topical document corpus."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    matrix = centers[rng.integers(clusters, size=rows)] + 0.6 * rng.normal(size=(rows, dim))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix.astype(np.float32)
+
+
+def recall_report(
+    index: SupportDocIndex,
+    nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+    top_k: int = 4,
+    n_queries: int = 200,
+    n_lists: int = 0,
+    seed: int = 0,
+) -> List[Dict[str, float]]:
+    """
+    Compare IVF search against exact search on the same index.
+
+    Queries are perturbed copies of random chunk vectors. Returns one row per
+    nprobe with recall@k, mean latency and the fraction of rows scanned.
+    """
+    rng = np.random.default_rng(seed)
+    n, dim = index.matrix.shape
+    picks = rng.integers(n, size=n_queries)
+    queries = index.matrix[picks] + 0.05 * rng.normal(size=(n_queries, dim)).astype(np.float32)
+
+    ann = index.ann or IVFIndex.build(index.matrix, n_lists=n_lists, seed=seed)
+    index.ann = ann
+
+    start = time.perf_counter()
+    truth = [{row for row, _ in index.search_rows(q, top_k, exact=True)} for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / n_queries
+
+    report = [{"nprobe": 0, "recall": 1.0, "latency_ms": exact_ms, "scanned": 1.0}]
+    for nprobe in nprobes:
+        if nprobe > ann.n_lists:
+            break
+        ann.nprobe = nprobe
+        hits = 0
+        scanned = 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            found = {row for row, _ in index.search_rows(q, top_k)}
+            hits += len(found & expected)
+        latency_ms = (time.perf_counter() - start) * 1000 / n_queries
+        for q in queries:
+            scanned += ann.candidates(q / np.linalg.norm(q)).shape[0]
+        report.append(
+            {
+                "nprobe": nprobe,
+                "recall": hits / (len(queries) * min(top_k, n)),
+                "latency_ms": latency_ms,
+                "scanned": scanned / (n_queries * n),
+            }
+        )
+    return report
+
+
+def run_ann_recall_report(top_k: int = 4, synthetic_rows: int = 0, n_lists: int = 0) -> None:
+    if synthetic_rows:
+        matrix = synthetic_matrix(synthetic_rows, dim=256, clusters=max(8, synthetic_rows // 500))
+        index = SupportDocIndex(matrix, [""] * synthetic_rows, [""] * synthetic_rows)
+    else:
+        from app.rag.retriever import get_support_doc_index
+
+        init_db()
+        index = get_support_doc_index()
+    if len(index) == 0:
+        print("Support doc index is empty; run `python -m app.rag.ingest` first.")
+        return
+
+    n_lists = n_lists or settings.rag_ivf_lists
+    report = recall_report(index, top_k=top_k, n_lists=n_lists)
+    print(f"Rows: {len(index)}  dim: {index.matrix.shape[1]}  IVF lists: {index.ann.n_lists}")
+    print(f"{'nprobe':>8} {f'recall@{top_k}':>10} {'ms/query':>10} {'scanned':>9}")
+    for row in report:
+        label = "exact" if row["nprobe"] == 0 else str(row["nprobe"])
+        print(
+            f"{label:>8} {row['recall']:>10.3f} {row['latency_ms']:>10.3f} "
+            f"{row['scanned']:>8.1%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF recall@k vs exact search")
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--lists", type=int, default=0, help="IVF lists (0 = sqrt(rows))")
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="benchmark N synthetic rows instead of the KB"
+    )
+    args = parser.parse_args()
+    run_ann_recall_report(top_k=args.top_k, synthetic_rows=args.synthetic, n_lists=args.lists)
@@ -4,6 +4,7 @@ from typing import Dict, Any, List
 
 from app.orchestrator import Orchestrator
 from app.db.dao import init_db
+from app.llm import llm_priority
 
 
 def load_test_cases(path: str | Path) -> List[Dict[str, Any]]:
@@ -12,6 +13,7 @@ def load_test_cases(path: str | Path) -> List[Dict[str, Any]]:
         return json.load(f)
 
 
+@llm_priority("eval")
 def run_evaluation(test_cases_path: str = "app/eval/test_cases.json") -> None:
     init_db()
     orchestrator = Orchestrator()
@@ -0,0 +1,135 @@
+import argparse
+import hashlib
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.agents.classifier_agent import _keyword_fallback
+
+_EMBEDDING_DIM = 1536
+_MESSAGE_RE = re.compile(r"Message:\n(.*?)\n\n", re.DOTALL)
+
+
+def _fake_classification(user_prompt: str) -> str:
+    """Keyword-classify the message(s) in a classifier prompt."""
+    for block in user_prompt.split("\n\n"):
+        if block.startswith("["):  # ClassifierAgent.classify_many batch
+            items = json.loads(block)
+            return json.dumps(
+                [{"id": item["id"], **_keyword_fallback(item["text"])} for item in items]
+            )
+    m = _MESSAGE_RE.search(user_prompt)
+    result: Dict[str, Any] = _keyword_fallback(m.group(1) if m else user_prompt)
+    if result["category"] == "positive_feedback":
+        result["reply"] = "Thank you for your kind words!"
+    elif result["category"] == "negative_feedback":
+        result["reply"] = "We're sorry to hear that. Ticket #[TICKET_NUMBER] has been opened."
+    else:
+        result["reply"] = None
+    return json.dumps(result)
+
+
+def _fake_reply(messages: List[Dict[str, str]]) -> str:
+    system_prompt = messages[0]["content"] if messages else ""
+    user_prompt = messages[-1]["content"] if messages else ""
+    if system_prompt.startswith("You are a classifier"):
+        return _fake_classification(user_prompt)
+    digest = hashlib.sha1(user_prompt.encode("utf-8")).hexdigest()[:8]
+    return f"This is a canned reply ({digest}) from the fake OpenAI server."
+
+
+def _fake_embedding(text: str) -> List[float]:
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(_EMBEDDING_DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Chat completion (plain and streamed) and embedding endpoints with fixed latency."""
+
+    latency_s = 0.0
+
+    def log_message(self, format: str, *args: Any) -> None:  # quiet
+        pass
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.latency_s)
+
+        if self.path.endswith("/chat/completions"):
+            content = _fake_reply(body.get("messages", []))
+            if body.get("stream"):
+                self._send_stream(content)
+                return
+            self._send_json(
+                {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "model": body.get("model"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                }
+            )
+        elif self.path.endswith("/embeddings"):
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self._send_json(
+                {
+                    "object": "list",
+                    "model": body.get("model"),
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": _fake_embedding(text)}
+                        for i, text in enumerate(inputs)
+                    ],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                }
+            )
+        else:
+            self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for word in re.findall(r"\S+\s*", content):
+            chunk = {"choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def serve(host: str = "127.0.0.1", port: int = 8089, latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    """Create (not start) a fake server; call `serve_forever()` on the result."""
+    handler = type("Handler", (FakeOpenAIHandler,), {"latency_s": latency_ms / 1000})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Local fake OpenAI API (point OPENAI_API_BASE at http://HOST:PORT/v1)"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="delay per request")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency_ms)
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1 ({args.latency_ms:.0f} ms latency)")
+    server.serve_forever()
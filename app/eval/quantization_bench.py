@@ -0,0 +1,120 @@
+import argparse
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.db.dao import init_db
+from app.eval.ann_recall import synthetic_matrix
+from app.rag.index import SupportDocIndex, truncate_rows
+from app.rag.quantization import QuantizedMatrix
+
+
+def benchmark_quantization(
+    index: SupportDocIndex,
+    top_k: int = 4,
+    n_queries: int = 200,
+    rescore_factor: int = 8,
+    seed: int = 0,
+    dims: Sequence[int] = (),
+) -> List[Dict[str, float]]:
+    """
+    Compare exact float32 search with float16 and int8 first passes plus
+    exact rescoring: resident first-pass memory, latency and recall@k.
+
+    Each entry in `dims` adds truncated-vector rows, scored alone and with a
+    full-dimension rerank of the shortlist.
+    """
+    rng = np.random.default_rng(seed)
+    n, dim = index.matrix.shape
+    queries = index.matrix[rng.integers(n, size=n_queries)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+
+    index.ann = None
+    index.quantized = None
+    truth = [{row for row, _ in index.search_rows(q, top_k, exact=True)} for q in queries]
+
+    def measure(label: str, search: SupportDocIndex, memory_bytes: int) -> None:
+        hits = 0
+        start = time.perf_counter()
+        for q, expected in zip(queries, truth):
+            hits += len({row for row, _ in search.search_rows(q, top_k)} & expected)
+        report.append(
+            {
+                "mode": label,
+                "memory_mb": memory_bytes / 1e6,
+                "latency_ms": (time.perf_counter() - start) * 1000 / n_queries,
+                "recall": hits / (n_queries * min(top_k, n)),
+            }
+        )
+
+    report: List[Dict[str, float]] = []
+    index.rescore_factor = rescore_factor
+    for mode in (None, "float16", "int8"):
+        index.quantized = QuantizedMatrix.build(index.matrix, mode) if mode else None
+        measure(
+            mode or "float32 (exact)",
+            index,
+            index.quantized.nbytes if mode else n * dim * 4,
+        )
+    index.quantized = None
+
+    for d in dims:
+        if not 0 < d < dim:
+            continue
+        reduced = truncate_rows(index.matrix, d)
+        measure(f"dims={d}", SupportDocIndex(reduced, index.titles, index.contents), reduced.nbytes)
+        index.reduced = reduced
+        measure(f"dims={d} +rerank", index, reduced.nbytes)
+        index.reduced = None
+    return report
+
+
+def run_quantization_benchmark(
+    top_k: int = 4,
+    synthetic_rows: int = 0,
+    rescore_factor: int = 8,
+    dims: Sequence[int] = (),
+) -> None:
+    index: Optional[SupportDocIndex]
+    if synthetic_rows:
+        matrix = synthetic_matrix(synthetic_rows, dim=1536, clusters=max(8, synthetic_rows // 500))
+        index = SupportDocIndex(matrix, [""] * synthetic_rows, [""] * synthetic_rows)
+    else:
+        from app.rag.retriever import get_support_doc_index
+
+        init_db()
+        index = get_support_doc_index()
+    if len(index) == 0:
+        print("Support doc index is empty; run `python -m app.rag.ingest` first.")
+        return
+
+    n, dim = index.matrix.shape
+    print(f"Rows: {n}  dim: {dim}  (float64 per-row baseline would hold {n * dim * 8 / 1e6:.1f} MB)")
+    print(f"{'mode':>16} {'first-pass MB':>14} {'ms/query':>10} {f'recall@{top_k}':>10}")
+    for row in benchmark_quantization(
+        index, top_k=top_k, rescore_factor=rescore_factor, dims=dims
+    ):
+        print(
+            f"{row['mode']:>16} {row['memory_mb']:>14.1f} {row['latency_ms']:>10.3f} "
+            f"{row['recall']:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantized index memory/latency/recall")
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--rescore-factor", type=int, default=8)
+    parser.add_argument(
+        "--synthetic", type=int, default=0, help="benchmark N synthetic rows instead of the KB"
+    )
+    parser.add_argument(
+        "--dims", type=int, nargs="*", default=[], help="also benchmark truncated vectors"
+    )
+    args = parser.parse_args()
+    run_quantization_benchmark(
+        top_k=args.top_k,
+        synthetic_rows=args.synthetic,
+        rescore_factor=args.rescore_factor,
+        dims=args.dims,
+    )
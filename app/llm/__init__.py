@@ -0,0 +1,31 @@
+from .breaker import CircuitOpenError, get_breaker_stats, llm_available
+from .gateway import (
+    Messages,
+    chat_completion,
+    chat_completion_async,
+    chat_completion_stream,
+    close_async_session,
+    create_chat_completion,
+    create_embeddings,
+    get_llm_stats,
+    stream_reply,
+)
+from .scheduler import PRIORITIES, get_rate_limiter_stats, llm_priority
+
+__all__ = [
+    "CircuitOpenError",
+    "Messages",
+    "PRIORITIES",
+    "chat_completion",
+    "chat_completion_async",
+    "chat_completion_stream",
+    "close_async_session",
+    "create_chat_completion",
+    "create_embeddings",
+    "get_breaker_stats",
+    "get_llm_stats",
+    "get_rate_limiter_stats",
+    "llm_available",
+    "llm_priority",
+    "stream_reply",
+]
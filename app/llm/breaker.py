@@ -0,0 +1,157 @@
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+import threading
+import time
+
+from config.settings import settings
+from app.logs.logger import logger
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+    def __init__(self, model: str) -> None:
+        super().__init__(f"Circuit breaker open for {model}; not calling the API")
+        self.model = model
+
+
+class CircuitBreaker:
+    """
+    Per-model circuit breaker.
+
+    Closed: calls go through and their outcomes fill a rolling window. Once it
+    holds `min_calls` outcomes, the breaker opens if the share of failed calls
+    reaches `error_rate` or the share slower than `latency_slo_ms` reaches
+    `slow_rate`. Open: calls fail immediately with CircuitOpenError. After
+    `open_seconds` one probe call is let through (half-open); it closes the
+    breaker if it succeeds within the SLO and reopens it otherwise.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_rate: float = 0.5,
+        latency_slo_ms: float = 10000.0,
+        open_seconds: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.latency_slo_ms = latency_slo_ms
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.times_opened = 0
+        self.rejected = 0
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected (open and not yet due for a probe)."""
+        with self._lock:
+            return (
+                self.state == "open"
+                and time.monotonic() - self._opened_at < self.open_seconds
+            )
+
+    def acquire(self) -> None:
+        """Admit a call or raise CircuitOpenError. Every admitted call must `record`."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name)
+                self._probing = True
+
+    def record(self, failed: bool, latency_ms: float) -> None:
+        slow = latency_ms > self.latency_slo_ms
+        with self._lock:
+            if self.state == "half_open":
+                self._probing = False
+                if failed or slow:
+                    self._open("probe failed")
+                else:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                    logger.info(f"Circuit breaker for {self.name} closed")
+                return
+            if self.state != "closed":
+                return  # a call admitted before the breaker opened
+
+            self._outcomes.append((failed, slow))
+            n = len(self._outcomes)
+            if n < self.min_calls:
+                return
+            errors = sum(f for f, _ in self._outcomes) / n
+            slow_share = sum(s for _, s in self._outcomes) / n
+            if errors >= self.error_rate:
+                self._open(f"error rate {errors:.0%}")
+            elif slow_share >= self.slow_rate:
+                self._open(f"{slow_share:.0%} of calls over {self.latency_slo_ms:.0f} ms")
+
+    def _open(self, reason: str) -> None:
+        """Holds the lock."""
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+        logger.warning(
+            f"Circuit breaker for {self.name} opened ({reason}); "
+            f"failing fast for {self.open_seconds:.0f}s"
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            n = len(self._outcomes)
+            return {
+                "state": self.state,
+                "error_rate": sum(f for f, _ in self._outcomes) / n if n else 0.0,
+                "slow_rate": sum(s for _, s in self._outcomes) / n if n else 0.0,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> Optional[CircuitBreaker]:
+    """The process-wide breaker for `model`, or None when breakers are disabled."""
+    if not settings.llm_breaker_enabled:
+        return None
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(
+                model,
+                window=settings.llm_breaker_window,
+                min_calls=settings.llm_breaker_min_calls,
+                error_rate=settings.llm_breaker_error_rate,
+                slow_rate=settings.llm_breaker_slow_rate,
+                latency_slo_ms=settings.llm_breaker_latency_slo_ms,
+                open_seconds=settings.llm_breaker_open_seconds,
+            )
+        return breaker
+
+
+def llm_available(model: str) -> bool:
+    """False while `model`'s breaker is open, so callers can skip straight to a fallback."""
+    breaker = get_breaker(model)
+    return breaker is None or not breaker.is_open()
+
+
+def get_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {model: breaker.stats() for model, breaker in sorted(breakers.items())}
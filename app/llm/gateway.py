@@ -0,0 +1,494 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Generator, Iterator, List, Optional, Tuple
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import aiohttp
+import numpy as np
+import openai
+import requests
+
+from config.settings import settings
+from app.logs.logger import logger
+from app.tokens import estimate_tokens
+from .breaker import CircuitBreaker, CircuitOpenError, get_breaker
+from .scheduler import RateLimiter, get_rate_limiter
+
+Messages = List[Dict[str, str]]
+
+_RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.ServiceUnavailableError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+)
+# Errors that count against a model's circuit breaker. openai does not wrap
+# connection errors and read timeouts raised while a stream is being read.
+_BREAKER_ERRORS = _RETRYABLE_ERRORS + (
+    openai.error.APIError,
+    requests.exceptions.RequestException,
+    aiohttp.ClientError,
+)
+# Completion size assumed for rate limiting when the call sets no max_tokens.
+_COMPLETION_TOKENS_ESTIMATE = 256
+
+
+# --------- Metrics --------- #
+
+@dataclass
+class _RouteStats:
+    calls: int = 0
+    errors: int = 0
+    retries: int = 0
+    rejected: int = 0  # failed fast by the circuit breaker
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latencies_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))
+    ttft_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))  # streams only
+
+
+_stats: Dict[str, _RouteStats] = {}
+_stats_lock = threading.Lock()
+
+
+def _record(
+    route: str,
+    latency_ms: Optional[float] = None,
+    response: Any = None,
+    error: bool = False,
+    retry: bool = False,
+    rejected: bool = False,
+    ttft_ms: Optional[float] = None,
+) -> None:
+    usage = response.get("usage") if isinstance(response, dict) else None
+    with _stats_lock:
+        stats = _stats.setdefault(route, _RouteStats())
+        if retry:
+            stats.retries += 1
+            return
+        if rejected:
+            stats.rejected += 1
+            return
+        stats.calls += 1
+        stats.errors += error
+        if latency_ms is not None:
+            stats.latencies_ms.append(latency_ms)
+        if ttft_ms is not None:
+            stats.ttft_ms.append(ttft_ms)
+        if usage:
+            stats.prompt_tokens += usage.get("prompt_tokens") or 0
+            stats.completion_tokens += usage.get("completion_tokens") or 0
+
+
+def get_llm_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Per-route call, error, retry and breaker-rejection counts, latency
+    percentiles (whole call; streams until fully read), time to first token of
+    streams and token usage.
+    """
+    with _stats_lock:
+        snapshot = {
+            route: (s, list(s.latencies_ms), list(s.ttft_ms)) for route, s in _stats.items()
+        }
+        report: Dict[str, Dict[str, float]] = {}
+        for route, (s, latencies, ttfts) in sorted(snapshot.items()):
+            p50, p95 = np.percentile(latencies, [50, 95]) if latencies else (0.0, 0.0)
+            ttft_p50 = float(np.percentile(ttfts, 50)) if ttfts else 0.0
+            report[route] = {
+                "calls": s.calls,
+                "errors": s.errors,
+                "retries": s.retries,
+                "rejected": s.rejected,
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "ttft_p50_ms": ttft_p50,
+                "prompt_tokens": s.prompt_tokens,
+                "completion_tokens": s.completion_tokens,
+            }
+    return report
+
+
+# --------- Retry policy --------- #
+
+class _RetryBudget:
+    """
+    Allows retries up to `ratio` of recent requests (banked up to `max_tokens`),
+    so an outage does not multiply load on the API by the retry count.
+    """
+
+    def __init__(self, ratio: float, max_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+
+_budget = _RetryBudget(settings.llm_retry_budget_ratio)
+
+
+def _retry_delay(err: Exception, attempt: int) -> float:
+    """Retry-After when the API sends one, else capped exponential backoff with jitter."""
+    headers = getattr(err, "headers", None) or {}
+    retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def _may_retry(err: Exception, route: str, attempt: int, max_retries: Optional[int]) -> bool:
+    # Callers that pass max_retries (bulk ingest) set their own policy and do
+    # not draw on the shared budget meant for interactive traffic.
+    limit = settings.llm_max_retries if max_retries is None else max_retries
+    if attempt >= limit or (max_retries is None and not _budget.withdraw()):
+        return False
+    _record(route, retry=True)
+    logger.warning(
+        f"LLM call on route {route} failed ({type(err).__name__}); retry {attempt + 1}/{limit}"
+    )
+    return True
+
+
+# --------- Connections and timeouts --------- #
+
+_session_lock = threading.Lock()
+_aio_sessions: "weakref.WeakKeyDictionary[Any, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+_timeouts: Optional[Dict[str, float]] = None
+
+
+def _ensure_requests_session() -> None:
+    """Share one keep-alive connection pool across all threads' sync calls."""
+    if isinstance(openai.requestssession, requests.Session):
+        return
+    with _session_lock:
+        if isinstance(openai.requestssession, requests.Session):
+            return
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4, pool_maxsize=settings.llm_pool_size, max_retries=0
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        openai.requestssession = session
+
+
+def _aiohttp_session() -> aiohttp.ClientSession:
+    """One pooled aiohttp session per event loop (openai 0.28 otherwise opens one per call)."""
+    loop = asyncio.get_running_loop()
+    session = _aio_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=settings.llm_pool_size)
+        )
+        _aio_sessions[loop] = session
+    return session
+
+
+async def close_async_session() -> None:
+    """Close the current event loop's pooled session (call before the loop ends)."""
+    session = _aio_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def route_timeout(route: str) -> float:
+    """Request timeout for `route` from LLM_ROUTE_TIMEOUTS, else LLM_TIMEOUT_S."""
+    global _timeouts
+    if _timeouts is None:
+        parsed: Dict[str, float] = {}
+        for item in settings.llm_route_timeouts.split(","):
+            name, _, value = item.partition("=")
+            if name.strip() and value.strip():
+                parsed[name.strip()] = float(value)
+        _timeouts = parsed
+    return _timeouts.get(route, settings.llm_timeout_s)
+
+
+def _request_kwargs(route: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "request_timeout": route_timeout(route),
+        "api_key": settings.openai_api_key or None,
+        **kwargs,
+    }
+
+
+# --------- Rate limiting --------- #
+
+def _estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Tokens a call will count against the TPM limit, before it is sent."""
+    if "input" in kwargs:
+        return sum(estimate_tokens(text) for text in kwargs["input"])
+    messages = kwargs.get("messages") or []
+    prompt = sum(4 + estimate_tokens(m.get("content") or "") for m in messages)
+    return prompt + (kwargs.get("max_tokens") or _COMPLETION_TOKENS_ESTIMATE)
+
+
+def _on_retryable_error(limiter: Optional[RateLimiter], err: Exception, attempt: int) -> float:
+    """The retry delay; a 429 also holds every other call to the model for that long."""
+    delay = _retry_delay(err, attempt)
+    if limiter is not None and isinstance(err, openai.error.RateLimitError):
+        limiter.pause(delay)
+    return delay
+
+
+def _settle(limiter: Optional[RateLimiter], estimated: int, response: Any) -> None:
+    usage = response.get("usage") if isinstance(response, dict) else None
+    if limiter is not None and usage and usage.get("total_tokens"):
+        limiter.settle(estimated - usage["total_tokens"])
+
+
+# --------- Calls --------- #
+
+Finish = Callable[..., None]
+
+
+def _call(
+    route: str, create: Callable[..., Any], max_retries: Optional[int] = None, **kwargs: Any
+) -> Any:
+    response, finish = _send(route, create, max_retries, kwargs)
+    finish()
+    return response
+
+
+def _send(
+    route: str, create: Callable[..., Any], max_retries: Optional[int], kwargs: Dict[str, Any]
+) -> Tuple[Any, Finish]:
+    """
+    Send a request, with retries. Returns the response and a `finish(error=None,
+    first_token_at=None)` that records the outcome; streams call it once read
+    to the end (or on failure), so breaker and latency cover the whole stream.
+    """
+    _ensure_requests_session()
+    kwargs = _request_kwargs(route, kwargs)
+    breaker = _admit(route, kwargs["model"])
+    limiter = get_rate_limiter(kwargs["model"])
+    tokens = _estimate_tokens(kwargs) if limiter is not None else 0
+    if max_retries is None:
+        _budget.deposit()
+    attempt = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            if limiter is not None:
+                start += limiter.acquire(tokens)  # time queued is not API latency
+            try:
+                response = create(**kwargs)
+                break
+            except _RETRYABLE_ERRORS as err:
+                delay = _on_retryable_error(limiter, err, attempt)
+                if not _may_retry(err, route, attempt, max_retries):
+                    raise
+                time.sleep(delay)
+                attempt += 1
+    except BaseException as err:
+        _finish(route, breaker, start, error=err)
+        raise
+
+    def finish(
+        error: Optional[BaseException] = None, first_token_at: Optional[float] = None
+    ) -> None:
+        if error is None:
+            _settle(limiter, tokens, response)
+        ttft_ms = (first_token_at - start) * 1000 if first_token_at is not None else None
+        _finish(route, breaker, start, response=response, error=error, ttft_ms=ttft_ms)
+
+    return response, finish
+
+
+async def _acall(
+    route: str, create: Callable[..., Any], max_retries: Optional[int] = None, **kwargs: Any
+) -> Any:
+    kwargs = _request_kwargs(route, kwargs)
+    breaker = _admit(route, kwargs["model"])
+    limiter = get_rate_limiter(kwargs["model"])
+    tokens = _estimate_tokens(kwargs) if limiter is not None else 0
+    if max_retries is None:
+        _budget.deposit()
+    token = openai.aiosession.set(_aiohttp_session())
+    attempt = 0
+    start = time.perf_counter()
+    try:
+        while True:
+            if limiter is not None:
+                start += await limiter.acquire_async(tokens)
+            try:
+                response = await create(**kwargs)
+                break
+            except _RETRYABLE_ERRORS as err:
+                delay = _on_retryable_error(limiter, err, attempt)
+                if not _may_retry(err, route, attempt, max_retries):
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+    except BaseException as err:  # includes cancellation, so a probe slot is never leaked
+        _finish(route, breaker, start, error=err)
+        raise
+    finally:
+        openai.aiosession.reset(token)
+    _settle(limiter, tokens, response)
+    _finish(route, breaker, start, response=response)
+    return response
+
+
+def _admit(route: str, model: str) -> Optional[CircuitBreaker]:
+    breaker = get_breaker(model)
+    if breaker is not None:
+        try:
+            breaker.acquire()
+        except CircuitOpenError:
+            _record(route, rejected=True)
+            raise
+    return breaker
+
+
+def _finish(
+    route: str,
+    breaker: Optional[CircuitBreaker],
+    start: float,
+    response: Any = None,
+    error: Optional[BaseException] = None,
+    ttft_ms: Optional[float] = None,
+) -> None:
+    latency_ms = (time.perf_counter() - start) * 1000
+    if breaker is not None:
+        # Client errors (bad request, auth) say nothing about the service's health.
+        breaker.record(isinstance(error, _BREAKER_ERRORS), latency_ms)
+    if error is None:
+        _record(route, latency_ms, response, ttft_ms=ttft_ms)
+    elif isinstance(error, Exception):
+        _record(route, error=True)
+
+
+def create_chat_completion(
+    route: str, model: str, messages: Messages, temperature: float, **kwargs: Any
+) -> Any:
+    """The raw ChatCompletion response, for callers that need more than the text."""
+    return _call(
+        route,
+        openai.ChatCompletion.create,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        **kwargs,
+    )
+
+
+def chat_completion(
+    route: str, model: str, messages: Messages, temperature: float, **kwargs: Any
+) -> str:
+    """Return the stripped content of the first choice. Raises on API errors."""
+    completion = create_chat_completion(route, model, messages, temperature, **kwargs)
+    return (completion.choices[0].message["content"] or "").strip()
+
+
+async def chat_completion_async(
+    route: str, model: str, messages: Messages, temperature: float, **kwargs: Any
+) -> str:
+    """Async `chat_completion` over the event loop's pooled aiohttp session."""
+    completion = await _acall(
+        route,
+        openai.ChatCompletion.acreate,
+        model=model,
+        messages=messages,
+        temperature=temperature,
+        **kwargs,
+    )
+    return (completion.choices[0].message["content"] or "").strip()
+
+
+def chat_completion_stream(
+    route: str, model: str, messages: Messages, temperature: float, **kwargs: Any
+) -> Iterator[str]:
+    """
+    Yield content deltas as they arrive (leading whitespace dropped). Raises on
+    API errors; only opening the stream is retried. The call is recorded (and
+    counted by the breaker) when the stream ends, fails or is closed early.
+    """
+    chunks, finish = _send(
+        route,
+        openai.ChatCompletion.create,
+        None,
+        dict(model=model, messages=messages, temperature=temperature, stream=True, **kwargs),
+    )
+    first_token_at: Optional[float] = None
+    try:
+        for chunk in chunks:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.get("content") or ""
+            if first_token_at is None:
+                delta = delta.lstrip()
+                if delta:
+                    first_token_at = time.perf_counter()
+            if delta:
+                yield delta
+    except GeneratorExit:
+        finish(first_token_at=first_token_at)  # the consumer stopped reading
+        raise
+    except BaseException as err:
+        finish(error=err, first_token_at=first_token_at)
+        raise
+    finish(first_token_at=first_token_at)
+
+
+def stream_reply(
+    route: str,
+    model: str,
+    messages: Messages,
+    temperature: float,
+    fallback: str,
+    context: str,
+    parts: Optional[List[str]] = None,
+) -> Generator[str, None, bool]:
+    """
+    Stream a reply, appending each delta to `parts`.
+
+    If the call fails or returns nothing before any output, yields `fallback`
+    instead. Returns True only when the LLM reply streamed to completion.
+    """
+    parts = parts if parts is not None else []
+    emitted = False
+    try:
+        for delta in chat_completion_stream(route, model, messages, temperature):
+            emitted = True
+            parts.append(delta)
+            yield delta
+        if emitted:
+            return True
+    except Exception:
+        logger.exception(f"Error streaming from OpenAI in {context}")
+    if not emitted:
+        parts.append(fallback)
+        yield fallback
+    return False
+
+
+def create_embeddings(texts: List[str], max_retries: Optional[int] = None) -> List[List[float]]:
+    """One embeddings request for `texts`, in input order."""
+    response = _call(
+        "embeddings",
+        openai.Embedding.create,
+        max_retries=max_retries,
+        model=settings.embedding_model,
+        input=texts,
+    )
+    data = sorted(response["data"], key=lambda item: item["index"])
+    return [item["embedding"] for item in data]
@@ -0,0 +1,299 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+
+from config.settings import settings
+from app.logs.logger import logger
+
+# Highest first. Interactive is the default; batch jobs opt into lower classes.
+PRIORITIES = ("interactive", "eval", "batch", "ingest")
+# Share of each bucket a class must leave untouched for the classes above it.
+_HEADROOM = {"interactive": 0.0, "eval": 0.1, "batch": 0.2, "ingest": 0.3}
+# Waiters re-check at least this often, so a higher class arriving is noticed.
+_MAX_POLL_S = 0.25
+# A waiter not seen for this long (e.g. its process died) no longer blocks others.
+_WAITER_TTL_S = 5.0
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default="interactive")
+
+
+@contextmanager
+def llm_priority(name: str) -> Iterator[None]:
+    """
+    Run the LLM calls made inside the block at priority `name`. Usable as a
+    decorator; worker threads only inherit it if started via copy_context().
+    """
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority {name!r}; expected one of {PRIORITIES}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+# --------- Bucket state --------- #
+
+State = Dict[str, Any]
+
+
+class _MemoryState:
+    """Bucket state for this process only."""
+
+    def __init__(self) -> None:
+        self._states: Dict[str, State] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, fn: Callable[[State], Any]) -> Any:
+        with self._lock:
+            return fn(self._states.setdefault(key, {}))
+
+
+class _SQLiteState:
+    """
+    Bucket state in a SQLite file, so every process using the same file (and
+    API key) draws on one budget. Each update is one IMMEDIATE transaction.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_state (key TEXT PRIMARY KEY, state TEXT NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return conn
+
+    def update(self, key: str, fn: Callable[[State], Any]) -> Any:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT state FROM rate_limit_state WHERE key = ?", (key,)
+            ).fetchone()
+            state = json.loads(row[0]) if row else {}
+            result = fn(state)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limit_state (key, state) VALUES (?, ?)",
+                (key, json.dumps(state)),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+
+# --------- Limiter --------- #
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute buckets for one model.
+
+    Each bucket holds up to a minute's limit and refills continuously. A call
+    takes one request and its estimated tokens (corrected with `settle` once
+    usage is known), waiting until both buckets can cover it. While a
+    higher-priority call is waiting, lower-priority calls queue behind it, and
+    a lower class may not take a bucket below its headroom. `pause` (a 429's
+    Retry-After) holds every call until it expires.
+    """
+
+    def __init__(self, model: str, rpm: int, tpm: int, store: Any) -> None:
+        self.model = model
+        self.rpm = rpm
+        self.tpm = tpm
+        self.store = store
+        # Per priority: calls that had to queue, and total seconds queued.
+        self._queued: Dict[str, List[float]] = {p: [0, 0.0] for p in PRIORITIES}
+        self._lock = threading.Lock()
+
+    def _buckets(self, tokens: float) -> List[Any]:
+        return [
+            (name, limit, amount)
+            for name, limit, amount in (("requests", self.rpm, 1), ("tokens", self.tpm, tokens))
+            if limit
+        ]
+
+    def _refill(self, state: State, now: float) -> None:
+        elapsed = max(0.0, now - state.get("updated", now))
+        for name, limit, _ in self._buckets(0):
+            state[name] = min(limit, state.get(name, limit) + elapsed * limit / 60)
+        state["updated"] = now
+
+    def _try_acquire(self, waiter: str, priority: str, tokens: int) -> float:
+        """Take capacity and return 0, or register as waiting and return seconds to wait."""
+        rank = PRIORITIES.index(priority)
+        headroom = _HEADROOM[priority]
+
+        def attempt(state: State) -> float:
+            now = time.time()
+            self._refill(state, now)
+            waiters = {
+                key: value
+                for key, value in state.get("waiters", {}).items()
+                if key != waiter and now - value[1] < _WAITER_TTL_S
+            }
+            delay = state.get("blocked_until", 0.0) - now
+            if any(other < rank for other, _ in waiters.values()):
+                delay = max(delay, _MAX_POLL_S)
+            for name, limit, amount in self._buckets(tokens):
+                # A call bigger than the bucket waits for a full one rather than forever.
+                need = min(amount, limit * (1 - headroom)) + limit * headroom
+                delay = max(delay, (need - state[name]) * 60 / limit)
+            if delay <= 0:
+                for name, _, amount in self._buckets(tokens):
+                    state[name] -= amount
+            else:
+                waiters[waiter] = [rank, now]
+            state["waiters"] = waiters
+            return max(delay, 0.0)
+
+        return self.store.update(self.model, attempt)
+
+    def _leave(self, waiter: str) -> None:
+        def leave(state: State) -> None:
+            state.get("waiters", {}).pop(waiter, None)
+
+        self.store.update(self.model, leave)
+
+    def _count_queued(self, priority: str, started: float) -> float:
+        waited = time.monotonic() - started
+        with self._lock:
+            self._queued[priority][0] += 1
+            self._queued[priority][1] += waited
+        return waited
+
+    def acquire(self, tokens: int) -> float:
+        """Block until a call of ~`tokens` may be sent; returns seconds spent queued."""
+        priority = _priority.get()
+        waiter = uuid.uuid4().hex
+        started = time.monotonic()
+        delay = self._try_acquire(waiter, priority, tokens)
+        if delay <= 0:
+            return 0.0
+        try:
+            while delay > 0:
+                time.sleep(min(delay, _MAX_POLL_S))
+                delay = self._try_acquire(waiter, priority, tokens)
+        except BaseException:
+            self._leave(waiter)
+            raise
+        return self._count_queued(priority, started)
+
+    async def acquire_async(self, tokens: int) -> float:
+        """`acquire` that waits on the event loop instead of blocking the thread."""
+        priority = _priority.get()
+        waiter = uuid.uuid4().hex
+        started = time.monotonic()
+        delay = self._try_acquire(waiter, priority, tokens)
+        if delay <= 0:
+            return 0.0
+        try:
+            while delay > 0:
+                await asyncio.sleep(min(delay, _MAX_POLL_S))
+                delay = self._try_acquire(waiter, priority, tokens)
+        except BaseException:  # includes cancellation
+            self._leave(waiter)
+            raise
+        return self._count_queued(priority, started)
+
+    def settle(self, unused_tokens: int) -> None:
+        """Return (or, if negative, take) the difference between estimated and actual usage."""
+        if not self.tpm or not unused_tokens:
+            return
+
+        def settle(state: State) -> None:
+            self._refill(state, time.time())
+            state["tokens"] = min(self.tpm, state["tokens"] + unused_tokens)
+
+        self.store.update(self.model, settle)
+
+    def pause(self, seconds: float) -> None:
+        """Hold all calls to this model for `seconds` (the API said we are over the limit)."""
+        until = time.time() + seconds
+
+        def pause(state: State) -> None:
+            state["blocked_until"] = max(state.get("blocked_until", 0.0), until)
+
+        self.store.update(self.model, pause)
+        logger.warning(f"Rate limited on {self.model}; holding calls for {seconds:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        def read(state: State) -> Dict[str, Any]:
+            now = time.time()
+            self._refill(state, now)
+            waiting = [
+                rank for rank, seen in state.get("waiters", {}).values() if now - seen < _WAITER_TTL_S
+            ]
+            return {
+                "requests_available": state.get("requests"),
+                "tokens_available": state.get("tokens"),
+                "paused_s": max(0.0, state.get("blocked_until", 0.0) - now),
+                "waiting": {p: waiting.count(rank) for rank, p in enumerate(PRIORITIES)},
+            }
+
+        report = self.store.update(self.model, read)
+        with self._lock:
+            report["queued"] = {p: int(count) for p, (count, _) in self._queued.items()}
+            report["queued_s"] = {p: total for p, (_, total) in self._queued.items()}
+        return report
+
+
+# --------- Registry --------- #
+
+_limiters: Dict[str, Optional[RateLimiter]] = {}
+_limiters_lock = threading.Lock()
+_limits: Optional[Dict[str, List[int]]] = None
+_store: Any = None
+
+
+def _parse_limits() -> Dict[str, List[int]]:
+    """LLM_RATE_LIMITS as {model: [rpm, tpm]}; 0 leaves that bucket unlimited."""
+    limits: Dict[str, List[int]] = {}
+    for item in settings.llm_rate_limits.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            rpm, _, tpm = value.partition(":")
+            limits[name.strip()] = [int(rpm or 0), int(tpm or 0)]
+    return limits
+
+
+def get_rate_limiter(model: str) -> Optional[RateLimiter]:
+    """The limiter for `model`, or None when LLM_RATE_LIMITS does not list it."""
+    global _limits, _store
+    limiter = _limiters.get(model)
+    if limiter is not None or model in _limiters:
+        return limiter
+    with _limiters_lock:
+        if model not in _limiters:
+            if _limits is None:
+                _limits = _parse_limits()
+            rpm, tpm = _limits.get(model, [0, 0])
+            if not rpm and not tpm:
+                _limiters[model] = None
+            else:
+                if _store is None:
+                    path = settings.llm_rate_limit_state_path
+                    _store = _SQLiteState(path) if path else _MemoryState()
+                _limiters[model] = RateLimiter(model, rpm, tpm, _store)
+        return _limiters[model]
+
+
+def get_rate_limiter_stats() -> Dict[str, Dict[str, Any]]:
+    with _limiters_lock:
+        limiters = {model: limiter for model, limiter in _limiters.items() if limiter}
+    return {model: limiter.stats() for model, limiter in sorted(limiters.items())}
@@ -1,9 +1,82 @@
-from typing import Optional, Dict, Any
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Optional, Dict, Any, Deque, Iterator
+import asyncio
+import threading
+import time
 
+import numpy as np
+
+from config.settings import settings
 from app.agents import ClassifierAgent, FeedbackAgent, QueryAgent, KnowledgeAgent
+from app.agents.knowledge_agent import PreparedQuery
+from app.agents.local_classifier import extract_ticket_number
 from app.db.dao import log_event
+from app.llm import llm_available
 from app.logs.logger import logger
 
+# Outcomes of speculative knowledge retrieval, for monitoring.
+_speculation_counts: Dict[str, int] = {"used": 0, "wasted": 0, "failed": 0}
+_speculation_lock = threading.Lock()
+_speculation_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _count_speculation(outcome: str) -> None:
+    with _speculation_lock:
+        _speculation_counts[outcome] += 1
+
+
+def get_speculation_stats() -> Dict[str, float]:
+    """Speculative retrievals used by the knowledge route vs discarded."""
+    with _speculation_lock:
+        stats: Dict[str, float] = dict(_speculation_counts)
+    total = sum(stats.values())
+    stats["use_rate"] = stats["used"] / total if total else 0.0
+    return stats
+
+
+def _get_speculation_pool() -> ThreadPoolExecutor:
+    global _speculation_pool
+    with _speculation_lock:
+        if _speculation_pool is None:
+            _speculation_pool = ThreadPoolExecutor(
+                max_workers=settings.speculation_workers,
+                thread_name_prefix="speculative-retrieval",
+            )
+        return _speculation_pool
+
+
+# Recent time-to-first-token samples (ms) for streamed replies.
+_ttft_samples: Deque[float] = deque(maxlen=500)
+_ttft_lock = threading.Lock()
+
+
+def get_streaming_stats() -> Dict[str, float]:
+    """Count and p50/p95 time-to-first-token of recent streamed replies."""
+    with _ttft_lock:
+        samples = list(_ttft_samples)
+    if not samples:
+        return {"streams": 0, "ttft_p50_ms": 0.0, "ttft_p95_ms": 0.0}
+    p50, p95 = np.percentile(samples, [50, 95])
+    return {"streams": len(samples), "ttft_p50_ms": float(p50), "ttft_p95_ms": float(p95)}
+
+
+class MessageStream:
+    """
+    Iterable of reply text deltas from `Orchestrator.handle_message_stream`.
+
+    `result` (same shape as `handle_message`, plus `ttft_ms`) is set once the
+    stream has been consumed or closed.
+    """
+
+    def __init__(self) -> None:
+        self.result: Optional[Dict[str, Any]] = None
+        self._deltas: Iterator[str] = iter(())
+
+    def __iter__(self) -> Iterator[str]:
+        return self._deltas
+
 
 class Orchestrator:
     """
@@ -11,6 +84,11 @@ class Orchestrator:
     - Classification
     - Routing to feedback, ticket-status, or knowledge (RAG) agents
     - Logging
+
+    When a message goes to the LLM classifier and names no ticket, knowledge
+    retrieval (embedding, answer cache, vector search) starts speculatively
+    alongside classification and is used if the message is routed to the
+    knowledge agent, discarded otherwise.
     """
 
     def __init__(self) -> None:
@@ -24,6 +102,7 @@ class Orchestrator:
         message: str,
         session_id: str,
         customer_name: Optional[str] = None,
+        locale: Optional[str] = None,
     ) -> Dict[str, Any]:
         logger.info("Orchestrator.handle_message called")
         classifier_result: Dict[str, Any] = {}
@@ -33,8 +112,23 @@ class Orchestrator:
         success = True
         error_message: Optional[str] = None
 
+        speculation: Optional[Future] = None
         try:
-            classifier_result = self.classifier.classify(message)
+            pre = self.classifier.pre_classify(message)
+            if self._should_speculate(message, pre):
+                # copy_context keeps the caller's LLM priority (eval, batch) in the pool
+                speculation = _get_speculation_pool().submit(
+                    copy_context().run, self.knowledge_agent.prepare, message
+                )
+
+            if settings.classify_and_respond:
+                # One call classifies and drafts the feedback reply.
+                classifier_result = self.classifier.classify_and_respond(
+                    message, customer_name, pre=pre
+                )
+            else:
+                classifier_result = self.classifier.classify(message, pre=pre)
+            draft = classifier_result.get("draft_reply")
             category = classifier_result.get("category", "query")
             sentiment = classifier_result.get("sentiment", "neutral")
             ticket_number = classifier_result.get("ticket_number")
@@ -42,24 +136,28 @@ class Orchestrator:
             if category == "positive_feedback":
                 routed_agent = "feedback_handler_positive"
                 response_text = self.feedback_agent.handle_positive(
-                    message, customer_name
+                    message, customer_name, draft=draft, locale=locale
                 )
 
             elif category == "negative_feedback":
                 routed_agent = "feedback_handler_negative"
                 response_text, ticket_number = self.feedback_agent.handle_negative(
-                    message, customer_name
+                    message, customer_name, draft=draft
                 )
 
             else:  # "query"
                 if ticket_number:
                     routed_agent = "query_handler"
                     response_text = self.query_agent.handle_query(
-                        message, ticket_number=ticket_number
+                        message, ticket_number=ticket_number, locale=locale
                     )
                 else:
                     routed_agent = "knowledge_handler"
-                    response_text = self.knowledge_agent.handle_knowledge_query(message)
+                    prepared = self._claim_speculation(speculation)
+                    speculation = None
+                    response_text = self.knowledge_agent.handle_knowledge_query(
+                        message, prepared=prepared
+                    )
 
         except Exception as exc:  # noqa: BLE001
             logger.exception("Error in Orchestrator.handle_message")
@@ -70,6 +168,10 @@ class Orchestrator:
                 "or contact support."
             )
 
+        if speculation is not None:
+            speculation.cancel()  # no-op if already running; the result is dropped
+            _count_speculation("wasted")
+
         log_event(
             session_id=session_id,
             user_message=message,
@@ -90,3 +192,288 @@ class Orchestrator:
             "success": success,
             "error_message": error_message,
         }
+
+    async def handle_message_async(
+        self,
+        message: str,
+        session_id: str,
+        customer_name: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Async `handle_message` with the same result shape.
+
+        LLM calls are awaited and DB work runs in worker threads, so one event
+        loop can hold many conversations in flight.
+        """
+        logger.info("Orchestrator.handle_message_async called")
+        classifier_result: Dict[str, Any] = {}
+        routed_agent = None
+        response_text = ""
+        ticket_number: Optional[str] = None
+        success = True
+        error_message: Optional[str] = None
+
+        speculation: Optional[asyncio.Task] = None
+        try:
+            pre = self.classifier.pre_classify(message)
+            if self._should_speculate(message, pre):
+                speculation = asyncio.create_task(
+                    asyncio.to_thread(self.knowledge_agent.prepare, message)
+                )
+
+            if settings.classify_and_respond:
+                classifier_result = await self.classifier.classify_and_respond_async(
+                    message, customer_name, pre=pre
+                )
+            else:
+                classifier_result = await self.classifier.classify_async(message, pre=pre)
+            draft = classifier_result.get("draft_reply")
+            category = classifier_result.get("category", "query")
+            ticket_number = classifier_result.get("ticket_number")
+
+            if category == "positive_feedback":
+                routed_agent = "feedback_handler_positive"
+                response_text = await self.feedback_agent.handle_positive_async(
+                    message, customer_name, draft=draft, locale=locale
+                )
+
+            elif category == "negative_feedback":
+                routed_agent = "feedback_handler_negative"
+                response_text, ticket_number = await self.feedback_agent.handle_negative_async(
+                    message, customer_name, draft=draft
+                )
+
+            else:  # "query"
+                if ticket_number:
+                    routed_agent = "query_handler"
+                    response_text = await self.query_agent.handle_query_async(
+                        message, ticket_number=ticket_number, locale=locale
+                    )
+                else:
+                    routed_agent = "knowledge_handler"
+                    prepared = await self._claim_speculation_async(speculation)
+                    speculation = None
+                    response_text = await self.knowledge_agent.handle_knowledge_query_async(
+                        message, prepared=prepared
+                    )
+
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Error in Orchestrator.handle_message_async")
+            success = False
+            error_message = str(exc)
+            response_text = (
+                "We’re experiencing issues right now. Please try again later "
+                "or contact support."
+            )
+
+        if speculation is not None:
+            speculation.cancel()
+            _count_speculation("wasted")
+
+        await asyncio.to_thread(
+            log_event,
+            session_id=session_id,
+            user_message=message,
+            classifier=classifier_result.get("category") if classifier_result else None,
+            routed_agent=routed_agent,
+            response=response_text,
+            ticket_number=ticket_number,
+            success=success,
+            error_message=error_message,
+        )
+
+        return {
+            "response": response_text,
+            "category": classifier_result.get("category") if classifier_result else None,
+            "sentiment": classifier_result.get("sentiment") if classifier_result else None,
+            "ticket_number": ticket_number,
+            "routed_agent": routed_agent,
+            "success": success,
+            "error_message": error_message,
+        }
+
+    def handle_message_stream(
+        self,
+        message: str,
+        session_id: str,
+        customer_name: Optional[str] = None,
+        locale: Optional[str] = None,
+    ) -> MessageStream:
+        """
+        Streaming `handle_message`: iterate the returned stream for reply text
+        as the LLM produces it. Classification runs first (it decides the
+        route); the event is logged when the stream finishes.
+        """
+        stream = MessageStream()
+        stream._deltas = self._stream_message(
+            message, session_id, customer_name, locale, stream
+        )
+        return stream
+
+    def _stream_message(
+        self,
+        message: str,
+        session_id: str,
+        customer_name: Optional[str],
+        locale: Optional[str],
+        stream: MessageStream,
+    ) -> Iterator[str]:
+        logger.info("Orchestrator.handle_message_stream called")
+        start = time.perf_counter()
+        classifier_result: Dict[str, Any] = {}
+        routed_agent = None
+        parts = []
+        ttft_ms: Optional[float] = None
+        ticket_number: Optional[str] = None
+        success = True
+        error_message: Optional[str] = None
+
+        speculation: Optional[Future] = None
+        try:
+            pre = self.classifier.pre_classify(message)
+            if self._should_speculate(message, pre):
+                # copy_context keeps the caller's LLM priority (eval, batch) in the pool
+                speculation = _get_speculation_pool().submit(
+                    copy_context().run, self.knowledge_agent.prepare, message
+                )
+
+            if settings.classify_and_respond:
+                classifier_result = self.classifier.classify_and_respond(
+                    message, customer_name, pre=pre
+                )
+            else:
+                classifier_result = self.classifier.classify(message, pre=pre)
+            draft = classifier_result.get("draft_reply")
+            category = classifier_result.get("category", "query")
+            ticket_number = classifier_result.get("ticket_number")
+
+            if category == "positive_feedback":
+                routed_agent = "feedback_handler_positive"
+                deltas = self.feedback_agent.handle_positive_stream(
+                    message, customer_name, draft=draft, locale=locale
+                )
+
+            elif category == "negative_feedback":
+                routed_agent = "feedback_handler_negative"
+                deltas = self.feedback_agent.handle_negative_stream(
+                    message, customer_name, draft=draft
+                )
+
+            else:  # "query"
+                if ticket_number:
+                    routed_agent = "query_handler"
+                    deltas = self.query_agent.handle_query_stream(
+                        message, ticket_number=ticket_number, locale=locale
+                    )
+                else:
+                    routed_agent = "knowledge_handler"
+                    prepared = self._claim_speculation(speculation)
+                    speculation = None
+                    deltas = self.knowledge_agent.handle_knowledge_query_stream(
+                        message, prepared=prepared
+                    )
+
+            if speculation is not None:
+                speculation.cancel()
+                _count_speculation("wasted")
+                speculation = None
+
+            # Drive the agent generator by hand to pick up its return value
+            # (the new ticket number for negative feedback).
+            while True:
+                try:
+                    delta = next(deltas)
+                except StopIteration as stop:
+                    if stop.value is not None:
+                        ticket_number = stop.value
+                    break
+                if ttft_ms is None:
+                    ttft_ms = (time.perf_counter() - start) * 1000
+                parts.append(delta)
+                yield delta
+
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Error in Orchestrator.handle_message_stream")
+            success = False
+            error_message = str(exc)
+            if not parts:
+                error_text = (
+                    "We’re experiencing issues right now. Please try again later "
+                    "or contact support."
+                )
+                parts.append(error_text)
+                yield error_text
+
+        finally:
+            # Also runs when the consumer stops early, so the event is always logged.
+            if speculation is not None:
+                speculation.cancel()
+                _count_speculation("wasted")
+
+            response_text = "".join(parts)
+            if ttft_ms is not None:
+                with _ttft_lock:
+                    _ttft_samples.append(ttft_ms)
+                logger.info(f"Streamed reply: first token after {ttft_ms:.0f} ms")
+
+            log_event(
+                session_id=session_id,
+                user_message=message,
+                classifier=classifier_result.get("category") if classifier_result else None,
+                routed_agent=routed_agent,
+                response=response_text,
+                ticket_number=ticket_number,
+                success=success,
+                error_message=error_message,
+            )
+
+            stream.result = {
+                "response": response_text,
+                "category": classifier_result.get("category") if classifier_result else None,
+                "sentiment": classifier_result.get("sentiment") if classifier_result else None,
+                "ticket_number": ticket_number,
+                "routed_agent": routed_agent,
+                "success": success,
+                "error_message": error_message,
+                "ttft_ms": ttft_ms,
+            }
+
+    # --------- Speculative retrieval --------- #
+
+    def _should_speculate(self, message: str, pre: Dict[str, Any]) -> bool:
+        # Only worth it while waiting on the LLM classifier: a local result is
+        # already final, and a knowledge route then retrieves straight away.
+        # Messages naming a ticket go to the query or feedback agents, never RAG.
+        return (
+            settings.speculative_retrieval
+            and pre["source"] != "local"
+            and extract_ticket_number(message) is None
+            and llm_available(settings.embedding_model)
+        )
+
+    def _claim_speculation(self, speculation: Optional[Future]) -> Optional[PreparedQuery]:
+        if speculation is None:
+            return None
+        try:
+            prepared = speculation.result()
+        except Exception:
+            logger.exception("Speculative retrieval failed; retrieving inline")
+            _count_speculation("failed")
+            return None
+        _count_speculation("used")
+        return prepared
+
+    async def _claim_speculation_async(
+        self, speculation: Optional[asyncio.Task]
+    ) -> Optional[PreparedQuery]:
+        if speculation is None:
+            return None
+        try:
+            prepared = await speculation
+        except Exception:
+            logger.exception("Speculative retrieval failed; retrieving inline")
+            _count_speculation("failed")
+            return None
+        _count_speculation("used")
+        return prepared
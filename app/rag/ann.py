@@ -0,0 +1,118 @@
+from pathlib import Path
+from typing import Optional
+import math
+
+import numpy as np
+
+from app.logs.logger import logger
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-8)
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, n_clusters: int, iterations: int = 20, seed: int = 0
+) -> np.ndarray:
+    """k-means on the unit sphere; returns L2-normalised centroids."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    centroids = vectors[rng.choice(n, size=n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        updated = np.zeros_like(centroids)
+        np.add.at(updated, assign, vectors)
+        counts = np.bincount(assign, minlength=n_clusters)
+
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters so every list stays usable.
+            updated[empty] = vectors[rng.choice(n, size=int(empty.sum()))]
+
+        updated = _normalize(updated).astype(np.float32)
+        if np.allclose(updated, centroids, atol=1e-6):
+            centroids = updated
+            break
+        centroids = updated
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index: k-means coarse quantizer over the chunk matrix.
+
+    Rows are grouped into `n_lists` lists by nearest centroid. A query scores
+    the centroids, then only the rows in the `nprobe` closest lists.
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        list_rows: np.ndarray,
+        nprobe: int = 8,
+    ) -> None:
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_rows = np.asarray(list_rows, dtype=np.int64)
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(
+        cls,
+        matrix: np.ndarray,
+        n_lists: int = 0,
+        nprobe: int = 8,
+        iterations: int = 20,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """Train centroids on (a sample of) `matrix` and assign every row."""
+        n = matrix.shape[0]
+        if n_lists <= 0:
+            n_lists = int(math.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        max_train = 256 * n_lists
+        train = matrix[rng.choice(n, size=max_train, replace=False)] if n > max_train else matrix
+        centroids = spherical_kmeans(np.asarray(train, dtype=np.float32), n_lists, iterations, seed)
+
+        assign = np.argmax(matrix @ centroids.T, axis=1)
+        list_rows = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        logger.info(f"Built IVF index: {n} rows in {n_lists} lists")
+        return cls(centroids, list_offsets, list_rows, nprobe)
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Row ids in the `nprobe` lists whose centroids are closest to `query`."""
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.n_lists:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.n_lists)
+        return np.concatenate(
+            [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probe]
+        )
+
+    def save(self, path: Path) -> None:
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_rows=self.list_rows,
+        )
+
+    @classmethod
+    def load(cls, path: Path, nprobe: int = 8) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_rows"], nprobe)
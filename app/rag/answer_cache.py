@@ -0,0 +1,227 @@
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+import threading
+
+import numpy as np
+
+from config.settings import settings
+from app.db.dao import (
+    delete_answer_cache_entries,
+    get_answer_cache_entries,
+    purge_answer_cache,
+    put_answer_cache_entry,
+)
+from app.logs.logger import logger
+from .embedding_cache import text_hash
+from .embeddings import embedding_from_bytes, embedding_to_bytes
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    vector: np.ndarray  # unit-length query embedding
+    created_at: datetime
+    latency_ms: float
+    similarity: float = 1.0
+
+
+class AnswerCache:
+    """
+    Semantic cache of KnowledgeAgent answers.
+
+    A question whose embedding is within `threshold` cosine similarity of a
+    cached question reuses that answer, as long as both were answered from the
+    same support doc generation. Entries expire after `ttl_seconds`, the
+    least recently used are evicted beyond `max_items`, and everything is
+    persisted in the `answer_cache` table so restarts start warm.
+
+    A newer generation (re-ingest) drops the in-process entries and purges
+    older generations from the DB. The cache never moves back to an older
+    generation: lookups from a process still on the old index miss, and its
+    answers are not stored. DB errors are logged and treated as misses.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        threshold: float = 0.95,
+        ttl_seconds: int = 86400,
+        max_items: int = 1000,
+    ) -> None:
+        self.model = model
+        self.threshold = threshold
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, CachedAnswer]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # stacked vectors, rebuilt lazily
+        self._keys: List[str] = []
+        self._generation: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "saved_ms": self.saved_ms,
+                "items": len(self._entries),
+            }
+
+    def _sync(self, generation: int) -> bool:
+        """
+        (Re)load entries when the support doc generation advances; False if
+        `generation` is older than the cache's. Holds the lock.
+        """
+        if self._generation is not None and generation <= self._generation:
+            return generation == self._generation
+        self._entries.clear()
+        self._matrix = None
+        self._generation = generation
+
+        cutoff = datetime.utcnow() - self.ttl
+        try:
+            purged = purge_answer_cache(generation, cutoff)
+            if purged:
+                logger.info(f"Purged {purged} stale answer cache entries")
+            rows = get_answer_cache_entries(self.model, generation, cutoff, self.max_items)
+        except Exception:
+            logger.exception("Answer cache load failed; starting empty")
+            return True
+        for row in rows:
+            self._entries[row.question_hash] = CachedAnswer(
+                question=row.question,
+                answer=row.answer,
+                vector=embedding_from_bytes(row.embedding_vector, row.embedding_dim),
+                created_at=row.created_at,
+                latency_ms=row.latency_ms,
+            )
+        logger.info(f"Loaded {len(rows)} answer cache entries for generation {generation}")
+        return True
+
+    def _best_match(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        if not self._entries:
+            return None, 0.0
+        if self._matrix is None:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[k].vector for k in self._keys])
+        if self._matrix.shape[1] != vector.shape[0]:
+            return None, 0.0
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self._keys[best], float(scores[best])
+
+    def _forget(self, keys: Sequence[str]) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+        self._matrix = None
+        try:
+            delete_answer_cache_entries(self.model, keys)
+        except Exception:
+            logger.exception("Answer cache delete failed")
+
+    def lookup(
+        self, question: str, embedding: Sequence[float], generation: int
+    ) -> Optional[CachedAnswer]:
+        """Return the cached answer for a similar question, or None."""
+        vector = _unit(embedding)
+        with self._lock:
+            if not self._sync(generation):
+                self.misses += 1
+                return None
+            key, similarity = self._best_match(vector)
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None and datetime.utcnow() - entry.created_at > self.ttl:
+                self._forget([key])
+                entry = None
+            if entry is None or similarity < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_ms += entry.latency_ms
+            return replace(entry, similarity=similarity)
+
+    def store(
+        self,
+        question: str,
+        embedding: Sequence[float],
+        answer: str,
+        generation: int,
+        latency_ms: float,
+    ) -> None:
+        vector = _unit(embedding)
+        key = text_hash(question)
+        with self._lock:
+            if not self._sync(generation):
+                logger.debug(f"Not caching an answer from stale generation {generation}")
+                return
+            self._entries[key] = CachedAnswer(
+                question=question,
+                answer=answer,
+                vector=vector,
+                created_at=datetime.utcnow(),
+                latency_ms=latency_ms,
+            )
+            self._entries.move_to_end(key)
+            self._matrix = None
+            evicted = []
+            while len(self._entries) > self.max_items:
+                evicted.append(self._entries.popitem(last=False)[0])
+            if evicted:
+                self._forget(evicted)
+
+        try:
+            put_answer_cache_entry(
+                self.model,
+                key,
+                question,
+                embedding_to_bytes(vector),
+                int(vector.shape[0]),
+                answer,
+                generation,
+                latency_ms,
+            )
+        except Exception:
+            logger.exception("Answer cache write failed")
+
+
+def _unit(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-8)
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide answer cache, or None when disabled in settings."""
+    global _cache
+    if not settings.answer_cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache(
+                    model=settings.embedding_model,
+                    threshold=settings.answer_cache_threshold,
+                    ttl_seconds=settings.answer_cache_ttl_seconds,
+                    max_items=settings.answer_cache_max_items,
+                )
+    return _cache
+
+
+def get_answer_cache_stats() -> Dict[str, float]:
+    """Hit/miss counters and latency saved (all zero when the cache is disabled)."""
+    cache = get_answer_cache()
+    if cache is None:
+        return {"hits": 0, "misses": 0, "hit_rate": 0.0, "saved_ms": 0.0, "items": 0}
+    return cache.stats()
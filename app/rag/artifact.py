@@ -0,0 +1,270 @@
+"""
+On-disk, versioned support doc index shared by every process via mmap.
+
+Layout under the index directory:
+
+    CURRENT                  name of the live version directory
+    gen-000007/
+        embeddings.npy       L2-normalised float32 matrix, one row per chunk
+        chunks.json          row-ordered sidecar: id, doc_id, chunk_index, title, content
+        manifest.json        format, generation, model, dim, count, file sizes, checksums
+        ivf.npz              optional IVF centroids and inverted lists (app.rag.ann)
+        bm25.npz             optional BM25 postings over chunk contents (app.rag.bm25)
+
+Loading only checks the cheap manifest facts (file sizes, matrix shape and
+dtype, generation) so a process can map the matrix without reading it. The
+SHA-256 checksums are verified on request: `verify=True` or
+
+    python -m app.rag.artifact [index_dir]
+"""
+
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from config.settings import settings
+from app.logs.logger import logger
+from .ann import IVFIndex
+from .bm25 import BM25Index
+from .index import SupportDocIndex
+
+FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.json"
+MANIFEST_FILE = "manifest.json"
+IVF_FILE = "ivf.npz"
+BM25_FILE = "bm25.npz"
+KEEP_VERSIONS = 2
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _write_atomic(path: Path, data: str) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(data, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def artifact_stamp(index_dir: Path) -> Optional[Tuple[int, int]]:
+    """Cheap identity of the CURRENT pointer; changes whenever it is replaced."""
+    try:
+        st = os.stat(index_dir / CURRENT_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def retract_index_artifact(index_dir: Path) -> None:
+    """
+    Remove the CURRENT pointer, so retrievers load from the DB (which checks
+    the generation) until a new version is written.
+    """
+    try:
+        os.remove(index_dir / CURRENT_FILE)
+    except FileNotFoundError:
+        pass
+
+
+def write_index_artifact(
+    index: SupportDocIndex, index_dir: Path, model: str
+) -> Path:
+    """Write `index` as a new version and atomically point CURRENT at it."""
+    index_dir.mkdir(parents=True, exist_ok=True)
+    version = f"gen-{index.generation:06d}"
+    staging = index_dir / f".{version}.tmp"
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir()
+
+    np.save(staging / EMBEDDINGS_FILE, index.matrix)
+    sidecar = [
+        {
+            "id": index.chunk_ids[row] if index.chunk_ids else row,
+            "doc_id": index.doc_ids[row],
+            "chunk_index": index.chunk_indexes[row],
+            "title": index.titles[row],
+            "content": index.contents[row],
+        }
+        for row in range(len(index))
+    ]
+    (staging / CHUNKS_FILE).write_text(json.dumps(sidecar), encoding="utf-8")
+
+    checksums = {
+        EMBEDDINGS_FILE: _sha256(staging / EMBEDDINGS_FILE),
+        CHUNKS_FILE: _sha256(staging / CHUNKS_FILE),
+    }
+    ann: Optional[Dict[str, Any]] = None
+    if index.ann is not None:
+        index.ann.save(staging / IVF_FILE)
+        checksums[IVF_FILE] = _sha256(staging / IVF_FILE)
+        ann = {"type": "ivf", "n_lists": index.ann.n_lists}
+    if index.lexical is not None:
+        index.lexical.save(staging / BM25_FILE)
+        checksums[BM25_FILE] = _sha256(staging / BM25_FILE)
+
+    manifest: Dict[str, Any] = {
+        "format_version": FORMAT_VERSION,
+        "generation": index.generation,
+        "model": model,
+        "dim": int(index.matrix.shape[1]) if len(index) else 0,
+        "count": len(index),
+        "sizes": {name: (staging / name).stat().st_size for name in checksums},
+        "checksums": checksums,
+        "ann": ann,
+        "lexical": "bm25" if index.lexical is not None else None,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    (staging / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+    target = index_dir / version
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(staging, target)
+    _write_atomic(index_dir / CURRENT_FILE, version)
+    logger.info(f"Wrote support doc index artifact {target} ({len(index)} chunks)")
+
+    _prune_old_versions(index_dir, keep=version)
+    return target
+
+
+def _prune_old_versions(index_dir: Path, keep: str) -> None:
+    # Keep a previous version around for processes still mapping it.
+    versions = sorted(p for p in index_dir.glob("gen-*") if p.is_dir())
+    for old in versions[:-KEEP_VERSIONS]:
+        if old.name != keep:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def _size_mismatch(version_dir: Path, manifest: Dict[str, Any]) -> Optional[str]:
+    for name, expected in manifest.get("sizes", {}).items():
+        try:
+            size = (version_dir / name).stat().st_size
+        except FileNotFoundError:
+            return f"{name} is missing"
+        if size != expected:
+            return f"{name} is {size} bytes, expected {expected}"
+    return None
+
+
+def _checksum_mismatches(version_dir: Path, manifest: Dict[str, Any]) -> List[str]:
+    """Reads every file in full."""
+    return [
+        name
+        for name, expected in manifest.get("checksums", {}).items()
+        if _sha256(version_dir / name) != expected
+    ]
+
+
+def load_index_artifact(
+    index_dir: Path, model: str, min_generation: int = 0, verify: bool = False
+) -> Optional[SupportDocIndex]:
+    """
+    Open the CURRENT artifact with the embedding matrix memory-mapped read-only.
+
+    Returns None when the artifact is missing or stale (other model, older
+    generation than `min_generation`) or does not match its manifest (file
+    sizes, matrix shape/dtype, and with `verify` the checksums).
+    """
+    stamp = artifact_stamp(index_dir)
+    if stamp is None:
+        return None
+
+    version = (index_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    version_dir = index_dir / version
+    manifest = json.loads((version_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+
+    if manifest.get("format_version") != FORMAT_VERSION:
+        logger.warning(f"Ignoring index artifact {version}: unknown format")
+        return None
+    if manifest.get("model") != model:
+        logger.warning(
+            f"Ignoring index artifact {version}: built with {manifest.get('model')}, "
+            f"queries use {model}"
+        )
+        return None
+    if manifest.get("generation", 0) < min_generation:
+        logger.warning(
+            f"Ignoring index artifact {version}: generation "
+            f"{manifest.get('generation')} is older than {min_generation}"
+        )
+        return None
+    mismatch = _size_mismatch(version_dir, manifest)
+    if mismatch:
+        logger.warning(f"Ignoring index artifact {version}: {mismatch}")
+        return None
+    if verify:
+        bad = _checksum_mismatches(version_dir, manifest)
+        if bad:
+            logger.warning(f"Ignoring index artifact {version}: bad checksum for {', '.join(bad)}")
+            return None
+
+    sidecar = json.loads((version_dir / CHUNKS_FILE).read_text(encoding="utf-8"))
+    if manifest["count"]:
+        matrix = np.load(version_dir / EMBEDDINGS_FILE, mmap_mode="r")
+        expected_shape = (manifest["count"], manifest["dim"])
+        if matrix.shape != expected_shape or matrix.dtype != np.float32:
+            logger.warning(
+                f"Ignoring index artifact {version}: matrix is {matrix.dtype}{matrix.shape}, "
+                f"manifest says float32{expected_shape}"
+            )
+            return None
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    if matrix.shape[0] != len(sidecar):
+        logger.warning(f"Ignoring index artifact {version}: sidecar/matrix mismatch")
+        return None
+
+    index = SupportDocIndex(
+        matrix,
+        [row["title"] for row in sidecar],
+        [row["content"] for row in sidecar],
+        generation=manifest["generation"],
+        chunk_ids=[row["id"] for row in sidecar],
+        doc_ids=[row["doc_id"] for row in sidecar],
+        chunk_indexes=[row["chunk_index"] for row in sidecar],
+    )
+    if manifest.get("ann"):
+        index.ann = IVFIndex.load(version_dir / IVF_FILE)
+    if manifest.get("lexical") == "bm25":
+        index.lexical = BM25Index.load(version_dir / BM25_FILE)
+    index.source = "artifact"
+    index.artifact_stamp = stamp
+    return index
+
+
+def verify_index_artifact(index_dir: Path) -> List[str]:
+    """Problems with the CURRENT artifact's files (sizes and full checksums); empty if sound."""
+    if artifact_stamp(index_dir) is None:
+        return [f"no {CURRENT_FILE} in {index_dir}"]
+    version_dir = index_dir / (index_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    manifest = json.loads((version_dir / MANIFEST_FILE).read_text(encoding="utf-8"))
+    mismatch = _size_mismatch(version_dir, manifest)
+    if mismatch:
+        return [mismatch]
+    return [f"bad checksum for {name}" for name in _checksum_mismatches(version_dir, manifest)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify the support doc index artifact checksums")
+    parser.add_argument("index_dir", type=Path, nargs="?", default=Path(settings.rag_index_dir))
+    args = parser.parse_args()
+
+    problems = verify_index_artifact(args.index_dir)
+    for problem in problems:
+        print(problem)
+    print("Index artifact OK" if not problems else f"{len(problems)} problem(s) found")
+    raise SystemExit(1 if problems else 0)
@@ -0,0 +1,136 @@
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+import re
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in is it my me "
+    "of on or our so that the this to was we what when where which who why will "
+    "with you your".split()
+)
+
+
+def _stem(token: str) -> str:
+    # Plural folding only; enough to match "statement" with "statements".
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring.
+
+    Postings are stored CSR-style: for term id t, rows
+    `post_rows[post_offsets[t]:post_offsets[t + 1]]` contain it with term
+    frequencies `post_tfs[...]`.
+    """
+
+    def __init__(
+        self,
+        vocab: Sequence[str],
+        post_offsets: np.ndarray,
+        post_rows: np.ndarray,
+        post_tfs: np.ndarray,
+        doc_lengths: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self.vocab: Dict[str, int] = {term: i for i, term in enumerate(vocab)}
+        self.post_offsets = np.asarray(post_offsets, dtype=np.int64)
+        self.post_rows = np.asarray(post_rows, dtype=np.int64)
+        self.post_tfs = np.asarray(post_tfs, dtype=np.float32)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        self.k1 = k1
+        self.b = b
+
+        n = len(self.doc_lengths)
+        doc_freq = np.diff(self.post_offsets).astype(np.float32)
+        self.idf = np.log1p((n - doc_freq + 0.5) / (doc_freq + 0.5))
+        avgdl = float(self.doc_lengths.mean()) if n else 1.0
+        self._length_norm = k1 * (1 - b + b * self.doc_lengths / max(avgdl, 1e-8))
+
+    @classmethod
+    def build(cls, contents: Sequence[str]) -> "BM25Index":
+        postings: Dict[str, Dict[int, int]] = {}
+        doc_lengths = np.zeros(len(contents), dtype=np.float32)
+        for row, content in enumerate(contents):
+            tokens = tokenize(content)
+            doc_lengths[row] = len(tokens)
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[row] = counts.get(row, 0) + 1
+
+        vocab = sorted(postings)
+        offsets = [0]
+        rows: List[int] = []
+        tfs: List[int] = []
+        for term in vocab:
+            for row, tf in sorted(postings[term].items()):
+                rows.append(row)
+                tfs.append(tf)
+            offsets.append(len(rows))
+        return cls(vocab, np.array(offsets), np.array(rows), np.array(tfs), doc_lengths)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for `query`."""
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.vocab.get(token)
+            if term is None:
+                continue
+            start, end = self.post_offsets[term], self.post_offsets[term + 1]
+            rows = self.post_rows[start:end]
+            tfs = self.post_tfs[start:end]
+            scores[rows] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self._length_norm[rows])
+        return scores
+
+    def search_rows(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """Return [(row, bm25 score), ...] for rows matching any query term, best first."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if matched.shape[0] == 0 or top_k <= 0:
+            return []
+        if top_k < matched.shape[0]:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(row), float(scores[row])) for row in matched]
+
+    def save(self, path: Path) -> None:
+        vocab = sorted(self.vocab, key=self.vocab.__getitem__)
+        np.savez(
+            path,
+            vocab=np.array(vocab, dtype=str),
+            post_offsets=self.post_offsets,
+            post_rows=self.post_rows,
+            post_tfs=self.post_tfs,
+            doc_lengths=self.doc_lengths,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with np.load(path) as data:
+            return cls(
+                data["vocab"].tolist(),
+                data["post_offsets"],
+                data["post_rows"],
+                data["post_tfs"],
+                data["doc_lengths"],
+            )
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[int]], k: int = 60
+) -> List[Tuple[int, float]]:
+    """Fuse ranked row lists; returns [(row, rrf score), ...] best first."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
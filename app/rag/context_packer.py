@@ -0,0 +1,137 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Set
+
+from app.tokens import estimate_tokens
+from .retriever import RetrievedChunk
+
+# Don't bother appending a trimmed block smaller than this.
+_MIN_TRIMMED_TOKENS = 40
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens_used: int
+    tokens_saved: int
+    chunks_in: int
+    blocks: List[str] = field(default_factory=list)
+
+
+def _format_block(title: str, score: float, content: str) -> str:
+    return f"[{title}] (score={score:.3f})\n{content}"
+
+
+def _shingles(text: str, size: int = 3) -> Set[str]:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    return len(a & b) / max(len(a | b), 1)
+
+
+def _drop_near_duplicates(
+    hits: Sequence[RetrievedChunk], threshold: float
+) -> List[RetrievedChunk]:
+    """Keep the best-scored of any chunks whose word 3-gram Jaccard >= threshold."""
+    kept: List[RetrievedChunk] = []
+    kept_shingles: List[Set[str]] = []
+    for hit in sorted(hits, key=lambda h: h.score, reverse=True):
+        sh = _shingles(hit.content)
+        if any(_jaccard(sh, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(hit)
+        kept_shingles.append(sh)
+    return kept
+
+
+def _merge_neighbours(hits: Sequence[RetrievedChunk]) -> List[RetrievedChunk]:
+    """Merge hits with consecutive chunk_index in the same doc into one block."""
+    by_doc: Dict[str, List[RetrievedChunk]] = {}
+    for hit in hits:
+        by_doc.setdefault(hit.doc_id, []).append(hit)
+
+    merged: List[RetrievedChunk] = []
+    for doc_hits in by_doc.values():
+        doc_hits.sort(key=lambda h: h.chunk_index)
+        run = [doc_hits[0]]
+        for hit in doc_hits[1:]:
+            if hit.chunk_index == run[-1].chunk_index + 1:
+                run.append(hit)
+                continue
+            merged.append(_join_run(run))
+            run = [hit]
+        merged.append(_join_run(run))
+
+    merged.sort(key=lambda h: h.score, reverse=True)
+    return merged
+
+
+def _join_run(run: List[RetrievedChunk]) -> RetrievedChunk:
+    if len(run) == 1:
+        return run[0]
+    return RetrievedChunk(
+        score=max(h.score for h in run),
+        title=run[0].title,
+        content="\n".join(h.content for h in run),
+        doc_id=run[0].doc_id,
+        chunk_index=run[0].chunk_index,
+    )
+
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text at a line/word boundary so it fits in max_tokens (estimated)."""
+    while text and estimate_tokens(text) > max_tokens:
+        cut = max(1, int(len(text) * 0.9))
+        boundary = max(text.rfind("\n", 0, cut), text.rfind(" ", 0, cut))
+        text = text[:boundary if boundary > 0 else cut].rstrip()
+    return text
+
+
+def pack_context(
+    hits: Sequence[RetrievedChunk],
+    token_budget: int = 1500,
+    dedup_threshold: float = 0.85,
+) -> PackedContext:
+    """
+    Build the knowledge prompt context from retrieved chunks.
+
+    Drops near-duplicate chunks, merges adjacent chunks of the same doc,
+    then adds blocks best-first until `token_budget` is reached, trimming
+    the last block to fit. Token counts use the fast local estimator.
+    """
+    naive = "\n\n".join(_format_block(h.title, h.score, h.content) for h in hits)
+    naive_tokens = estimate_tokens(naive)
+
+    blocks: List[str] = []
+    used = 0
+    separator = estimate_tokens("\n\n")
+    for hit in _merge_neighbours(_drop_near_duplicates(hits, dedup_threshold)):
+        block = _format_block(hit.title, hit.score, hit.content)
+        cost = estimate_tokens(block) + (separator if blocks else 0)
+        if used + cost <= token_budget:
+            blocks.append(block)
+            used += cost
+            continue
+
+        remaining = token_budget - used - (separator if blocks else 0)
+        header = _format_block(hit.title, hit.score, "")
+        content_budget = remaining - estimate_tokens(header)
+        if content_budget < _MIN_TRIMMED_TOKENS:
+            continue  # a smaller, lower-ranked block may still fit
+        trimmed = _trim_to_tokens(hit.content, content_budget)
+        if trimmed:
+            blocks.append(header + trimmed)
+        break
+
+    text = "\n\n".join(blocks)
+    tokens_used = estimate_tokens(text)
+    return PackedContext(
+        text=text,
+        tokens_used=tokens_used,
+        tokens_saved=max(0, naive_tokens - tokens_used),
+        chunks_in=len(hits),
+        blocks=blocks,
+    )
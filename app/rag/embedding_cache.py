@@ -0,0 +1,158 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import threading
+
+import numpy as np
+
+from config.settings import settings
+from app.db.dao import evict_embedding_cache, get_cached_embeddings, put_cached_embeddings
+from app.logs.logger import logger
+
+# Run the (SUM-based) size check on the SQLite tier every N stored entries.
+_EVICT_EVERY = 256
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different texts share a key."""
+    return " ".join(text.split()).casefold()
+
+
+def text_hash(text: str, normalize: bool = True) -> str:
+    """
+    Cache key for `text`. Queries are normalized; document chunks are keyed
+    verbatim (`normalize=False`, in a separate key space) because case and
+    whitespace can matter there: code, tables, identifiers.
+    """
+    key = normalize_text(text) if normalize else "\0raw\0" + text
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of the SQLite
+    `embedding_cache` table, both keyed by (embedding model, text hash).
+
+    DB errors are logged and treated as misses, so the cache can never
+    break embedding calls.
+    """
+
+    def __init__(self, memory_items: int = 2048, max_bytes: int = 256 * 1024 * 1024) -> None:
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stored_since_evict = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            hits = self.memory_hits + self.db_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+            }
+
+    def _remember(self, key: Tuple[str, str], vec: np.ndarray) -> None:
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(
+        self, model: str, texts: Sequence[str], normalize: bool = True
+    ) -> List[Optional[List[float]]]:
+        """Cached embeddings for `texts` (None where missing), in order."""
+        hashes = [text_hash(t, normalize) for t in texts]
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+
+        with self._lock:
+            for pos, h in enumerate(hashes):
+                vec = self._memory.get((model, h))
+                if vec is not None:
+                    self._memory.move_to_end((model, h))
+                    found[pos] = vec
+                    self.memory_hits += 1
+
+        missing = sorted({h for pos, h in enumerate(hashes) if found[pos] is None})
+        if missing:
+            try:
+                rows = get_cached_embeddings(model, missing)
+            except Exception:
+                logger.exception("Embedding cache lookup failed; treating as miss")
+                rows = {}
+            with self._lock:
+                for pos, h in enumerate(hashes):
+                    if found[pos] is not None:
+                        continue
+                    if h in rows:
+                        blob, _ = rows[h]
+                        vec = np.frombuffer(blob, dtype="<f4")
+                        self._remember((model, h), vec)
+                        found[pos] = vec
+                        self.db_hits += 1
+                    else:
+                        self.misses += 1
+
+        return [vec.tolist() if vec is not None else None for vec in found]
+
+    def put_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        normalize: bool = True,
+    ) -> None:
+        entries: Dict[str, Tuple[bytes, int]] = {}
+        with self._lock:
+            for text, emb in zip(texts, embeddings):
+                vec = np.asarray(emb, dtype="<f4")
+                h = text_hash(text, normalize)
+                self._remember((model, h), vec)
+                entries[h] = (vec.tobytes(), int(vec.shape[0]))
+            self._stored_since_evict += len(entries)
+            run_eviction = self._stored_since_evict >= _EVICT_EVERY
+            if run_eviction:
+                self._stored_since_evict = 0
+
+        try:
+            put_cached_embeddings(model, entries)
+            if run_eviction:
+                evicted = evict_embedding_cache(self.max_bytes)
+                if evicted:
+                    logger.info(f"Evicted {evicted} embedding cache entries")
+        except Exception:
+            logger.exception("Embedding cache write failed")
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide embedding cache, or None when disabled in settings."""
+    global _cache
+    if not settings.embedding_cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    memory_items=settings.embedding_cache_memory_items,
+                    max_bytes=settings.embedding_cache_max_mb * 1024 * 1024,
+                )
+    return _cache
+
+
+def get_embedding_cache_stats() -> Dict[str, float]:
+    """Hit/miss counters for monitoring (all zero when the cache is disabled)."""
+    cache = get_embedding_cache()
+    if cache is None:
+        return {"memory_hits": 0, "db_hits": 0, "misses": 0, "hit_rate": 0.0, "memory_items": 0}
+    return cache.stats()
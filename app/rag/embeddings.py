@@ -1,17 +1,118 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from typing import Dict, Iterator, List, Optional, Sequence
 
-import openai
+import numpy as np
 
 from config.settings import settings
+from app.llm import create_embeddings
 from app.logs.logger import logger
+from app.tokens import estimate_tokens
+from .embedding_cache import get_embedding_cache
+
 
 #This function calls OpenAI’s embedding model to convert text into a numerical vector that captures its semantic meaning. These embeddings are used in our RAG pipeline to perform similarity search over support documents, allowing the system to retrieve relevant information based on meaning rather than keyword matching.
 def get_embedding(text: str) -> List[float]:
     """Get embedding vector from OpenAI for a given text."""
-    openai.api_key = settings.openai_api_key
+    cache = get_embedding_cache()
+    if cache is not None:
+        cached = cache.get_many(settings.embedding_model, [text])[0]
+        if cached is not None:
+            return cached
+
     logger.debug("Requesting embedding from OpenAI")
-    response = openai.Embedding.create(
-        model=settings.embedding_model,
-        input=[text],
+    embedding = create_embeddings([text])[0]
+    if cache is not None:
+        cache.put_many(settings.embedding_model, [text], [embedding])
+    return embedding
+
+
+def _batches(texts: Sequence[str], max_items: int, max_tokens: int) -> Iterator[List[int]]:
+    """Group text positions into batches under the item and token limits."""
+    batch: List[int] = []
+    batch_tokens = 0
+    for pos, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(pos)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def get_embeddings(texts: Sequence[str], normalize: bool = False) -> List[List[float]]:
+    """
+    Embed many texts (document chunks), preserving order.
+
+    Texts are packed into requests of at most `embedding_batch_size` items and
+    `embedding_batch_tokens` estimated tokens; up to `embedding_concurrency`
+    requests run at once, each retried with backoff on rate limits. Cached by
+    exact text unless `normalize`, which shares entries between texts that
+    differ only in case and whitespace, as query lookups do.
+    """
+    if not texts:
+        return []
+
+    cache = get_embedding_cache()
+    if cache is None:
+        return _embed_uncached(texts)
+
+    results = cache.get_many(settings.embedding_model, texts, normalize)
+    # One request per distinct missing text.
+    missing: Dict[str, List[int]] = {}
+    for pos, emb in enumerate(results):
+        if emb is None:
+            missing.setdefault(texts[pos], []).append(pos)
+    if missing:
+        unique = list(missing)
+        fresh = _embed_uncached(unique)
+        cache.put_many(settings.embedding_model, unique, fresh, normalize)
+        for text, emb in zip(unique, fresh):
+            for pos in missing[text]:
+                results[pos] = emb
+        hits = len(texts) - sum(len(positions) for positions in missing.values())
+        logger.info(f"Embedding cache: {hits} hits, {len(unique)} texts embedded")
+
+    return results  # type: ignore[return-value]
+
+
+def _embed_uncached(texts: Sequence[str]) -> List[List[float]]:
+    batches = list(
+        _batches(texts, settings.embedding_batch_size, settings.embedding_batch_tokens)
     )
-    return response["data"][0]["embedding"]
+    logger.info(f"Requesting {len(texts)} embeddings in {len(batches)} batches")
+
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    workers = max(1, min(settings.embedding_concurrency, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            # copy_context keeps the caller's LLM priority (ingest) in the workers
+            pool.submit(
+                copy_context().run,
+                create_embeddings,
+                [texts[pos] for pos in batch],
+                settings.embedding_max_retries,
+            ): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            for pos, emb in zip(futures[future], future.result()):
+                results[pos] = emb
+
+    return results  # type: ignore[return-value]
+
+
+def embedding_to_bytes(embedding: Sequence[float]) -> bytes:
+    """Pack an embedding as raw little-endian float32 bytes for storage."""
+    return np.asarray(embedding, dtype="<f4").tobytes()
+
+
+def embedding_from_bytes(blob: bytes, dim: Optional[int] = None) -> np.ndarray:
+    """Zero-copy float32 view over bytes written by `embedding_to_bytes`."""
+    vec = np.frombuffer(blob, dtype="<f4")
+    if dim is not None and vec.shape[0] != dim:
+        raise ValueError(f"Embedding has {vec.shape[0]} dims, expected {dim}")
+    return vec
@@ -0,0 +1,184 @@
+from typing import List, Optional, Sequence, Tuple
+import json
+
+import numpy as np
+
+from config.settings import settings
+from app.db.models import SupportDocChunk
+from app.logs.logger import logger
+from .ann import IVFIndex
+from .bm25 import BM25Index
+from .embeddings import embedding_from_bytes
+from .quantization import QuantizedMatrix
+
+
+def _chunk_vector(chunk: SupportDocChunk) -> np.ndarray:
+    if chunk.embedding_vector is not None:
+        return embedding_from_bytes(chunk.embedding_vector, chunk.embedding_dim)
+    # Rows written before the binary column existed.
+    return np.asarray(json.loads(chunk.embedding), dtype=np.float32)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.maximum(norms, 1e-8, out=norms)
+    matrix /= norms
+    return matrix
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    return vector / max(float(np.linalg.norm(vector)), 1e-8)
+
+
+def truncate_rows(matrix: np.ndarray, dims: int) -> np.ndarray:
+    """
+    Leading `dims` columns of `matrix`, renormalised to unit length.
+
+    text-embedding-3 vectors are trained Matryoshka-style, so a prefix of
+    each vector is itself a usable (slightly lower quality) embedding.
+    """
+    return _normalize_rows(np.array(matrix[:, :dims], dtype=np.float32))
+
+
+class SupportDocIndex:
+    """
+    Resident embedding index over all support doc chunks.
+
+    Holds a contiguous, L2-normalised float32 matrix (one row per chunk) plus
+    parallel title/content arrays, so a query is one matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        matrix: np.ndarray,
+        titles: Sequence[str],
+        contents: Sequence[str],
+        generation: int = 0,
+        chunk_ids: Optional[Sequence[int]] = None,
+        doc_ids: Optional[Sequence[str]] = None,
+        chunk_indexes: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.titles = list(titles)
+        self.contents = list(contents)
+        self.generation = generation
+        self.chunk_ids = list(chunk_ids) if chunk_ids is not None else []
+        self.doc_ids = list(doc_ids) if doc_ids is not None else list(self.titles)
+        self.chunk_indexes = (
+            list(chunk_indexes) if chunk_indexes is not None else [0] * len(self.titles)
+        )
+        # Set when loaded from an on-disk artifact (see app.rag.artifact).
+        self.source = "db"
+        self.artifact_stamp: Optional[Tuple[int, int]] = None
+        # Optional approximate search engine (see app.rag.ann).
+        self.ann: Optional[IVFIndex] = None
+        # Optional BM25 inverted index over `contents` (see app.rag.bm25).
+        self.lexical: Optional[BM25Index] = None
+        # Optional compact first-pass matrix (see app.rag.quantization); the
+        # shortlist of top_k * rescore_factor rows is rescored on `matrix`.
+        self.quantized: Optional[QuantizedMatrix] = None
+        # Optional truncated, renormalised first-pass matrix (see
+        # truncate_rows); also rescored on `matrix` like `quantized`.
+        self.reduced: Optional[np.ndarray] = None
+        self.rescore_factor = 8
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    @classmethod
+    def from_chunks(
+        cls, chunks: Sequence[SupportDocChunk], generation: int = 0
+    ) -> "SupportDocIndex":
+        if not chunks:
+            return cls(np.zeros((0, 0), dtype=np.float32), [], [], generation)
+
+        models = {ch.embedding_model for ch in chunks if ch.embedding_model}
+        if models - {settings.embedding_model}:
+            logger.warning(
+                f"Support doc chunks were embedded with {sorted(models)}, "
+                f"but queries use {settings.embedding_model}; re-run ingestion."
+            )
+
+        first = _chunk_vector(chunks[0])
+        matrix = np.empty((len(chunks), first.shape[0]), dtype=np.float32)
+        matrix[0] = first
+        for row, ch in enumerate(chunks[1:], start=1):
+            matrix[row] = _chunk_vector(ch)
+
+        return cls(
+            _normalize_rows(matrix),
+            [ch.title or ch.doc_id for ch in chunks],
+            [ch.content for ch in chunks],
+            generation,
+            chunk_ids=[ch.id for ch in chunks],
+            doc_ids=[ch.doc_id for ch in chunks],
+            chunk_indexes=[ch.chunk_index for ch in chunks],
+        )
+
+    def search(
+        self, query_emb: Sequence[float], top_k: int = 5, exact: bool = False
+    ) -> List[Tuple[float, str, str]]:
+        """
+        Return [(similarity, title, content), ...] for the top_k rows.
+
+        Uses the ANN engine when one is attached, unless `exact` is set.
+        """
+        return [
+            (score, self.titles[row], self.contents[row])
+            for row, score in self.search_rows(query_emb, top_k, exact)
+        ]
+
+    def search_rows(
+        self, query_emb: Sequence[float], top_k: int = 5, exact: bool = False
+    ) -> List[Tuple[int, float]]:
+        """
+        Return [(row, similarity), ...] for the top_k rows, best first.
+
+        With `exact`, ignores the ANN and first-pass engines and scores every
+        row. Query vectors longer than an engine's matrix are truncated and
+        renormalised to match it.
+        """
+        n = len(self)
+        if n == 0 or top_k <= 0:
+            return []
+
+        query = np.asarray(query_emb, dtype=np.float32)
+
+        rows: Optional[np.ndarray] = None
+        if self.ann is not None and not exact:
+            rows = self.ann.candidates(_unit(query[: self.ann.centroids.shape[1]]))
+
+        approx = None if exact else self._first_pass_scores(query, rows)
+        if approx is not None:
+            shortlist = top_k * self.rescore_factor
+            if shortlist < approx.shape[0]:
+                keep = np.argpartition(-approx, shortlist - 1)[:shortlist]
+                keep.sort()  # ascending rows read the full-precision matrix in order
+                rows = keep if rows is None else rows[keep]
+
+        query = _unit(query[: self.matrix.shape[1]])
+        if rows is None:
+            rows = np.arange(n)
+            scores = self.matrix @ query
+        else:
+            scores = self.matrix[rows] @ query
+
+        if top_k < scores.shape[0]:
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(scores.shape[0])
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def _first_pass_scores(
+        self, query: np.ndarray, rows: Optional[np.ndarray]
+    ) -> Optional[np.ndarray]:
+        """Approximate scores from the quantized or reduced matrix, if any."""
+        if self.quantized is not None:
+            dims = self.quantized.codes.shape[1]
+            return self.quantized.scores(_unit(query[:dims]), rows)
+        if self.reduced is not None:
+            reduced = self.reduced if rows is None else self.reduced[rows]
+            return reduced @ _unit(query[: reduced.shape[1]])
+        return None
@@ -1,78 +1,275 @@
+import argparse
+import hashlib
 import os
-import json
+import time
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from app.db.dao import init_db, clear_support_docs, add_support_doc_chunk
+from config.settings import settings
+from app.db.dao import (
+    init_db,
+    get_all_support_doc_chunks,
+    get_support_doc_chunks_for_docs,
+    get_support_doc_files,
+    get_support_doc_generation,
+    get_support_doc_ids,
+    publish_staged_support_docs,
+    reset_support_doc_staging,
+    stage_support_doc_chunks,
+)
+from app.db.models import SupportDocFile
+from app.llm import llm_priority
 from app.logs.logger import logger
-from .embeddings import get_embedding
+from .ann import IVFIndex
+from .artifact import artifact_stamp, retract_index_artifact, write_index_artifact
+from .bm25 import BM25Index
+from .embeddings import get_embeddings, embedding_to_bytes
+from .index import SupportDocIndex
 
 KNOWLEDGE_BASE_DIR = Path("knowledge_base")
 
+ProgressCallback = Callable[[Dict[str, float]], None]
 
-def _read_text_files(base_dir: Path) -> List[Path]:
-    files: List[Path] = []
+
+def _iter_text_files(base_dir: Path) -> Iterator[Path]:
     if not base_dir.exists():
-        return files
+        return
     for path in base_dir.rglob("*"):
         if path.suffix.lower() in {".txt", ".md"} and path.is_file():
-            files.append(path)
-    return files
+            yield path
 
 
-def _chunk_text(text: str, max_chars: int = 800) -> list[str]:
-    """Simple character-based chunking by paragraphs / lines."""
-    lines = text.splitlines()
-    chunks = []
-    current = []
+def _read_text_files(base_dir: Path) -> List[Path]:
+    return list(_iter_text_files(base_dir))
+
+
+def _iter_lines(path: Path) -> Iterator[str]:
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            yield line.rstrip("\n")
+
+
+def _iter_chunks(lines: Iterable[str], max_chars: int = 800) -> Iterator[str]:
+    """Streaming character-based chunking by paragraphs / lines."""
+    current: List[str] = []
     current_len = 0
 
     for line in lines:
         if current_len + len(line) + 1 > max_chars and current:
-            chunks.append("\n".join(current))
+            yield "\n".join(current)
             current = []
             current_len = 0
         current.append(line)
         current_len += len(line) + 1
 
     if current:
-        chunks.append("\n".join(current))
-    return chunks
+        yield "\n".join(current)
+
+
+def _chunk_text(text: str, max_chars: int = 800) -> list[str]:
+    """Simple character-based chunking by paragraphs / lines."""
+    return list(_iter_chunks(text.splitlines(), max_chars))
+
+
+def _write_artifact(generation: int) -> None:
+    """Export the freshly built index for memory-mapped loading by retrievers."""
+    try:
+        index = SupportDocIndex.from_chunks(get_all_support_doc_chunks(), generation)
+        if settings.rag_search_engine == "ivf" and len(index):
+            index.ann = IVFIndex.build(
+                index.matrix,
+                n_lists=settings.rag_ivf_lists,
+                nprobe=settings.rag_ivf_nprobe,
+            )
+        index.lexical = BM25Index.build(index.contents)
+        write_index_artifact(index, Path(settings.rag_index_dir), settings.embedding_model)
+    except Exception:
+        logger.exception("Failed to write support doc index artifact")
+        # Never leave CURRENT pointing at an older generation than the DB.
+        retract_index_artifact(Path(settings.rag_index_dir))
+
+
+def _publish(changed_files: Dict[str, Tuple[str, int]], removed: List[str]) -> int:
+    """
+    Publish the staged chunks and export the new index artifact.
+
+    Retrievers on the artifact path do not read the DB generation, so the
+    old artifact is retracted first: until the new one is written (or if
+    writing it fails) they serve the published rows from the DB.
+    """
+    retract_index_artifact(Path(settings.rag_index_dir))
+    generation = publish_staged_support_docs(changed_files, removed)
+    _write_artifact(generation)
+    return generation
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
 
 
-def build_support_doc_index() -> None:
-    """Ingest all .txt/.md files in knowledge_base/ and build embeddings index."""
+def _file_fingerprint(path: Path) -> str:
+    """sha256 of embedding model + file bytes, read in blocks."""
+    h = hashlib.sha256(settings.embedding_model.encode("utf-8") + b"\n")
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _iter_chunk_rows(
+    paths: Iterable[Path],
+    known_files: Dict[str, SupportDocFile],
+    full_rebuild: bool,
+    seen_ids: Set[str],
+    changed_files: Dict[str, Tuple[str, int]],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield staging rows for every chunk of every new or changed file.
+
+    Rows whose text is unchanged already carry their stored embedding; the
+    rest are embedded by the caller. Fills `seen_ids` with every discovered
+    doc_id and `changed_files` with {doc_id: (file_hash, chunk_count)}.
+    """
+    for fpath in paths:
+        doc_id = str(fpath.relative_to(KNOWLEDGE_BASE_DIR))
+        seen_ids.add(doc_id)
+        file_hash = _file_fingerprint(fpath)
+        known = known_files.get(doc_id)
+        if not full_rebuild and known is not None and known.content_hash == file_hash:
+            continue
+
+        logger.info(f"Ingesting {fpath}")
+        reusable: Dict[str, Tuple[bytes, int]] = {}
+        if not full_rebuild:
+            for ch in get_support_doc_chunks_for_docs([doc_id]):
+                if ch.content_hash and ch.embedding_vector is not None and (
+                    ch.embedding_model == settings.embedding_model
+                ):
+                    reusable[ch.content_hash] = (ch.embedding_vector, ch.embedding_dim)
+
+        count = 0
+        for idx, chunk in enumerate(_iter_chunks(_iter_lines(fpath))):
+            chunk_hash = _sha256(chunk.encode("utf-8"))
+            row: Dict[str, Any] = {
+                "doc_id": doc_id,
+                "chunk_index": idx,
+                "title": fpath.stem,
+                "content": chunk,
+                "content_hash": chunk_hash,
+                "embedding_model": settings.embedding_model,
+            }
+            if chunk_hash in reusable:
+                row["embedding_vector"], row["embedding_dim"] = reusable[chunk_hash]
+            count += 1
+            yield row
+        changed_files[doc_id] = (file_hash, count)
+
+
+def _batched(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@llm_priority("ingest")
+def build_support_doc_index(
+    full_rebuild: bool = False, progress: Optional[ProgressCallback] = None
+) -> Dict[str, float]:
+    """
+    Sync all .txt/.md files in knowledge_base/ into the embeddings index.
+
+    Files are streamed through discovery -> line reading -> chunking ->
+    batched embedding -> bulk insert into a staging table, so memory stays
+    bounded by `ingest_batch_size`. Only changed files are re-chunked and
+    only new chunk texts are embedded; chunks of deleted files are dropped.
+    Staged rows are published in a single transaction, so queries keep using
+    the previous index until it commits. `full_rebuild` re-embeds everything.
+    `progress` is called with a stats snapshot after each batch.
+    """
     logger.info("Starting support docs ingestion")
+    started = time.perf_counter()
     init_db()
+    stats: Dict[str, float] = {
+        "files_changed": 0,
+        "files_removed": 0,
+        "chunks_embedded": 0,
+        "chunks_reused": 0,
+        "elapsed_s": 0.0,
+        "chunks_per_sec": 0.0,
+    }
+
+    known_files = get_support_doc_files()
+    seen_ids: Set[str] = set()
+    changed_files: Dict[str, Tuple[str, int]] = {}
+    reset_support_doc_staging()
+
+    rows = _iter_chunk_rows(
+        _iter_text_files(KNOWLEDGE_BASE_DIR), known_files, full_rebuild, seen_ids, changed_files
+    )
+    for batch in _batched(rows, settings.ingest_batch_size):
+        to_embed = [row for row in batch if "embedding_vector" not in row]
+        embeddings = get_embeddings([row["content"] for row in to_embed])
+        for row, emb in zip(to_embed, embeddings):
+            row["embedding_vector"] = embedding_to_bytes(emb)
+            row["embedding_dim"] = len(emb)
+        stage_support_doc_chunks(batch)
 
-    files = _read_text_files(KNOWLEDGE_BASE_DIR)
-    if not files:
+        stats["chunks_embedded"] += len(to_embed)
+        stats["chunks_reused"] += len(batch) - len(to_embed)
+        stats["elapsed_s"] = time.perf_counter() - started
+        if progress is not None:
+            progress(dict(stats))
+
+    if not seen_ids:
         logger.warning("No support docs found in knowledge_base/")
-        return
+        return stats
 
-    logger.info(f"Found {len(files)} support files. Clearing old index...")
-    clear_support_docs()
+    removed = sorted((set(known_files) | set(get_support_doc_ids())) - seen_ids)
+    stats["files_changed"] = len(changed_files)
+    stats["files_removed"] = len(removed)
 
-    for fpath in files:
-        logger.info(f"Ingesting {fpath}")
-        text = fpath.read_text(encoding="utf-8", errors="ignore")
-        chunks = _chunk_text(text)
-        doc_id = str(fpath.relative_to(KNOWLEDGE_BASE_DIR))
+    if not changed_files and not removed:
+        logger.info("Support docs index is up to date.")
+        if artifact_stamp(Path(settings.rag_index_dir)) is None:
+            _write_artifact(get_support_doc_generation())
+        return stats
+
+    generation = _publish(changed_files, removed)
+
+    elapsed = time.perf_counter() - started
+    chunks = stats["chunks_embedded"] + stats["chunks_reused"]
+    stats["elapsed_s"] = elapsed
+    stats["chunks_per_sec"] = chunks / elapsed if elapsed > 0 else 0.0
+    logger.info(
+        f"Support docs ingestion completed (index generation {generation}): "
+        f"{stats['files_changed']} files changed, {stats['files_removed']} removed, "
+        f"{stats['chunks_embedded']} chunks embedded, {stats['chunks_reused']} reused, "
+        f"{stats['chunks_per_sec']:.1f} chunks/sec."
+    )
+    return stats
 
-        for idx, chunk in enumerate(chunks):
-            emb = get_embedding(chunk)
-            emb_json = json.dumps(emb)
-            title = fpath.stem
-            add_support_doc_chunk(
-                doc_id=doc_id,
-                chunk_index=idx,
-                title=title,
-                content=chunk,
-                embedding_json=emb_json,
-            )
 
-    logger.info("Support docs ingestion completed.")
+def _print_progress(stats: Dict[str, float]) -> None:
+    done = int(stats["chunks_embedded"] + stats["chunks_reused"])
+    print(f"  {done} chunks processed ({stats['elapsed_s']:.1f}s)", flush=True)
 
 
 if __name__ == "__main__":
-    build_support_doc_index()
+    parser = argparse.ArgumentParser(description="Build/refresh the support doc index")
+    parser.add_argument(
+        "--full", action="store_true", help="re-embed every chunk instead of only changes"
+    )
+    result = build_support_doc_index(full_rebuild=parser.parse_args().full, progress=_print_progress)
+    print(
+        f"Files changed: {result['files_changed']}, removed: {result['files_removed']}; "
+        f"chunks embedded: {result['chunks_embedded']}, reused: {result['chunks_reused']}"
+    )
+    print(
+        f"Throughput: {result['chunks_per_sec']:.1f} chunks/sec "
+        f"({result['elapsed_s']:.2f}s total)"
+    )
@@ -1,39 +1,254 @@
-from typing import List, Tuple
-import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import threading
 
-import numpy as np
-
-from app.db.dao import get_all_support_doc_chunks
+from config.settings import settings
+from app.db.dao import get_all_support_doc_chunks, get_support_doc_generation
 from app.logs.logger import logger
+from .ann import IVFIndex
+from .artifact import artifact_stamp, load_index_artifact
+from .bm25 import BM25Index, reciprocal_rank_fusion
 from .embeddings import get_embedding
+from .index import SupportDocIndex, truncate_rows
+from .quantization import QuantizedMatrix
 
 
-def _cosine_sim(a: np.ndarray, b: np.ndarray) -> float:
-    denom = (np.linalg.norm(a) * np.linalg.norm(b)) + 1e-8
-    return float(np.dot(a, b) / denom)
+@dataclass
+class RetrievedChunk:
+    score: float
+    title: str
+    content: str
+    doc_id: str
+    chunk_index: int
 
 
-def retrieve_relevant_chunks(
-    query: str, top_k: int = 5
-) -> List[Tuple[float, str, str]]:
+_index: Optional[SupportDocIndex] = None
+_index_lock = threading.Lock()
+
+# How queries were answered, for monitoring.
+_retrieval_counts: Dict[str, int] = {"vector": 0, "hybrid": 0, "lexical_only": 0}
+
+
+def _is_current(
+    index: Optional[SupportDocIndex], stamp: Optional[Tuple[int, int]]
+) -> bool:
+    if index is None or index.artifact_stamp != stamp:
+        return False
+    if index.source == "artifact":
+        # Ingest retracts CURRENT before bumping the generation and only
+        # points it at an artifact of the new generation.
+        return True
+    return index.generation == get_support_doc_generation()
+
+
+def _load_index(stamp: Optional[Tuple[int, int]]) -> SupportDocIndex:
+    generation = get_support_doc_generation()
+    index_dir = Path(settings.rag_index_dir)
+
+    index: Optional[SupportDocIndex] = None
+    if stamp is not None:
+        try:
+            index = load_index_artifact(
+                index_dir,
+                settings.embedding_model,
+                min_generation=generation,
+                verify=settings.rag_artifact_verify,
+            )
+        except Exception:
+            logger.exception(f"Could not open index artifact in {index_dir}")
+
+    if index is None:
+        index = SupportDocIndex.from_chunks(get_all_support_doc_chunks(), generation)
+        index.artifact_stamp = stamp
+
+    _configure_search_engine(index)
+    logger.info(
+        f"Loaded support doc index from {index.source}: {len(index)} chunks, "
+        f"generation={index.generation}"
+    )
+    return index
+
+
+def _configure_search_engine(index: SupportDocIndex) -> None:
+    """Attach or drop the truncated, ANN, quantized and BM25 engines per settings."""
+    index.reduced = None
+    index.rescore_factor = settings.rag_rescore_factor
+    dims = settings.rag_retrieval_dims
+    full_dims = index.matrix.shape[1] if len(index) else 0
+    if 0 < dims < full_dims:
+        reduced = truncate_rows(index.matrix, dims)
+        if settings.rag_full_dim_rerank:
+            index.reduced = reduced
+        else:
+            # Truncated vectors replace the full ones; nothing else stays resident.
+            index.matrix = reduced
+        logger.info(
+            f"Scoring on {dims} of {full_dims} embedding dims "
+            f"(full-dim rerank: {settings.rag_full_dim_rerank})"
+        )
+
+    if settings.rag_search_engine == "ivf" and len(index):
+        if index.ann is None:
+            logger.info("No persisted IVF index; building one in memory")
+            index.ann = IVFIndex.build(index.matrix, n_lists=settings.rag_ivf_lists)
+        index.ann.nprobe = settings.rag_ivf_nprobe
+    else:
+        index.ann = None
+
+    if settings.rag_quantization != "none" and len(index):
+        first_pass = index.reduced if index.reduced is not None else index.matrix
+        index.quantized = QuantizedMatrix.build(first_pass, settings.rag_quantization)
+        index.reduced = None  # the quantized copy takes its place
+        logger.info(
+            f"Quantized index ({settings.rag_quantization}): "
+            f"{index.quantized.nbytes / 1e6:.1f} MB first-pass matrix"
+        )
+    else:
+        index.quantized = None
+
+    if settings.rag_retrieval_mode != "vector" and len(index):
+        if index.lexical is None:
+            logger.info("No persisted BM25 index; building one in memory")
+            index.lexical = BM25Index.build(index.contents)
+    else:
+        index.lexical = None
+
+
+def get_support_doc_index() -> SupportDocIndex:
     """
-    Retrieve top_k most similar support doc chunks for the query.
+    Return the process-wide support doc index.
 
-    Returns a list of tuples:
-    [(similarity, title, content), ...]
+    Prefers the memory-mapped artifact written by ingest (no SQLite access on
+    the query path); falls back to loading from the DB when it is missing or
+    stale, in which case the DB generation is checked on each call.
+    """
+    global _index
+
+    stamp = artifact_stamp(Path(settings.rag_index_dir))
+    index = _index
+    if _is_current(index, stamp):
+        return index
+
+    with _index_lock:
+        if not _is_current(_index, stamp):
+            _index = _load_index(stamp)
+        return _index
+
+
+def get_retrieval_stats() -> Dict[str, int]:
+    """Counts of queries answered by vector, hybrid and BM25-only retrieval."""
+    return dict(_retrieval_counts)
+
+
+def _is_decisive(lexical: List[Tuple[int, float]]) -> bool:
+    if not lexical or lexical[0][1] < settings.rag_bm25_min_score:
+        return False
+    if len(lexical) == 1:
+        return True
+    return lexical[0][1] >= settings.rag_bm25_decisive_ratio * lexical[1][1]
+
+
+def _pool_size(top_k: int) -> int:
+    return max(top_k * 4, 20)
+
+
+def lexical_candidates(
+    index: SupportDocIndex, query: str, top_k: int = 5
+) -> Optional[List[Tuple[int, float]]]:
+    """The BM25 candidate pool for `query`, or None when retrieval is vector-only."""
+    if settings.rag_retrieval_mode == "vector" or index.lexical is None:
+        return None
+    return index.lexical.search_rows(query, top_k=_pool_size(top_k))
+
+
+def skips_embedding(lexical: Optional[List[Tuple[int, float]]]) -> bool:
+    """True when lexical_first retrieval answers from `lexical` alone, with no query embedding."""
+    return (
+        settings.rag_retrieval_mode == "lexical_first"
+        and lexical is not None
+        and _is_decisive(lexical)
+    )
+
+
+def retrieve_rows(
+    index: SupportDocIndex,
+    query: str,
+    top_k: int = 5,
+    query_emb: Optional[List[float]] = None,
+    lexical: Optional[List[Tuple[int, float]]] = None,
+) -> List[Tuple[int, float]]:
+    """
+    Return [(row, score), ...] for the query according to `rag_retrieval_mode`.
+
+    - vector: cosine similarity only.
+    - hybrid: BM25 and vector rankings fused with reciprocal rank fusion.
+    - lexical_first: like hybrid, but when the top BM25 hit is decisive the
+      BM25 ranking is returned directly and no query embedding is requested.
+
+    `query_emb` and `lexical` (from `lexical_candidates`) are reused when the
+    caller already has them.
+    """
+    if lexical is None:
+        lexical = lexical_candidates(index, query, top_k)
+    if query_emb is None and not skips_embedding(lexical):
+        query_emb = get_embedding(query)
+    if lexical is None:
+        _retrieval_counts["vector"] += 1
+        return index.search_rows(query_emb, top_k=top_k)
+
+    if skips_embedding(lexical):
+        _retrieval_counts["lexical_only"] += 1
+        logger.info("Decisive BM25 match; skipping query embedding")
+        return lexical[:top_k]
+
+    _retrieval_counts["hybrid"] += 1
+    vector = index.search_rows(query_emb, top_k=_pool_size(top_k))
+    fused = reciprocal_rank_fusion(
+        [[row for row, _ in vector], [row for row, _ in lexical]], k=settings.rag_rrf_k
+    )
+    return fused[:top_k]
+
+
+def retrieve_chunk_hits(
+    query: str,
+    top_k: int = 5,
+    index: Optional[SupportDocIndex] = None,
+    query_emb: Optional[List[float]] = None,
+    lexical: Optional[List[Tuple[int, float]]] = None,
+) -> List[RetrievedChunk]:
+    """
+    Like `retrieve_relevant_chunks`, but with doc_id/chunk_index for each hit.
+    `index`, `query_emb` and `lexical` are reused when already at hand.
     """
     logger.info("Retrieving relevant chunks for query via RAG")
-    query_emb = np.array(get_embedding(query), dtype=float)
+    if index is None:
+        index = get_support_doc_index()
+    if len(index) == 0:
+        return []
 
-    chunks = get_all_support_doc_chunks()
-    scored = []
+    return [
+        RetrievedChunk(
+            score=score,
+            title=index.titles[row],
+            content=index.contents[row],
+            doc_id=index.doc_ids[row],
+            chunk_index=index.chunk_indexes[row],
+        )
+        for row, score in retrieve_rows(index, query, top_k, query_emb, lexical)
+    ]
 
-    for ch in chunks:
-        emb_list = json.loads(ch.embedding)
-        emb_vec = np.array(emb_list, dtype=float)
-        score = _cosine_sim(query_emb, emb_vec)
-        title = ch.title or ch.doc_id
-        scored.append((score, title, ch.content))
 
-    scored.sort(key=lambda x: x[0], reverse=True)
-    return scored[:top_k]
+def retrieve_relevant_chunks(
+    query: str, top_k: int = 5
+) -> List[Tuple[float, str, str]]:
+    """
+    Retrieve top_k most relevant support doc chunks for the query.
+
+    Returns a list of tuples:
+    [(score, title, content), ...]
+
+    The score is cosine similarity in vector mode, the BM25 score for
+    BM25-only answers, and the fused RRF score in hybrid mode.
+    """
+    return [(hit.score, hit.title, hit.content) for hit in retrieve_chunk_hits(query, top_k)]
@@ -0,0 +1,244 @@
+import argparse
+import asyncio
+import signal
+import time
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from config.settings import settings
+from app.db.dao import init_db
+from app.llm import close_async_session, get_breaker_stats
+from app.logs.logger import logger
+from app.orchestrator import Orchestrator
+
+
+class ServerState:
+    """
+    Admission control for `Orchestrator.handle_message_async`.
+
+    At most `concurrency` messages run at once and `max_queue` more may wait
+    for a slot; anything beyond that is rejected immediately (429) so callers
+    and load balancers back off instead of piling up latency. Once `draining`
+    is set, new requests get 503 while admitted ones finish.
+    """
+
+    def __init__(
+        self,
+        orchestrator: Orchestrator,
+        concurrency: int,
+        max_queue: int,
+        request_timeout_s: float,
+        drain_timeout_s: float = 30.0,
+    ) -> None:
+        self.orchestrator = orchestrator
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.request_timeout_s = request_timeout_s
+        self.drain_timeout_s = drain_timeout_s
+        self.draining = False
+        self.pending = 0  # admitted: queued or running
+        self.running = 0
+        self.counts: Dict[str, int] = {"ok": 0, "rejected": 0, "timed_out": 0, "failed": 0}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._idle: Optional[asyncio.Event] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "running": self.running,
+            "queued": self.pending - self.running,
+            "concurrency": self.concurrency,
+            "max_queue": self.max_queue,
+            **self.counts,
+        }
+
+    def try_admit(self) -> bool:
+        if self.pending >= self.concurrency + self.max_queue:
+            self.counts["rejected"] += 1
+            return False
+        self.pending += 1
+        if self._idle is not None:
+            self._idle.clear()
+        return True
+
+    def release(self) -> None:
+        self.pending -= 1
+        if self.pending == 0 and self._idle is not None:
+            self._idle.set()
+
+    async def run(
+        self,
+        message: str,
+        session_id: str,
+        customer_name: Optional[str],
+        locale: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        if self._slots is None:  # created lazily, on the server's event loop
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            self.running += 1
+            try:
+                return await self.orchestrator.handle_message_async(
+                    message, session_id, customer_name, locale
+                )
+            finally:
+                self.running -= 1
+
+    async def drain(self, timeout_s: float) -> bool:
+        """Stop admitting and wait for admitted requests; False if the timeout hit."""
+        self.draining = True
+        if self.pending == 0:
+            return True
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout_s)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+STATE = web.AppKey("state", ServerState)
+
+
+async def handle_message(request: web.Request) -> web.Response:
+    """POST /v1/messages {"message", "session_id", "customer_name"?, "locale"?, "deadline_ms"?}"""
+    state = request.app[STATE]
+    if state.draining:
+        return web.json_response({"error": "server is shutting down"}, status=503)
+
+    try:
+        body = await request.json()
+        message = str(body["message"]).strip()
+        session_id = str(body["session_id"])
+        customer_name = body.get("customer_name") or None
+        locale = body.get("locale") or None
+        deadline_s = state.request_timeout_s
+        if body.get("deadline_ms"):
+            deadline_s = min(deadline_s, float(body["deadline_ms"]) / 1000)
+    except Exception:  # noqa: BLE001
+        return web.json_response(
+            {"error": "expected JSON with \"message\" and \"session_id\""}, status=400
+        )
+    if not message:
+        return web.json_response({"error": "empty message"}, status=400)
+
+    if not state.try_admit():
+        return web.json_response(
+            {"error": "server busy"}, status=429, headers={"Retry-After": "1"}
+        )
+
+    start = time.perf_counter()
+    try:
+        # The deadline covers time spent queued for a slot as well as the work.
+        result = await asyncio.wait_for(
+            state.run(message, session_id, customer_name, locale), deadline_s
+        )
+    except asyncio.TimeoutError:
+        state.counts["timed_out"] += 1
+        logger.warning(
+            f"Request for session {session_id} exceeded its {deadline_s:.1f}s deadline"
+        )
+        return web.json_response({"error": "deadline exceeded"}, status=504)
+    except Exception:  # noqa: BLE001
+        state.counts["failed"] += 1
+        logger.exception("Error in server handle_message")
+        return web.json_response({"error": "internal error"}, status=500)
+    finally:
+        state.release()
+
+    state.counts["ok"] += 1
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return web.json_response(result)
+
+
+async def health(request: web.Request) -> web.Response:
+    """GET /healthz: 503 while draining so load balancers stop routing here."""
+    state = request.app[STATE]
+    return web.json_response(
+        {**state.stats(), "breakers": get_breaker_stats()},
+        status=503 if state.draining else 200,
+    )
+
+
+def create_app(
+    orchestrator: Optional[Orchestrator] = None,
+    concurrency: Optional[int] = None,
+    max_queue: Optional[int] = None,
+    request_timeout_s: Optional[float] = None,
+    drain_timeout_s: Optional[float] = None,
+) -> web.Application:
+    state = ServerState(
+        orchestrator or Orchestrator(),
+        concurrency=concurrency or settings.server_concurrency,
+        max_queue=settings.server_max_queue if max_queue is None else max_queue,
+        request_timeout_s=request_timeout_s or settings.server_request_timeout_s,
+        drain_timeout_s=drain_timeout_s or settings.server_drain_timeout_s,
+    )
+
+    async def on_shutdown(app: web.Application) -> None:
+        # `serve` drains while still listening; this covers other runners,
+        # which close the listening sockets before on_shutdown runs.
+        if not await state.drain(state.drain_timeout_s):
+            logger.warning(f"Drain timed out with {state.pending} requests still in flight")
+
+    async def on_cleanup(app: web.Application) -> None:
+        await close_async_session()
+
+    app = web.Application()
+    app[STATE] = state
+    app.router.add_post("/v1/messages", handle_message)
+    app.router.add_get("/healthz", health)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def serve(
+    app: web.Application,
+    host: str,
+    port: int,
+    stop: Optional[asyncio.Event] = None,
+    grace_s: Optional[float] = None,
+) -> None:
+    """
+    Serve `app` until SIGINT/SIGTERM (or `stop` is set), then shut down gracefully.
+
+    Draining starts while the server is still listening, so new requests and
+    /healthz get 503 rather than a refused connection. It keeps listening
+    until admitted requests finish (up to the drain timeout) and at least
+    `grace_s` has passed, then closes.
+    """
+    state = app[STATE]
+    grace_s = settings.server_drain_grace_s if grace_s is None else grace_s
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+    logger.info(f"Serving on http://{host}:{port}")
+
+    try:
+        await stop.wait()
+        logger.info(f"Shutting down: draining {state.pending} in-flight requests")
+        drained, _ = await asyncio.gather(
+            state.drain(state.drain_timeout_s), asyncio.sleep(grace_s)
+        )
+        if not drained:
+            logger.warning(f"Drain timed out with {state.pending} requests still in flight")
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for the support bot")
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    args = parser.parse_args()
+
+    init_db()
+    asyncio.run(serve(create_app(), args.host, args.port))
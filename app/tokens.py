@@ -0,0 +1,17 @@
+"""Fast local token estimation (no tokenizer download, no network)."""
+
+import re
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough BPE token count for English-ish text.
+
+    Takes the larger of a word/punctuation count and chars/4, which tracks
+    OpenAI tokenizers closely enough for budgeting and batching decisions.
+    """
+    if not text:
+        return 0
+    return max(len(_WORD_RE.findall(text)), (len(text) + 3) // 4)
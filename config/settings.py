@@ -15,6 +15,122 @@ class Settings:
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
     embedding_model: str = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 
+    # LLM gateway (app.llm): default and per-route request timeouts
+    # ("route=seconds,..."; routes: classifier, feedback, query, knowledge,
+    # embeddings), retries with jittered backoff limited to a fraction of
+    # traffic, and pooled keep-alive connections
+    llm_timeout_s: float = float(os.getenv("LLM_TIMEOUT_S", "30"))
+    llm_route_timeouts: str = os.getenv("LLM_ROUTE_TIMEOUTS", "classifier=10,feedback=15,query=15")
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    llm_retry_budget_ratio: float = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))
+    llm_pool_size: int = int(os.getenv("LLM_POOL_SIZE", "32"))
+
+    # Per-model circuit breaker: opens when, over the last `window` calls, the
+    # error rate or the share of calls over the latency SLO reaches its limit;
+    # agents then use their fallback replies without calling the API
+    llm_breaker_enabled: bool = os.getenv("LLM_BREAKER_ENABLED", "true").lower() == "true"
+    llm_breaker_window: int = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+    llm_breaker_min_calls: int = int(os.getenv("LLM_BREAKER_MIN_CALLS", "10"))
+    llm_breaker_error_rate: float = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+    llm_breaker_slow_rate: float = float(os.getenv("LLM_BREAKER_SLOW_RATE", "0.5"))
+    llm_breaker_latency_slo_ms: float = float(os.getenv("LLM_BREAKER_LATENCY_SLO_MS", "10000"))
+    llm_breaker_open_seconds: float = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+    # Client-side rate limiting against the account's per-model limits
+    # ("model=rpm:tpm,..."; unlisted models are not limited). Calls queue by
+    # priority (interactive > eval > ingest); with a state file, every process
+    # using it shares the same buckets
+    llm_rate_limits: str = os.getenv("LLM_RATE_LIMITS", "")
+    llm_rate_limit_state_path: str = os.getenv("LLM_RATE_LIMIT_STATE_PATH", "")
+
+    # Response templates for fixed-fact replies (ticket status, thank-yous);
+    # a sampled fraction still goes to the LLM
+    response_templates_enabled: bool = (
+        os.getenv("RESPONSE_TEMPLATES_ENABLED", "true").lower() == "true"
+    )
+    response_templates_path: str = os.getenv(
+        "RESPONSE_TEMPLATES_PATH", "app/agents/response_templates.json"
+    )
+    response_locale: str = os.getenv("RESPONSE_LOCALE", "en")
+    response_template_llm_sample_rate: float = float(
+        os.getenv("RESPONSE_TEMPLATE_LLM_SAMPLE_RATE", "0.0")
+    )
+
+    # Orchestrator: classify and draft feedback replies in one LLM call
+    classify_and_respond: bool = os.getenv("CLASSIFY_AND_RESPOND", "false").lower() == "true"
+
+    # Start knowledge retrieval while the classifier runs
+    speculative_retrieval: bool = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+    speculation_workers: int = int(os.getenv("SPECULATION_WORKERS", "8"))
+
+    # HTTP server (python -m app.server): concurrent messages, queued beyond that
+    # (429 when full), per-request deadline and shutdown drain time
+    server_host: str = os.getenv("SERVER_HOST", "0.0.0.0")
+    server_port: int = int(os.getenv("SERVER_PORT", "8000"))
+    server_concurrency: int = int(os.getenv("SERVER_CONCURRENCY", "32"))
+    server_max_queue: int = int(os.getenv("SERVER_MAX_QUEUE", "64"))
+    server_request_timeout_s: float = float(os.getenv("SERVER_REQUEST_TIMEOUT_S", "30"))
+    server_drain_timeout_s: float = float(os.getenv("SERVER_DRAIN_TIMEOUT_S", "30"))
+    # Keep listening (answering 503) at least this long after SIGTERM, so load
+    # balancer health checks see the drain before the port closes
+    server_drain_grace_s: float = float(os.getenv("SERVER_DRAIN_GRACE_S", "5"))
+
+    # Batch CLI (python -m app.batch): concurrent messages, read-but-unwritten lines
+    batch_workers: int = int(os.getenv("BATCH_WORKERS", "16"))
+    batch_max_in_flight: int = int(os.getenv("BATCH_MAX_IN_FLIGHT", "64"))
+
+    # Local fast-path classifier (skips the LLM when confident)
+    classifier_local_enabled: bool = os.getenv("CLASSIFIER_LOCAL_ENABLED", "true").lower() == "true"
+    classifier_local_threshold: float = float(os.getenv("CLASSIFIER_LOCAL_THRESHOLD", "0.9"))
+    classifier_model_path: str = os.getenv("CLASSIFIER_MODEL_PATH", "models/classifier.npz")
+    # classify_many: messages and estimated prompt tokens per LLM call
+    classifier_batch_size: int = int(os.getenv("CLASSIFIER_BATCH_SIZE", "25"))
+    classifier_batch_tokens: int = int(os.getenv("CLASSIFIER_BATCH_TOKENS", "6000"))
+
+    # Embedding requests
+    embedding_batch_size: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+    embedding_batch_tokens: int = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+    embedding_concurrency: int = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    embedding_max_retries: int = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+    # Ingestion
+    ingest_batch_size: int = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+    # Embedding cache (in-process LRU + SQLite table)
+    embedding_cache_enabled: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    embedding_cache_memory_items: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "2048"))
+    embedding_cache_max_mb: int = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "256"))
+
+    # RAG
+    rag_index_dir: str = os.getenv("RAG_INDEX_DIR", "rag_index")
+    # Hash the whole artifact on every load (slow; `python -m app.rag.artifact` checks offline)
+    rag_artifact_verify: bool = os.getenv("RAG_ARTIFACT_VERIFY", "false").lower() == "true"
+    rag_search_engine: str = os.getenv("RAG_SEARCH_ENGINE", "exact")  # exact | ivf
+    rag_ivf_lists: int = int(os.getenv("RAG_IVF_LISTS", "0"))  # 0 = sqrt(chunk count)
+    rag_ivf_nprobe: int = int(os.getenv("RAG_IVF_NPROBE", "8"))
+    rag_quantization: str = os.getenv("RAG_QUANTIZATION", "none")  # none | float16 | int8
+    # Score on the first N embedding dims (0 = all); optionally rerank the
+    # shortlist at full dimension.
+    rag_retrieval_dims: int = int(os.getenv("RAG_RETRIEVAL_DIMS", "0"))
+    rag_full_dim_rerank: bool = os.getenv("RAG_FULL_DIM_RERANK", "true").lower() == "true"
+    rag_rescore_factor: int = int(os.getenv("RAG_RESCORE_FACTOR", "8"))
+    # vector | hybrid (BM25 + vector, RRF) | lexical_first (BM25 alone when decisive)
+    rag_retrieval_mode: str = os.getenv("RAG_RETRIEVAL_MODE", "vector")
+    rag_rrf_k: int = int(os.getenv("RAG_RRF_K", "60"))
+    rag_bm25_min_score: float = float(os.getenv("RAG_BM25_MIN_SCORE", "2.0"))
+    rag_bm25_decisive_ratio: float = float(os.getenv("RAG_BM25_DECISIVE_RATIO", "2.0"))
+
+    # Semantic answer cache in front of KnowledgeAgent
+    answer_cache_enabled: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    answer_cache_threshold: float = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    answer_cache_ttl_seconds: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+    answer_cache_max_items: int = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", "1000"))
+
+    # Knowledge agent prompt context
+    knowledge_top_k: int = int(os.getenv("KNOWLEDGE_TOP_K", "4"))
+    knowledge_context_token_budget: int = int(os.getenv("KNOWLEDGE_CONTEXT_TOKEN_BUDGET", "1500"))
+    knowledge_dedup_threshold: float = float(os.getenv("KNOWLEDGE_DEDUP_THRESHOLD", "0.85"))
+
     # Logging
     log_level: str = os.getenv("LOG_LEVEL", "INFO")
 
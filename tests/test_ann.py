@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app.rag.ann import IVFIndex
+from app.rag.artifact import load_index_artifact, write_index_artifact
+from app.rag.index import SupportDocIndex
+
+
+@pytest.fixture
+def index() -> SupportDocIndex:
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(200, 16)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    labels = [str(i) for i in range(200)]
+    return SupportDocIndex(matrix, labels, labels, generation=1)
+
+
+def test_every_row_lands_in_exactly_one_list(index: SupportDocIndex) -> None:
+    ivf = IVFIndex.build(index.matrix, n_lists=10)
+    assert ivf.n_lists == 10
+    assert ivf.list_offsets[-1] == 200
+    assert sorted(ivf.list_rows.tolist()) == list(range(200))
+
+
+def test_probing_all_lists_matches_exact(index: SupportDocIndex) -> None:
+    index.ann = IVFIndex.build(index.matrix, n_lists=10, nprobe=10)
+    query = index.matrix[7] + 0.1
+    assert index.search_rows(query, 5) == index.search_rows(query, 5, exact=True)
+
+
+def test_ivf_is_persisted_with_artifact(tmp_path: Path, index: SupportDocIndex) -> None:
+    index.ann = IVFIndex.build(index.matrix, n_lists=10)
+    write_index_artifact(index, tmp_path, model="m")
+
+    loaded = load_index_artifact(tmp_path, model="m")
+    assert loaded is not None and loaded.ann is not None
+    np.testing.assert_array_equal(loaded.ann.list_rows, index.ann.list_rows)
@@ -0,0 +1,131 @@
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, Tuple
+
+import numpy as np
+import pytest
+
+import app.agents.knowledge_agent as knowledge_agent
+import app.rag.answer_cache as answer_cache
+import app.rag.retriever as retriever
+from app.agents.knowledge_agent import KnowledgeAgent
+from app.rag.answer_cache import AnswerCache
+from app.rag.bm25 import BM25Index
+from app.rag.index import SupportDocIndex
+from config.settings import settings
+
+
+@pytest.fixture
+def db_rows(monkeypatch: pytest.MonkeyPatch) -> Dict[Tuple[str, str], dict]:
+    """Dict-backed stand-in for the answer_cache table."""
+    rows: Dict[Tuple[str, str], dict] = {}
+
+    def put(model, question_hash, question, embedding, dim, answer, generation, latency_ms):
+        rows[(model, question_hash)] = dict(
+            question_hash=question_hash,
+            question=question,
+            embedding_vector=embedding,
+            embedding_dim=dim,
+            answer=answer,
+            generation=generation,
+            latency_ms=latency_ms,
+            created_at=datetime.utcnow(),
+        )
+
+    def get(model, generation, created_after, limit):
+        return [
+            SimpleNamespace(**row)
+            for (m, _), row in rows.items()
+            if m == model and row["generation"] == generation
+        ][-limit:]
+
+    def purge(generation, created_before):
+        stale = [k for k, row in rows.items() if row["generation"] < generation]
+        for key in stale:
+            del rows[key]
+        return len(stale)
+
+    def delete(model, hashes):
+        for h in hashes:
+            rows.pop((model, h), None)
+
+    monkeypatch.setattr(answer_cache, "put_answer_cache_entry", put)
+    monkeypatch.setattr(answer_cache, "get_answer_cache_entries", get)
+    monkeypatch.setattr(answer_cache, "purge_answer_cache", purge)
+    monkeypatch.setattr(answer_cache, "delete_answer_cache_entries", delete)
+    return rows
+
+
+def test_similar_question_reuses_answer(db_rows) -> None:
+    cache = AnswerCache("m", threshold=0.95)
+    cache.store("How do I reset my PIN?", [1.0, 0.0, 0.1], "Use the app.", 1, latency_ms=900)
+
+    hit = cache.lookup("how can I reset my pin", [1.0, 0.02, 0.1], 1)
+    assert hit is not None and hit.answer == "Use the app."
+    assert cache.lookup("What are your fees?", [0.0, 1.0, 0.0], 1) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["saved_ms"]) == (1, 1, 900)
+
+
+def test_persisted_and_invalidated_by_generation(db_rows) -> None:
+    AnswerCache("m").store("q", [1.0, 0.0], "a", 1, latency_ms=10)
+
+    restarted = AnswerCache("m")
+    assert restarted.lookup("q", [1.0, 0.0], 1).answer == "a"
+    assert restarted.lookup("q", [1.0, 0.0], 2) is None  # re-ingested
+    assert db_rows == {}
+
+
+def test_stale_generation_never_rolls_the_cache_back(db_rows) -> None:
+    cache = AnswerCache("m")
+    cache.store("new", [1.0, 0.0], "from gen 2", 2, latency_ms=10)
+
+    # An answer started before the re-ingest, or a process on the old index.
+    cache.store("old", [0.0, 1.0], "from gen 1", 1, latency_ms=10)
+    assert cache.lookup("new", [1.0, 0.0], 1) is None
+    lagging = AnswerCache("m")
+    assert lagging.lookup("new", [1.0, 0.0], 1) is None
+
+    assert [row["answer"] for row in db_rows.values()] == ["from gen 2"]
+    assert cache.lookup("new", [1.0, 0.0], 2).answer == "from gen 2"
+
+
+def test_lru_eviction_and_ttl(db_rows) -> None:
+    cache = AnswerCache("m", max_items=2)
+    cache.store("a", [1.0, 0.0, 0.0], "A", 1, latency_ms=1)
+    cache.store("b", [0.0, 1.0, 0.0], "B", 1, latency_ms=1)
+    cache.lookup("a", [1.0, 0.0, 0.0], 1)  # a is now most recent
+    cache.store("c", [0.0, 0.0, 1.0], "C", 1, latency_ms=1)
+    assert cache.lookup("b", [0.0, 1.0, 0.0], 1) is None
+    assert len(db_rows) == 2
+
+    expired = AnswerCache("m", ttl_seconds=0)
+    expired.store("a", [1.0, 0.0, 0.0], "A", 1, latency_ms=1)
+    assert expired.lookup("a", [1.0, 0.0, 0.0], 1) is None
+
+
+def test_lexical_first_skips_embedding_and_reuses_it_otherwise(db_rows, monkeypatch) -> None:
+    contents = ["Block a lost debit card in the app.", "Reset your online banking password."]
+    index = SupportDocIndex(np.eye(2, dtype=np.float32), ["cards", "passwords"], contents)
+    index.lexical = BM25Index.build(contents)
+    embedded = []
+
+    def get_embedding(text):
+        embedded.append(text)
+        return [0.0, 1.0]
+
+    monkeypatch.setattr(settings, "rag_retrieval_mode", "lexical_first")
+    monkeypatch.setattr(settings, "rag_bm25_min_score", 0.1)
+    monkeypatch.setattr(knowledge_agent, "get_support_doc_index", lambda: index)
+    monkeypatch.setattr(knowledge_agent, "get_embedding", get_embedding)
+    monkeypatch.setattr(retriever, "get_embedding", get_embedding)
+    monkeypatch.setattr(knowledge_agent, "get_answer_cache", lambda: AnswerCache("m"))
+
+    prepared = KnowledgeAgent().prepare("lost debit card")
+    assert embedded == [] and prepared.lookup.query_emb is None
+    assert "Block a lost debit card" in prepared.messages[1]["content"]
+
+    prepared = KnowledgeAgent().prepare("what is the weather")
+    assert embedded == ["what is the weather"]  # once, shared by cache lookup and retrieval
+    assert prepared.lookup.query_emb == [0.0, 1.0]
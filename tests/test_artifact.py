@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import app.rag.ingest as ingest
+import app.rag.retriever as retriever
+from app.db.models import SupportDocChunk
+from app.rag.artifact import (
+    CURRENT_FILE,
+    EMBEDDINGS_FILE,
+    artifact_stamp,
+    load_index_artifact,
+    verify_index_artifact,
+    write_index_artifact,
+)
+from app.rag.index import SupportDocIndex
+from config.settings import settings
+
+
+@pytest.fixture
+def index() -> SupportDocIndex:
+    matrix = np.eye(3, dtype=np.float32)
+    return SupportDocIndex(
+        matrix,
+        ["a", "b", "c"],
+        ["content a", "content b", "content c"],
+        generation=3,
+        chunk_ids=[10, 11, 12],
+        doc_ids=["a.md", "b.md", "c.md"],
+        chunk_indexes=[0, 0, 0],
+    )
+
+
+def test_round_trip_is_memory_mapped(tmp_path: Path, index: SupportDocIndex) -> None:
+    write_index_artifact(index, tmp_path, model="m")
+    loaded = load_index_artifact(tmp_path, model="m", min_generation=3)
+
+    assert loaded is not None
+    assert loaded.source == "artifact"
+    assert loaded.artifact_stamp == artifact_stamp(tmp_path)
+    assert isinstance(loaded.matrix.base, np.memmap)
+    assert loaded.chunk_ids == [10, 11, 12]
+    assert loaded.search([0.0, 1.0, 0.0], top_k=1)[0][1] == "b"
+
+
+def test_stale_or_missing_artifact_is_ignored(
+    tmp_path: Path, index: SupportDocIndex
+) -> None:
+    assert load_index_artifact(tmp_path, model="m") is None
+
+    write_index_artifact(index, tmp_path, model="m")
+    assert load_index_artifact(tmp_path, model="other") is None
+    assert load_index_artifact(tmp_path, model="m", min_generation=4) is None
+
+    version = (tmp_path / CURRENT_FILE).read_text().strip()
+    np.save(tmp_path / version / EMBEDDINGS_FILE, np.zeros((2, 3), dtype=np.float32))
+    assert load_index_artifact(tmp_path, model="m") is None
+
+
+def test_checksums_are_only_verified_on_request(
+    tmp_path: Path, index: SupportDocIndex
+) -> None:
+    write_index_artifact(index, tmp_path, model="m")
+    assert verify_index_artifact(tmp_path) == []
+
+    # Same size and shape: the cheap load checks cannot tell, the checksums can.
+    version = (tmp_path / CURRENT_FILE).read_text().strip()
+    np.save(tmp_path / version / EMBEDDINGS_FILE, np.zeros((3, 3), dtype=np.float32))
+    assert load_index_artifact(tmp_path, model="m") is not None
+    assert load_index_artifact(tmp_path, model="m", verify=True) is None
+    assert verify_index_artifact(tmp_path) == [f"bad checksum for {EMBEDDINGS_FILE}"]
+
+
+def test_failed_artifact_write_falls_back_to_new_rows(
+    tmp_path: Path, index: SupportDocIndex, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "rag_index_dir", str(tmp_path))
+    monkeypatch.setattr(retriever, "_index", None)
+    write_index_artifact(index, tmp_path, model=settings.embedding_model)
+    generation = {"value": 3}
+    monkeypatch.setattr(retriever, "get_support_doc_generation", lambda: generation["value"])
+    assert retriever.get_support_doc_index().source == "artifact"
+
+    # Re-ingest: the new rows are published, but the artifact write fails.
+    vector = np.array([1.0, 0.0, 0.0], dtype=np.float32).tobytes()
+    new_chunk = SupportDocChunk(
+        id=20, doc_id="d.md", chunk_index=0, title="d", content="content d",
+        embedding_vector=vector, embedding_dim=3,
+    )
+    monkeypatch.setattr(retriever, "get_all_support_doc_chunks", lambda: [new_chunk])
+    monkeypatch.setattr(ingest, "get_all_support_doc_chunks", lambda: [new_chunk])
+
+    def publish(changed_files, removed):
+        generation["value"] += 1
+        return generation["value"]
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(ingest, "publish_staged_support_docs", publish)
+    monkeypatch.setattr(ingest, "write_index_artifact", fail)
+    assert ingest._publish({"d.md": ("hash", 1)}, ["a.md"]) == 4
+
+    current = retriever.get_support_doc_index()
+    assert (current.source, current.generation, current.titles) == ("db", 4, ["d"])
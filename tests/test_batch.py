@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import pytest
+
+from app.batch import run_batch
+from app.llm.scheduler import current_priority
+
+
+class _FakeOrchestrator:
+    """Later lines finish sooner, so completions arrive out of order."""
+
+    def __init__(self) -> None:
+        self.seen = []
+        self.priorities = set()
+
+    async def handle_message_async(self, message, session_id, customer_name=None, locale=None):
+        self.seen.append(message)
+        self.priorities.add(current_priority())
+        await asyncio.sleep(0.001 * (20 - int(message.split()[-1])))
+        route = "knowledge_handler" if int(message.split()[-1]) % 2 else "query_handler"
+        return {"response": f"re: {message}", "routed_agent": route, "success": True}
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / "in.jsonl"
+    lines = [json.dumps({"id": f"m{i}", "message": f"message {i}"}) for i in range(20)]
+    lines[5] = "not json"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_batch_keeps_input_order(tmp_path, input_file) -> None:
+    output = tmp_path / "out.jsonl"
+    orchestrator = _FakeOrchestrator()
+    report = asyncio.run(
+        run_batch(input_file, output, workers=8, max_in_flight=8, orchestrator=orchestrator)
+    )
+
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r["line"] for r in records] == list(range(20))
+    assert records[0]["id"] == "m0" and records[0]["response"] == "re: message 0"
+    assert records[5]["success"] is False
+    assert report["processed"] == 20 and report["errors"] == 1
+    assert report["routes"]["knowledge_handler"]["count"] == 9
+    assert orchestrator.priorities == {"batch"}
+
+
+def test_batch_resumes_after_partial_output(tmp_path, input_file) -> None:
+    output = tmp_path / "out.jsonl"
+    asyncio.run(run_batch(input_file, output, workers=4, orchestrator=_FakeOrchestrator()))
+    kept = output.read_text().splitlines()[:12]
+    output.write_text("\n".join(kept) + "\n" + kept[12 - 1][:10])  # torn last write
+
+    orch = _FakeOrchestrator()
+    report = asyncio.run(run_batch(input_file, output, workers=4, resume=True, orchestrator=orch))
+
+    assert report["resumed_at"] == 12
+    assert sorted(orch.seen) == sorted(f"message {i}" for i in range(12, 20))
+    assert [json.loads(line)["line"] for line in output.read_text().splitlines()] == list(range(20))
@@ -0,0 +1,31 @@
+from app.rag.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCS = [
+    "To block your debit card, open the app and tap Block Card.",
+    "Monthly account statements can be downloaded as PDF documents.",
+    "If you did not receive the OTP, check your registered mobile number.",
+    "Reset your online banking password from the login page.",
+]
+
+
+def test_tokenize_drops_stopwords_and_case() -> None:
+    assert tokenize("How do I block my Debit card?") == ["block", "debit", "card"]
+
+
+def test_exact_terms_rank_first() -> None:
+    index = BM25Index.build(DOCS)
+    assert index.search_rows("OTP not received")[0][0] == 2
+    assert index.search_rows("download statement pdf")[0][0] == 1
+    assert index.search_rows("mortgage") == []
+
+
+def test_save_and_load(tmp_path) -> None:
+    index = BM25Index.build(DOCS)
+    index.save(tmp_path / "bm25.npz")
+    loaded = BM25Index.load(tmp_path / "bm25.npz")
+    assert loaded.search_rows("debit card") == index.search_rows("debit card")
+
+
+def test_reciprocal_rank_fusion_rewards_agreement() -> None:
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]])
+    assert [row for row, _ in fused][:2] == [1, 3]
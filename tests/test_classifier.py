@@ -1,3 +1,6 @@
+import json
+
+import openai
 import pytest
 
 from app.agents.classifier_agent import ClassifierAgent
@@ -25,3 +28,55 @@ def test_query(agent: ClassifierAgent) -> None:
     result = agent.classify(msg)
     assert result["category"] == "query"
     assert result["ticket_number"] == "123456"
+
+
+def _completion(content: str, finish_reason: str = "stop"):
+    return openai.openai_object.OpenAIObject.construct_from(
+        {"choices": [{"message": {"content": content}, "finish_reason": finish_reason}]}
+    )
+
+
+def test_classify_many_validates_each_item(agent, monkeypatch) -> None:
+    agent.local = None
+    reply = json.dumps(
+        [
+            {"id": 0, "category": "query", "sentiment": "neutral", "ticket_number": "650932"},
+            {"id": 1, "category": "shouting", "sentiment": "negative", "ticket_number": None},
+            {"id": 2, "category": "query", "sentiment": "neutral", "ticket_number": "12ab"},
+        ]
+    )
+    calls = []
+    monkeypatch.setattr(
+        openai.ChatCompletion, "create", lambda **kw: calls.append(kw) or _completion(reply)
+    )
+
+    results = agent.classify_many(
+        ["Status of ticket 650932?", "This is a terrible problem", "Is 12ab valid?", "Thanks!"]
+    )
+    assert len(calls) == 1
+    assert [r["source"] for r in results] == ["llm", "fallback", "llm", "fallback"]
+    assert results[0]["ticket_number"] == "650932"
+    assert results[1]["category"] == "negative_feedback"  # keyword fallback
+    assert results[2]["ticket_number"] is None
+    assert results[3]["category"] == "positive_feedback"
+
+
+def test_classify_many_splits_batches_that_overflow(agent, monkeypatch) -> None:
+    agent.local = None
+    sizes = []
+
+    def create(messages, **kwargs):
+        batch = json.loads(messages[1]["content"].split("\n\n")[1])
+        sizes.append(len(batch))
+        if len(batch) > 2:
+            raise openai.error.InvalidRequestError("maximum context length exceeded", None)
+        return _completion(
+            json.dumps(
+                [{"id": m["id"], "category": "query", "sentiment": "neutral"} for m in batch]
+            )
+        )
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+    results = agent.classify_many([f"question {i}" for i in range(5)])
+    assert sizes == [5, 2, 3, 1, 2]
+    assert all(r["source"] == "llm" for r in results)
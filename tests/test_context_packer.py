@@ -0,0 +1,34 @@
+from app.rag.context_packer import pack_context
+from app.rag.retriever import RetrievedChunk
+from app.tokens import estimate_tokens
+
+
+def _hit(score: float, doc_id: str, chunk_index: int, content: str) -> RetrievedChunk:
+    return RetrievedChunk(score, doc_id.split(".")[0], content, doc_id, chunk_index)
+
+
+def test_adjacent_chunks_are_merged_and_duplicates_dropped() -> None:
+    block_a = "Open the app and tap Cards then Block card to freeze it immediately."
+    hits = [
+        _hit(0.9, "cards.md", 1, block_a),
+        _hit(0.8, "cards.md", 2, "Call the helpline if the app is unavailable."),
+        _hit(0.7, "faq.md", 0, block_a + " "),
+        _hit(0.6, "fees.md", 3, "Replacement cards cost nothing."),
+    ]
+    packed = pack_context(hits, token_budget=1000)
+
+    assert len(packed.blocks) == 2
+    assert packed.blocks[0].startswith("[cards] (score=0.900)")
+    assert "helpline" in packed.blocks[0]
+    assert "fees" in packed.blocks[1]
+    assert packed.tokens_saved > 0
+
+
+def test_context_fits_token_budget() -> None:
+    long_text = "\n".join(f"Step {i}: follow the on-screen instructions carefully." for i in range(200))
+    hits = [_hit(0.9, "a.md", 0, long_text), _hit(0.5, "b.md", 0, long_text.upper())]
+    packed = pack_context(hits, token_budget=300)
+
+    assert estimate_tokens(packed.text) <= 300
+    assert packed.blocks[0].startswith("[a]")
+    assert packed.tokens_saved > 0
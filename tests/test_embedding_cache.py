@@ -0,0 +1,49 @@
+from typing import Dict, Tuple
+
+import pytest
+
+import app.rag.embedding_cache as embedding_cache
+from app.rag.embedding_cache import EmbeddingCache, text_hash
+
+
+@pytest.fixture
+def db_tier(monkeypatch: pytest.MonkeyPatch) -> Dict[Tuple[str, str], Tuple[bytes, int]]:
+    """Dict-backed stand-in for the SQLite tier."""
+    rows: Dict[Tuple[str, str], Tuple[bytes, int]] = {}
+
+    def get_cached(model, hashes):
+        return {h: rows[(model, h)] for h in hashes if (model, h) in rows}
+
+    def put_cached(model, entries):
+        for h, value in entries.items():
+            rows[(model, h)] = value
+
+    monkeypatch.setattr(embedding_cache, "get_cached_embeddings", get_cached)
+    monkeypatch.setattr(embedding_cache, "put_cached_embeddings", put_cached)
+    monkeypatch.setattr(embedding_cache, "evict_embedding_cache", lambda max_bytes: 0)
+    return rows
+
+
+def test_normalised_text_shares_a_key() -> None:
+    assert text_hash("How do I  reset my password?") == text_hash(" how do i reset my PASSWORD? ")
+
+
+def test_document_text_is_keyed_verbatim() -> None:
+    assert text_hash("Use `GET /Accounts`", normalize=False) != text_hash(
+        "use `get /accounts`", normalize=False
+    )
+    # Verbatim keys never collide with an (already normalized) query key.
+    assert text_hash("reset password", normalize=False) != text_hash("reset password")
+
+
+def test_memory_then_db_tier(db_tier) -> None:
+    cache = EmbeddingCache(memory_items=1)
+    cache.put_many("m", ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+
+    assert cache.get_many("m", ["b"]) == [[3.0, 4.0]]  # memory (most recent)
+    assert cache.get_many("m", ["a"]) == [[1.0, 2.0]]  # evicted from LRU, found in DB
+    assert cache.get_many("other-model", ["a"]) == [None]
+
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["db_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["memory_items"] == 1
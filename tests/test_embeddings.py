@@ -0,0 +1,79 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, List
+
+import openai
+import pytest
+
+from config.settings import settings
+from app.rag.embeddings import get_embeddings
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    """Minimal /embeddings endpoint: rate-limits the first call, then embeds len(text)."""
+
+    requests: List[List[str]] = []
+    rate_limited_once = False
+
+    def do_POST(self) -> None:  # noqa: N802
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        cls = type(self)
+        if not cls.rate_limited_once:
+            cls.rate_limited_once = True
+            self._reply(429, {"error": {"message": "slow down", "type": "rate_limit"}},
+                        {"Retry-After": "0"})
+            return
+        cls.requests.append(body["input"])
+        data = [
+            {"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0]}
+            for i, text in enumerate(body["input"])
+        ]
+        self._reply(200, {"object": "list", "data": data, "model": body["model"]})
+
+    def _reply(self, code: int, payload: dict, headers: dict = None) -> None:
+        raw = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_server(monkeypatch: pytest.MonkeyPatch) -> Iterator[type]:
+    FakeEmbeddingsHandler.requests = []
+    FakeEmbeddingsHandler.rate_limited_once = False
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddingsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(openai, "api_base", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(settings, "embedding_cache_enabled", False)
+    yield FakeEmbeddingsHandler
+    server.shutdown()
+    server.server_close()
+
+
+def test_batches_preserve_order_and_retry_rate_limits(
+    fake_server: type, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "embedding_batch_size", 3)
+    monkeypatch.setattr(settings, "embedding_concurrency", 2)
+    texts = ["x" * n for n in range(1, 11)]
+
+    embeddings = get_embeddings(texts)
+
+    assert [emb[0] for emb in embeddings] == [float(n) for n in range(1, 11)]
+    assert sorted(len(batch) for batch in fake_server.requests) == [1, 3, 3, 3]
+
+
+def test_token_limit_splits_batches(fake_server: type, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "embedding_batch_tokens", 10)
+    get_embeddings(["word " * 6, "word " * 6, "short"])
+    assert sorted(len(batch) for batch in fake_server.requests) == [1, 2]
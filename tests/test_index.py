@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from app.rag.embeddings import embedding_from_bytes, embedding_to_bytes
+from app.rag.index import SupportDocIndex, truncate_rows
+
+
+@pytest.fixture
+def index() -> SupportDocIndex:
+    matrix = np.array(
+        [
+            [1.0, 0.0, 0.0],
+            [0.0, 2.0, 0.0],
+            [3.0, 3.0, 0.0],
+            [0.0, 0.0, 5.0],
+        ]
+    )
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    titles = ["a", "b", "c", "d"]
+    contents = ["content a", "content b", "content c", "content d"]
+    return SupportDocIndex(matrix, titles, contents, generation=1)
+
+
+def test_search_orders_by_cosine_similarity(index: SupportDocIndex) -> None:
+    results = index.search([1.0, 0.1, 0.0], top_k=2)
+    assert [title for _, title, _ in results] == ["a", "c"]
+    assert results[0][0] >= results[1][0]
+
+
+def test_search_top_k_larger_than_index(index: SupportDocIndex) -> None:
+    results = index.search([0.0, 0.0, 1.0], top_k=10)
+    assert len(results) == 4
+    assert results[0][1] == "d"
+    assert results[0][0] == pytest.approx(1.0, abs=1e-6)
+
+
+def test_empty_index_returns_nothing() -> None:
+    empty = SupportDocIndex(np.zeros((0, 0)), [], [])
+    assert empty.search([1.0, 0.0], top_k=3) == []
+
+
+def test_embedding_bytes_round_trip() -> None:
+    vec = [0.25, -1.5, 3.0]
+    blob = embedding_to_bytes(vec)
+    assert len(blob) == 12
+    assert embedding_from_bytes(blob, dim=3).tolist() == vec
+    with pytest.raises(ValueError):
+        embedding_from_bytes(blob, dim=4)
+
+
+def test_truncated_first_pass_with_full_dim_rerank(index: SupportDocIndex) -> None:
+    index.reduced = truncate_rows(index.matrix, 2)
+    index.rescore_factor = 1
+    # Shortlisted on two dims (where a scores 1.0), then rescored on all three.
+    results = index.search_rows([1.0, 0.0, 0.2], top_k=2)
+    assert [row for row, _ in results] == [0, 2]
+    assert results[0][1] == pytest.approx(1 / np.sqrt(1.04), abs=1e-6)
+
+
+def test_truncated_matrix_truncates_queries() -> None:
+    matrix = truncate_rows(np.array([[3.0, 4.0, 9.0], [0.0, 1.0, 9.0]]), 2)
+    assert np.allclose(np.linalg.norm(matrix, axis=1), 1.0)
+    truncated = SupportDocIndex(matrix, ["a", "b"], ["a", "b"])
+    assert truncated.search_rows([0.0, 1.0, -5.0], top_k=1) == [(1, pytest.approx(1.0))]
@@ -0,0 +1,141 @@
+import time
+
+import openai
+import pytest
+import requests
+
+import app.llm.breaker as breaker_module
+import app.llm.gateway as gateway
+from app.agents import FeedbackAgent
+from app.llm import (
+    CircuitOpenError,
+    chat_completion,
+    chat_completion_stream,
+    get_breaker_stats,
+    get_llm_stats,
+)
+from app.llm.breaker import CircuitBreaker
+
+
+def _reply(content):
+    return openai.openai_object.OpenAIObject.construct_from(
+        {
+            "choices": [{"message": {"content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 12, "completion_tokens": 3},
+        }
+    )
+
+
+@pytest.fixture(autouse=True)
+def fresh_gateway(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "_stats", {})
+    monkeypatch.setattr(gateway, "_budget", gateway._RetryBudget(ratio=0.1, max_tokens=1.0))
+    monkeypatch.setattr(gateway, "_retry_delay", lambda err, attempt: 0.0)
+    monkeypatch.setattr(gateway, "_timeouts", {"classifier": 5.0})
+    monkeypatch.setattr(breaker_module, "_breakers", {})
+
+
+def test_retries_transient_errors_and_records_metrics(monkeypatch) -> None:
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise openai.error.RateLimitError("slow down")
+        return _reply(" ok ")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+
+    assert chat_completion("classifier", "m", [], temperature=0.0) == "ok"
+    assert len(calls) == 2 and calls[0]["request_timeout"] == 5.0
+    stats = get_llm_stats()["classifier"]
+    assert (stats["calls"], stats["errors"], stats["retries"]) == (1, 0, 1)
+    assert (stats["prompt_tokens"], stats["completion_tokens"]) == (12, 3)
+
+
+def test_retry_budget_limits_retries(monkeypatch) -> None:
+    def create(**kwargs):
+        raise openai.error.ServiceUnavailableError("down")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+
+    for _ in range(3):
+        with pytest.raises(openai.error.ServiceUnavailableError):
+            chat_completion("knowledge", "m", [], temperature=0.0)
+    # The budget held one retry; later calls fail without retrying.
+    stats = get_llm_stats()["knowledge"]
+    assert (stats["calls"], stats["errors"], stats["retries"]) == (3, 3, 1)
+
+
+def test_breaker_opens_on_errors_and_fails_fast(monkeypatch) -> None:
+    monkeypatch.setattr(breaker_module.settings, "llm_breaker_min_calls", 3)
+    monkeypatch.setattr(breaker_module.settings, "llm_max_retries", 0)
+    monkeypatch.setattr(breaker_module.settings, "response_templates_enabled", False)
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        raise openai.error.APIError("server error")
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+
+    for _ in range(3):
+        with pytest.raises(openai.error.APIError):
+            chat_completion("feedback", "m", [], temperature=0.0)
+    with pytest.raises(CircuitOpenError):
+        chat_completion("feedback", "m", [], temperature=0.0)
+    # Agents fall back without touching the network.
+    agent = FeedbackAgent()
+    agent.model = "m"
+    reply = agent.handle_positive("Great service", "Ana")
+    assert "Ana" in reply and len(calls) == 3
+    assert get_breaker_stats()["m"]["state"] == "open"
+    assert get_llm_stats()["feedback"]["rejected"] == 2
+
+
+def test_half_open_probe_closes_or_reopens(monkeypatch) -> None:
+    clock = [100.0]
+    monkeypatch.setattr(breaker_module.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker("m", min_calls=2, latency_slo_ms=1000, open_seconds=30)
+
+    breaker.record(failed=False, latency_ms=5000)
+    breaker.record(failed=False, latency_ms=5000)  # every call over the SLO
+    assert breaker.state == "open"
+
+    clock[0] += 31
+    breaker.acquire()  # the probe
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()  # only one probe at a time
+    breaker.record(failed=True, latency_ms=10)
+    assert breaker.state == "open"
+
+    clock[0] += 31
+    breaker.acquire()
+    breaker.record(failed=False, latency_ms=10)
+    assert breaker.state == "closed"
+
+
+def test_streams_are_recorded_when_they_end(monkeypatch) -> None:
+    def chunks(fail):
+        for text in ["Hello", " there"]:
+            time.sleep(0.05)
+            yield openai.openai_object.OpenAIObject.construct_from(
+                {"choices": [{"delta": {"content": text}}]}
+            )
+        if fail:
+            raise requests.exceptions.ChunkedEncodingError("connection dropped")
+
+    streams = iter([False, True])
+    monkeypatch.setattr(
+        openai.ChatCompletion, "create", lambda **kwargs: chunks(fail=next(streams))
+    )
+
+    assert "".join(chat_completion_stream("knowledge", "m", [], 0.0)) == "Hello there"
+    stats = get_llm_stats()["knowledge"]
+    assert stats["p50_ms"] >= 100 and stats["ttft_p50_ms"] < 100  # whole stream vs first token
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        list(chat_completion_stream("knowledge", "m", [], 0.0))
+    # The stream opened fine but broke partway: a failure for stats and breaker.
+    assert get_llm_stats()["knowledge"]["errors"] == 1
+    assert get_breaker_stats()["m"]["error_rate"] == 0.5
@@ -0,0 +1,45 @@
+import pytest
+
+from app.agents.local_classifier import LocalClassifier, bypass_report
+
+
+@pytest.fixture
+def rules_only() -> LocalClassifier:
+    return LocalClassifier()
+
+
+@pytest.mark.parametrize(
+    "message, category, ticket",
+    [
+        ("Can you check ticket 123456 status?", "query", "123456"),
+        ("#654321", "query", "654321"),
+        ("Thank you so much!", "positive_feedback", None),
+        ("This is unacceptable, worst service ever.", "negative_feedback", None),
+    ],
+)
+def test_rules_are_confident(rules_only, message, category, ticket) -> None:
+    result = rules_only.classify(message)
+    assert (result["category"], result["ticket_number"]) == (category, ticket)
+    assert result["source"] == "rules" and result["confidence"] >= 0.9
+
+
+def test_mixed_messages_are_left_to_the_llm(rules_only) -> None:
+    for message in ["Thanks, but my card still doesn't work", "ticket 123456 is still not fixed"]:
+        assert rules_only.classify(message)["confidence"] < 0.9
+
+
+def test_trained_model_learns_from_history() -> None:
+    examples = [
+        ("my replacement card never arrived", "negative_feedback"),
+        ("the transfer failed again and nobody replied", "negative_feedback"),
+        ("how do I order a replacement card", "query"),
+        ("what is the limit for a transfer", "query"),
+        ("lovely staff at the branch today", "positive_feedback"),
+        ("the branch staff were lovely and helpful", "positive_feedback"),
+    ] * 10
+    clf = LocalClassifier.train(examples, n_features=1 << 12)
+    assert clf.classify("my card never arrived")["category"] == "negative_feedback"
+    assert clf.classify("how do I order a card")["category"] == "query"
+
+    report = bypass_report(clf, examples, threshold=0.5)
+    assert report["bypass_rate"] > 0.5 and report["bypass_accuracy"] == 1.0
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import time
+
+import openai
+import pytest
+
+import app.agents.feedback_agent as feedback_agent
+import app.llm.scheduler as scheduler
+import app.orchestrator as orchestrator_module
+from app.agents.knowledge_agent import PreparedQuery, _CacheLookup
+from app.llm import create_embeddings, llm_priority
+from app.llm.scheduler import RateLimiter, _MemoryState, current_priority
+from app.orchestrator import Orchestrator, get_speculation_stats
+
+
+@pytest.fixture
+def orchestrator(monkeypatch: pytest.MonkeyPatch) -> Orchestrator:
+    monkeypatch.setattr(orchestrator_module, "log_event", lambda **kwargs: None)
+    monkeypatch.setattr(feedback_agent, "create_ticket", lambda **kwargs: None)
+    monkeypatch.setattr(orchestrator_module.settings, "classify_and_respond", True)
+    monkeypatch.setattr(orchestrator_module.settings, "speculative_retrieval", False)
+    orch = Orchestrator()
+    orch.classifier.local = None
+    return orch
+
+
+def _reply(payload):
+    content = payload if isinstance(payload, str) else json.dumps(payload)
+    return openai.openai_object.OpenAIObject.construct_from(
+        {"choices": [{"message": {"content": content}, "finish_reason": "stop"}]}
+    )
+
+
+def test_negative_feedback_in_one_call(orchestrator, monkeypatch) -> None:
+    calls = []
+    payload = {
+        "category": "negative_feedback",
+        "sentiment": "negative",
+        "ticket_number": None,
+        "reply": "Sorry about the delay. We opened ticket #[TICKET_NUMBER] for you.",
+    }
+    monkeypatch.setattr(
+        openai.ChatCompletion, "create", lambda **kw: calls.append(kw) or _reply(payload)
+    )
+
+    result = orchestrator.handle_message("My replacement card still hasn't arrived.", "s1")
+    assert len(calls) == 1
+    assert result["routed_agent"] == "feedback_handler_negative"
+    assert result["response"] == (
+        f"Sorry about the delay. We opened ticket #{result['ticket_number']} for you."
+    )
+
+
+def test_query_drafts_are_ignored(orchestrator, monkeypatch) -> None:
+    payload = {"category": "query", "sentiment": "neutral", "ticket_number": None, "reply": "x"}
+    monkeypatch.setattr(openai.ChatCompletion, "create", lambda **kw: _reply(payload))
+    result = orchestrator.classifier.classify_and_respond("What are your opening hours?")
+    assert result["category"] == "query" and result["draft_reply"] is None
+
+
+def test_async_conversations_overlap(orchestrator, monkeypatch) -> None:
+    monkeypatch.setattr(orchestrator_module.settings, "classify_and_respond", False)
+
+    async def acreate(messages, **kwargs):
+        await asyncio.sleep(0.05)
+        if "classifier" in messages[0]["content"]:
+            return _reply({"category": "positive_feedback", "sentiment": "positive"})
+        return _reply("Thank you!")
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", acreate)
+
+    async def run_all():
+        return await asyncio.gather(
+            *(orchestrator.handle_message_async("Lovely new app", f"s{i}") for i in range(100))
+        )
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    assert time.perf_counter() - start < 2.0  # 100 x 2 sequential calls would take 10 s
+    assert all(r["routed_agent"] == "feedback_handler_positive" for r in results)
+    assert set(results[0]) == {
+        "response", "category", "sentiment", "ticket_number", "routed_agent", "success",
+        "error_message",
+    }
+
+
+def test_speculative_retrieval_used_or_wasted(orchestrator, monkeypatch) -> None:
+    monkeypatch.setattr(orchestrator_module.settings, "classify_and_respond", False)
+    monkeypatch.setattr(orchestrator_module.settings, "speculative_retrieval", True)
+    prepared = PreparedQuery(start=0.0, lookup=_CacheLookup(answer="From the docs."), messages=None)
+    prepare_calls = []
+    monkeypatch.setattr(
+        orchestrator.knowledge_agent,
+        "prepare",
+        lambda message: prepare_calls.append(message) or prepared,
+    )
+    categories = iter(["query", "positive_feedback"])
+    monkeypatch.setattr(
+        openai.ChatCompletion,
+        "create",
+        lambda messages, **kw: _reply(
+            {"category": next(categories), "sentiment": "neutral"}
+            if "classifier" in messages[0]["content"]
+            else "Thanks!"
+        ),
+    )
+    before = get_speculation_stats()
+
+    result = orchestrator.handle_message("How do I order a new card?", "s1")
+    assert result["response"] == "From the docs."
+    orchestrator.handle_message("Nice app", "s1")
+
+    after = get_speculation_stats()
+    # "Nice app" may be cancelled before it starts running.
+    assert prepare_calls[0] == "How do I order a new card?"
+    llm_path = {"source": "llm"}
+    assert orchestrator._should_speculate("How do I order a new card?", llm_path)
+    assert not orchestrator._should_speculate("Status of ticket 123456?", llm_path)
+    # Locally classified messages are never speculated on.
+    assert not orchestrator._should_speculate("How do I order a new card?", {"source": "local"})
+    assert after["used"] - before["used"] == 1
+    assert after["wasted"] - before["wasted"] == 1
+
+
+def test_speculation_keeps_the_callers_priority(orchestrator, monkeypatch) -> None:
+    monkeypatch.setattr(orchestrator_module.settings, "classify_and_respond", False)
+    monkeypatch.setattr(orchestrator_module.settings, "speculative_retrieval", True)
+    seen = []
+
+    class RecordingLimiter(RateLimiter):
+        def acquire(self, tokens: int) -> float:
+            seen.append(current_priority())
+            return 0.0
+
+    model = orchestrator_module.settings.embedding_model
+    limiter = RecordingLimiter(model, rpm=1000, tpm=0, store=_MemoryState())
+    monkeypatch.setattr(scheduler, "_limiters", {model: limiter})
+    monkeypatch.setattr(
+        openai.Embedding, "create", lambda **kw: {"data": [{"index": 0, "embedding": [1.0]}]}
+    )
+    prepared = PreparedQuery(start=0.0, lookup=_CacheLookup(answer="From the docs."), messages=None)
+    monkeypatch.setattr(
+        orchestrator.knowledge_agent,
+        "prepare",
+        lambda message: create_embeddings([message]) and prepared,
+    )
+    monkeypatch.setattr(
+        openai.ChatCompletion,
+        "create",
+        lambda **kw: _reply({"category": "query", "sentiment": "neutral"}),
+    )
+
+    with llm_priority("eval"):
+        result = orchestrator.handle_message("How do I order a new card?", "s1")
+    assert result["response"] == "From the docs."
+    assert seen == ["eval"]
+
+
+def test_local_classifier_errors_get_the_fallback_reply(orchestrator, monkeypatch) -> None:
+    logged = []
+    monkeypatch.setattr(orchestrator_module, "log_event", lambda **kw: logged.append(kw))
+
+    def broken(message):
+        raise RuntimeError("model file unreadable")
+
+    monkeypatch.setattr(orchestrator.classifier, "pre_classify", broken)
+
+    results = [
+        orchestrator.handle_message("Hi", "s1"),
+        asyncio.run(orchestrator.handle_message_async("Hi", "s1")),
+    ]
+    stream = orchestrator.handle_message_stream("Hi", "s1")
+    list(stream)
+    results.append(stream.result)
+    for result in results:
+        assert result["error_message"] == "model file unreadable"
+        assert result["response"].startswith("We’re experiencing issues")
+    assert [entry["success"] for entry in logged] == [False, False, False]
+
+
+def test_stream_appends_ticket_and_logs(orchestrator, monkeypatch) -> None:
+    monkeypatch.setattr(orchestrator_module.settings, "classify_and_respond", False)
+    logged = []
+    monkeypatch.setattr(orchestrator_module, "log_event", lambda **kw: logged.append(kw))
+
+    def create(messages, stream=False, **kwargs):
+        if not stream:
+            return _reply({"category": "negative_feedback", "sentiment": "negative"})
+        return iter(
+            openai.openai_object.OpenAIObject.construct_from(
+                {"choices": [{"delta": {"content": text}}]}
+            )
+            for text in [" Sorry", " about", " that."]
+        )
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+
+    stream = orchestrator.handle_message_stream("The app keeps crashing.", "s1")
+    deltas = list(stream)
+    ticket = stream.result["ticket_number"]
+    assert deltas[:3] == ["Sorry", " about", " that."]
+    assert ticket in deltas[-1]
+    assert stream.result["response"] == "".join(deltas)
+    assert stream.result["ttft_ms"] is not None
+    assert logged[0]["response"] == stream.result["response"]
+    assert logged[0]["ticket_number"] == ticket
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from app.rag.index import SupportDocIndex
+from app.rag.quantization import QuantizedMatrix
+
+
+@pytest.fixture
+def index() -> SupportDocIndex:
+    rng = np.random.default_rng(2)
+    matrix = rng.normal(size=(500, 32)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    labels = [str(i) for i in range(500)]
+    return SupportDocIndex(matrix, labels, labels)
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_quantized_scores_approximate_exact(index: SupportDocIndex, mode: str) -> None:
+    quantized = QuantizedMatrix.build(index.matrix, mode)
+    query = index.matrix[3]
+    np.testing.assert_allclose(quantized.scores(query), index.matrix @ query, atol=0.03)
+    assert quantized.nbytes < index.matrix.nbytes
+
+
+@pytest.mark.parametrize("mode", ["float16", "int8"])
+def test_rescored_results_match_exact(index: SupportDocIndex, mode: str) -> None:
+    index.quantized = QuantizedMatrix.build(index.matrix, mode)
+    query = index.matrix[42] + 0.05
+    results = index.search_rows(query, top_k=4)
+    assert results == index.search_rows(query, top_k=4, exact=True)
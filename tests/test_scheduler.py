@@ -0,0 +1,83 @@
+import openai
+import pytest
+
+import app.llm.breaker as breaker_module
+import app.llm.gateway as gateway
+import app.llm.scheduler as scheduler
+from app.llm import chat_completion, llm_priority
+from app.llm.scheduler import RateLimiter, _MemoryState, _SQLiteState
+
+
+@pytest.fixture(autouse=True)
+def fresh_gateway(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(gateway, "_stats", {})
+    monkeypatch.setattr(breaker_module, "_breakers", {})
+    monkeypatch.setattr(scheduler, "_limiters", {})
+
+
+def test_lower_priorities_leave_headroom_and_queue() -> None:
+    limiter = RateLimiter("m", rpm=10, tpm=0, store=_MemoryState())
+
+    # Ingest may not take the last 30% of the bucket...
+    granted = 0
+    while limiter._try_acquire(f"ingest-{granted}", "ingest", 0) == 0:
+        granted += 1
+    assert granted == 7
+    # ...which interactive traffic can still use straight away.
+    assert limiter._try_acquire("chat-1", "interactive", 0) == 0
+
+    # While an interactive call waits, eval queues even once capacity is back.
+    for n in range(2, 5):
+        limiter._try_acquire(f"chat-{n}", "interactive", 0)
+    assert limiter.stats()["waiting"] == {"interactive": 1, "eval": 0, "batch": 0, "ingest": 1}
+    limiter.store.update("m", lambda state: state.update(requests=10.0))
+    assert limiter._try_acquire("eval-1", "eval", 0) > 0
+    assert limiter._try_acquire("chat-4", "interactive", 0) == 0
+    assert limiter._try_acquire("eval-1", "eval", 0) == 0
+
+
+def test_gateway_calls_draw_on_buckets_and_settle_usage(monkeypatch) -> None:
+    limiter = RateLimiter("m", rpm=100, tpm=10_000, store=_MemoryState())
+    monkeypatch.setattr(scheduler, "_limiters", {"m": limiter})
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 1:
+            raise openai.error.RateLimitError("slow down", headers={"retry-after": "0"})
+        return openai.openai_object.OpenAIObject.construct_from(
+            {
+                "choices": [{"message": {"content": "ok"}}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10},
+            }
+        )
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", create)
+
+    with llm_priority("eval"):
+        assert chat_completion("query", "m", [{"role": "user", "content": "hi"}], 0.0) == "ok"
+    stats = limiter.stats()
+    assert len(calls) == 2
+    assert stats["requests_available"] == pytest.approx(98, abs=0.1)
+    # Both attempts reserved 261 estimated tokens; the answered one is settled to 10.
+    assert stats["tokens_available"] == pytest.approx(10_000 - 261 - 10, abs=1)
+
+
+def test_shared_state_file_spans_limiters(tmp_path) -> None:
+    path = str(tmp_path / "ratelimit.db")
+    first = RateLimiter("m", rpm=2, tpm=0, store=_SQLiteState(path))
+    second = RateLimiter("m", rpm=2, tpm=0, store=_SQLiteState(path))
+
+    assert first._try_acquire("a", "interactive", 0) == 0
+    assert second._try_acquire("b", "interactive", 0) == 0
+    assert first._try_acquire("c", "interactive", 0) > 0
+
+    second.pause(60)
+    assert first._try_acquire("d", "interactive", 0) > 50
+    assert first.stats()["waiting"]["interactive"] == 2
+
+
+def test_unknown_priority_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        with llm_priority("background"):
+            pass
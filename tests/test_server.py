@@ -0,0 +1,83 @@
+import asyncio
+import socket
+
+import aiohttp
+from aiohttp.test_utils import TestClient, TestServer
+
+from app.server import STATE, create_app, serve
+
+
+class _SlowOrchestrator:
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    async def handle_message_async(self, message, session_id, customer_name=None, locale=None):
+        await asyncio.sleep(self.delay)
+        return {"response": f"re: {message}", "routed_agent": "knowledge_handler", "success": True}
+
+
+def _run(app, scenario):
+    async def go():
+        async with TestClient(TestServer(app)) as client:
+            return await scenario(client)
+
+    return asyncio.run(go())
+
+
+def _post(client, message, **extra):
+    return client.post("/v1/messages", json={"message": message, "session_id": "s1", **extra})
+
+
+def test_rejects_beyond_queue_with_429() -> None:
+    app = create_app(_SlowOrchestrator(0.2), concurrency=2, max_queue=1)
+
+    async def scenario(client):
+        responses = await asyncio.gather(*(_post(client, f"m{i}") for i in range(5)))
+        return sorted(r.status for r in responses)
+
+    statuses = _run(app, scenario)
+    assert statuses == [200, 200, 200, 429, 429]
+    assert app[STATE].counts == {"ok": 3, "rejected": 2, "timed_out": 0, "failed": 0}
+
+
+def test_deadline_returns_504() -> None:
+    app = create_app(_SlowOrchestrator(0.5))
+
+    async def scenario(client):
+        slow = await _post(client, "hello", deadline_ms=50)
+        bad = await client.post("/v1/messages", json={"session_id": "s1"})
+        return slow.status, bad.status
+
+    assert _run(app, scenario) == (504, 400)
+
+
+def test_shutdown_drains_while_still_listening() -> None:
+    app = create_app(_SlowOrchestrator(0.3))
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    url = f"http://127.0.0.1:{port}"
+
+    async def scenario():
+        stop = asyncio.Event()  # what SIGTERM sets
+        server = asyncio.create_task(serve(app, "127.0.0.1", port, stop=stop, grace_s=0.1))
+        await asyncio.sleep(0.1)
+        async with aiohttp.ClientSession() as session:
+            body = {"message": "first", "session_id": "s1"}
+            in_flight = asyncio.create_task(session.post(f"{url}/v1/messages", json=body))
+            await asyncio.sleep(0.05)
+            stop.set()
+            await asyncio.sleep(0.01)
+            # New connections still reach the server and are told it is draining.
+            refused = await session.post(f"{url}/v1/messages", json={**body, "message": "2nd"})
+            health = await session.get(f"{url}/healthz")
+            first = await in_flight
+            await server
+            try:
+                await session.get(f"{url}/healthz")
+                closed = False
+            except aiohttp.ClientConnectionError:
+                closed = True
+            return first.status, refused.status, health.status, closed
+
+    assert asyncio.run(scenario()) == (200, 503, 503, True)
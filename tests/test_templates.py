@@ -0,0 +1,84 @@
+import openai
+import pytest
+
+import app.agents.query_agent as query_agent
+import app.agents.templates as templates
+from app.agents import QueryAgent
+from app.agents.templates import ResponseTemplates
+from app.db.models import SupportTicket
+
+TEMPLATES = {
+    "en": {
+        "query.status.open": [
+            "Ticket #{ticket_number} is {status}.",
+            "Hi {name}, ticket #{ticket_number} is {status}.",
+        ],
+        "feedback.positive": ["Thanks!"],
+    },
+    "es": {
+        "query.status.resolved": ["El ticket #{ticket_number} está {status}."],
+        "feedback.positive": ["¡Gracias!"],
+        "labels": {"status": {"resolved": "resuelto"}},
+    },
+}
+
+
+def test_render_is_name_aware_localized_and_deterministic() -> None:
+    engine = ResponseTemplates(TEMPLATES)
+    fields = {"ticket_number": "123456", "status": "Open"}
+
+    assert engine.render("query.status.open", "m", **fields) == "Ticket #123456 is Open."
+    assert engine.render("query.status.open", "m", name="Ana", **fields) == (
+        "Hi Ana, ticket #123456 is Open."
+    )
+    assert engine.render("feedback.positive", "m", locale="es") == "¡Gracias!"
+    assert engine.render("query.status.open", "m", locale="es", **fields).startswith("Ticket")
+    assert engine.render("query.status.open", "m") is None  # missing fields
+    assert engine.render("query.unknown", "m") is None
+
+
+def test_localized_templates_translate_field_values() -> None:
+    engine = ResponseTemplates(TEMPLATES)
+
+    assert engine.render(
+        "query.status.resolved", "m", locale="es", ticket_number="123456", status="Resolved"
+    ) == "El ticket #123456 está resuelto."
+    # An untranslated value is never rendered into the localized text.
+    assert engine.render(
+        "query.status.resolved", "m", locale="es", ticket_number="123456", status="Escalated"
+    ) is None
+
+
+@pytest.fixture
+def agent(monkeypatch: pytest.MonkeyPatch) -> QueryAgent:
+    monkeypatch.setattr(templates, "_templates", ResponseTemplates(TEMPLATES))
+    ticket = SupportTicket(ticket_number="123456", status="Open", customer_name=None, message="x")
+    monkeypatch.setattr(query_agent, "get_ticket_by_number", lambda number: ticket)
+    return QueryAgent()
+
+
+def test_ticket_status_skips_llm(agent, monkeypatch) -> None:
+    monkeypatch.setattr(openai.ChatCompletion, "create", lambda **kw: pytest.fail("LLM called"))
+    assert agent.handle_query("status of ticket 123456?") == "Ticket #123456 is Open."
+
+
+def test_sampled_requests_still_use_llm(agent, monkeypatch) -> None:
+    monkeypatch.setattr(templates.settings, "response_template_llm_sample_rate", 1.0)
+    monkeypatch.setattr(
+        openai.ChatCompletion,
+        "create",
+        lambda **kw: openai.openai_object.OpenAIObject.construct_from(
+            {"choices": [{"message": {"content": "LLM reply for #123456"}}]}
+        ),
+    )
+    assert agent.handle_query("status of ticket 123456?") == "LLM reply for #123456"
+
+
+def test_locale_is_chosen_per_request(agent, monkeypatch) -> None:
+    ticket = SupportTicket(ticket_number="123456", status="Resolved", customer_name=None, message="x")
+    monkeypatch.setattr(query_agent, "get_ticket_by_number", lambda number: ticket)
+    monkeypatch.setattr(openai.ChatCompletion, "create", lambda **kw: pytest.fail("LLM called"))
+
+    assert agent.handle_query("estado del ticket 123456", locale="es") == (
+        "El ticket #123456 está resuelto."
+    )
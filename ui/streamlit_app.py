@@ -2,9 +2,14 @@ import uuid
 import pandas as pd
 import streamlit as st
 
-from app.orchestrator import Orchestrator
+from app.orchestrator import Orchestrator, get_speculation_stats, get_streaming_stats
 from app.db.dao import init_db, get_all_tickets, get_recent_logs
 from app.logs.logger import logger
+from app.agents.classifier_agent import get_classifier_stats
+from app.agents.templates import get_template_stats
+from app.llm import get_breaker_stats, get_llm_stats, get_rate_limiter_stats
+from app.rag.answer_cache import get_answer_cache_stats
+from app.rag.embedding_cache import get_embedding_cache_stats
 from app.rag.ingest import build_support_doc_index
 
 
@@ -14,12 +19,18 @@ def ensure_session_id() -> str:
     return st.session_state["session_id"]
 
 
+@st.cache_resource
+def get_orchestrator() -> Orchestrator:
+    """One Orchestrator per process instead of one per rerun."""
+    return Orchestrator()
+
+
 def main() -> None:
     st.set_page_config(page_title="Banking Support AI (RAG)", layout="wide")
     st.title("Banking Customer Support AI – Multi-Agent + RAG")
 
     init_db()
-    orchestrator = Orchestrator()
+    orchestrator = get_orchestrator()
 
     tab_chat, tab_trace, tab_tickets, tab_metrics = st.tabs(
         ["Chat", "Agent Trace", "Tickets & History", "RAG & Metrics"]
@@ -38,13 +49,14 @@ def main() -> None:
                 st.warning("Please enter a message.")
             else:
                 logger.info("Submitting message from Streamlit UI")
-                result = orchestrator.handle_message(
+                st.markdown("### Response")
+                stream = orchestrator.handle_message_stream(
                     message=message,
                     session_id=session_id,
                     customer_name=customer_name or None,
                 )
-                st.markdown("### Response")
-                st.write(result["response"])
+                st.write_stream(stream)
+                result = stream.result
 
                 with st.expander("Details"):
                     st.json(result)
@@ -93,20 +105,39 @@ def main() -> None:
     with tab_metrics:
         st.subheader("RAG & Simple Metrics")
 
-        st.markdown("#### Rebuild Support Document Index")
+        st.markdown("#### Refresh Support Document Index")
         st.write(
             "Place `.txt` or `.md` files under the `knowledge_base/` folder, "
-            "then click the button below to rebuild the RAG index."
+            "then click the button below to refresh the RAG index. Only new or "
+            "changed documents are re-embedded; answers keep using the current "
+            "index until the refresh completes."
         )
+        full_rebuild = st.checkbox("Full rebuild (re-embed every document)", value=False)
+
+        if st.button("Refresh RAG Index"):
+            with st.spinner("Refreshing support document index..."):
+                progress_text = st.empty()
+
+                def show_progress(progress: dict) -> None:
+                    done = int(progress["chunks_embedded"] + progress["chunks_reused"])
+                    progress_text.write(
+                        f"{done} chunks processed ({progress['elapsed_s']:.1f}s)"
+                    )
 
-        if st.button("Rebuild RAG Index"):
-            with st.spinner("Building support document index (this may take a while)..."):
                 try:
-                    build_support_doc_index()
-                    st.success("Support document index rebuilt successfully.")
+                    stats = build_support_doc_index(
+                        full_rebuild=full_rebuild, progress=show_progress
+                    )
+                    st.success(
+                        "Support document index refreshed: "
+                        f"{stats['files_changed']} changed, {stats['files_removed']} removed, "
+                        f"{stats['chunks_embedded']} chunks embedded, "
+                        f"{stats['chunks_reused']} reused "
+                        f"({stats['chunks_per_sec']:.1f} chunks/sec)."
+                    )
                 except Exception as e:  # noqa: BLE001
-                    logger.exception("Error rebuilding RAG index")
-                    st.error(f"Error rebuilding RAG index: {e}")
+                    logger.exception("Error refreshing RAG index")
+                    st.error(f"Error refreshing RAG index: {e}")
 
         logs = get_recent_logs(limit=200)
         st.markdown("#### Basic Event Metrics")
@@ -118,6 +149,82 @@ def main() -> None:
         else:
             st.info("No log data available for metrics yet.")
 
+        st.markdown("#### LLM Calls by Route (this process)")
+        llm_stats = get_llm_stats()
+        if llm_stats:
+            st.dataframe(pd.DataFrame.from_dict(llm_stats, orient="index"))
+        else:
+            st.info("No LLM calls yet.")
+
+        st.markdown("#### Circuit Breakers (this process)")
+        breaker_stats = get_breaker_stats()
+        if breaker_stats:
+            st.dataframe(pd.DataFrame.from_dict(breaker_stats, orient="index"))
+        else:
+            st.info("No circuit breakers yet.")
+
+        st.markdown("#### Rate Limits")
+        limiter_stats = get_rate_limiter_stats()
+        if limiter_stats:
+            rows = {
+                model: {
+                    "requests_available": stats["requests_available"],
+                    "tokens_available": stats["tokens_available"],
+                    "paused_s": stats["paused_s"],
+                    **{f"waiting_{p}": n for p, n in stats["waiting"].items()},
+                    **{f"queued_{p}": n for p, n in stats["queued"].items()},
+                }
+                for model, stats in limiter_stats.items()
+            }
+            st.dataframe(pd.DataFrame.from_dict(rows, orient="index"))
+        else:
+            st.info("No rate limits configured (LLM_RATE_LIMITS).")
+
+        st.markdown("#### Classifier (this process)")
+        clf_stats = get_classifier_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Local", clf_stats["local"])
+        col2.metric("LLM", clf_stats["llm"])
+        col3.metric("Fallback", clf_stats["fallback"])
+        col4.metric("LLM bypass rate", f"{clf_stats['bypass_rate']:.1%}")
+
+        st.markdown("#### Response Templates (this process)")
+        template_stats = get_template_stats()
+        col1, col2 = st.columns(2)
+        col1.metric("Rendered locally", template_stats["rendered"])
+        col2.metric("Sampled to LLM", template_stats["sampled_llm"])
+
+        st.markdown("#### Speculative Retrieval (this process)")
+        spec_stats = get_speculation_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Used", spec_stats["used"])
+        col2.metric("Wasted", spec_stats["wasted"])
+        col3.metric("Failed", spec_stats["failed"])
+        col4.metric("Use rate", f"{spec_stats['use_rate']:.1%}")
+
+        st.markdown("#### Streaming (this process)")
+        stream_stats = get_streaming_stats()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Streamed replies", stream_stats["streams"])
+        col2.metric("Time to first token (p50)", f"{stream_stats['ttft_p50_ms']:.0f} ms")
+        col3.metric("Time to first token (p95)", f"{stream_stats['ttft_p95_ms']:.0f} ms")
+
+        st.markdown("#### Embedding Cache (this process)")
+        cache_stats = get_embedding_cache_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Memory hits", cache_stats["memory_hits"])
+        col2.metric("DB hits", cache_stats["db_hits"])
+        col3.metric("Misses", cache_stats["misses"])
+        col4.metric("Hit rate", f"{cache_stats['hit_rate']:.1%}")
+
+        st.markdown("#### Answer Cache (this process)")
+        answer_stats = get_answer_cache_stats()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Hits", answer_stats["hits"])
+        col2.metric("Misses", answer_stats["misses"])
+        col3.metric("Hit rate", f"{answer_stats['hit_rate']:.1%}")
+        col4.metric("Latency saved", f"{answer_stats['saved_ms'] / 1000:.1f} s")
+
 
 if __name__ == "__main__":
     main()